@@ -0,0 +1,295 @@
+"""Content-aware bitrate selection from short sample encodes.
+
+With the bitrate set to ``auto``, a few short samples spread over the file
+are encoded at candidate bitrates from :data:`BITRATE_LADDER` and compared
+with the source through ffmpeg's ``ssim`` and ``psnr`` filters. The lowest
+bitrate whose worst sample still meets the quality target is used for the
+whole file. A binary search over the ladder keeps this to a handful of
+sample encodes, and candidates above the source's own video bitrate are
+never tried.
+
+Results are cached on disk per series (the file name up to its ``S01E02``
+episode tag), resolution and encoder, so the other episodes of a series
+reuse the first one's choice without sampling again.
+"""
+
+import contextlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from ffmpeg_runner import FFmpegError, run_ffmpeg
+
+AUTO = "auto"
+
+# Candidate video bitrates in kbps, lowest first.
+BITRATE_LADDER = tuple(
+    int(kbps) for kbps in os.getenv(
+        "THEATRE_AUTO_LADDER", "600,800,1000,1500,2000,2500,3000,4000"
+    ).split(",")
+)
+
+# Quality target: mean SSIM of the worst sample, and optionally its PSNR in dB
+# (0 disables the PSNR check).
+TARGET_SSIM = float(os.getenv("THEATRE_AUTO_SSIM", "0.98"))
+TARGET_PSNR = float(os.getenv("THEATRE_AUTO_PSNR", "0"))
+
+# Samples taken per file and the length of each, in seconds.
+SAMPLE_COUNT = int(os.getenv("THEATRE_AUTO_SAMPLES", "3"))
+SAMPLE_SECONDS = float(os.getenv("THEATRE_AUTO_SAMPLE_SECONDS", "6"))
+
+# Used when a file cannot be sampled (no duration or no video stream, or a
+# sample encode failed).
+FALLBACK_BITRATE = 2000
+
+# Location of the sample cache. Override with THEATRE_AUTO_CACHE.
+AUTO_BITRATE_CACHE_FILE = Path(
+    os.getenv("THEATRE_AUTO_CACHE", Path.home() / ".theatre_gui_auto_bitrate.json")
+)
+
+# Flag to prevent opening a console window for subprocesses on Windows.
+CREATE_NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+_EPISODE = re.compile(r"(.+?)[\s._-]*(?:[Ss]\d{1,2}[\s._-]*[Ee]\d{1,3}|\b\d{1,2}x\d{2,3}\b)")
+_SSIM = re.compile(r"SSIM .*All:([\d.]+)")
+_PSNR = re.compile(r"PSNR .*average:([\d.]+|inf)")
+
+COMPARE_FILTER = (
+    "[1:v]format=yuv420p,split[d1][d2];"
+    "[0:v]format=yuv420p,split[r1][r2];"
+    "[d1][r1]ssim;[d2][r2]psnr"
+)
+
+
+def series_name(path):
+    """Normalised series name from an episode file name, or ``None``."""
+    match = _EPISODE.match(Path(path).stem)
+    if not match:
+        return None
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", match.group(1).lower()).split()) or None
+
+
+def cache_key(path, info, backend):
+    """Key under which sample results for ``path`` are shared."""
+    height = info.video.height if info and info.video else None
+    owner = series_name(path) or os.path.abspath(path)
+    return f"{owner}|{height}|{backend.name}|ssim={TARGET_SSIM}|psnr={TARGET_PSNR}"
+
+
+class SampleCache:
+    """Thread-safe JSON store of chosen bitrates and their sample scores."""
+
+    def __init__(self, path=AUTO_BITRATE_CACHE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries = None
+        # key -> lock held while that key is being sampled
+        self._sampling = {}
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key, entry):
+        with self._lock:
+            self._load()[key] = entry
+            tmp = self.path.with_suffix(".tmp")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp.write_text(json.dumps(self._entries, indent=2), encoding="utf-8")
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print("Could not save bitrate samples:", e, file=sys.stderr)
+
+    def sampling(self, key):
+        """Lock to hold while sampling ``key``, so episodes sample only once."""
+        with self._lock:
+            return self._sampling.setdefault(key, threading.Lock())
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def default_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SampleCache()
+        return _cache
+
+
+def sample_starts(duration, count=SAMPLE_COUNT, seconds=SAMPLE_SECONDS):
+    """Start times of ``count`` samples spread evenly over ``duration``."""
+    if duration <= seconds * count:
+        return [0.0]
+    return [duration * (i + 1) / (count + 1) - seconds / 2 for i in range(count)]
+
+
+def _compare(input_file, sample, start, seconds, popen):
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-nostats",
+        "-ss",
+        f"{start:.3f}",
+        "-t",
+        f"{seconds:.3f}",
+        "-i",
+        input_file,
+        "-i",
+        sample,
+        "-filter_complex",
+        COMPARE_FILTER,
+        "-f",
+        "null",
+        "-",
+    ]
+    process = popen(
+        cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace"
+    )
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        raise FFmpegError(process.returncode, cmd, stderr=stderr[-4000:])
+    ssim = _SSIM.search(stderr)
+    psnr = _PSNR.search(stderr)
+    if ssim is None:
+        raise FFmpegError(0, cmd, stderr="No SSIM score in ffmpeg output")
+    return float(ssim.group(1)), float(psnr.group(1)) if psnr else None
+
+
+def measure(input_file, backend, kbps, start, seconds, scratch, threads=None, popen=None):
+    """Encode one sample at ``kbps`` and score it against the source.
+
+    Returns ``{"ssim", "psnr", "kbps"}``, where ``kbps`` is the bitrate the
+    sample actually came out at.
+    """
+    popen = popen or _popen
+    sample = os.path.join(scratch, f"sample-{int(start)}-{kbps}.mkv")
+    cmd = [
+        "ffmpeg",
+        "-y",
+        *backend.input_args(),
+        "-ss",
+        f"{start:.3f}",
+        "-t",
+        f"{seconds:.3f}",
+        "-i",
+        input_file,
+        "-map",
+        "0:v:0",
+        "-an",
+        "-sn",
+        "-dn",
+        *backend.video_args(kbps, threads),
+        sample,
+    ]
+    run_ffmpeg(cmd, seconds, popen=popen)
+    ssim, psnr = _compare(input_file, sample, start, seconds, popen)
+    actual = os.path.getsize(sample) * 8 / seconds / 1000
+    os.remove(sample)
+    return {"ssim": ssim, "psnr": psnr, "kbps": round(actual)}
+
+
+def _popen(cmd, **kwargs):
+    kwargs.setdefault("creationflags", CREATE_NO_WINDOW)
+    return subprocess.Popen(cmd, **kwargs)
+
+
+def _meets(scores):
+    worst_ssim = min(s["ssim"] for s in scores)
+    if worst_ssim < TARGET_SSIM:
+        return False
+    if TARGET_PSNR:
+        psnrs = [s["psnr"] for s in scores if s["psnr"] is not None]
+        return bool(psnrs) and min(psnrs) >= TARGET_PSNR
+    return True
+
+
+def candidates(info):
+    """Ladder rungs worth trying: none above the source's video bitrate."""
+    video = info.video
+    source = (video.bit_rate if video and video.bit_rate else info.bit_rate) or 0
+    ladder = [kbps for kbps in BITRATE_LADDER if not source or kbps * 1000 <= source]
+    return ladder or [min(BITRATE_LADDER)]
+
+
+def choose_bitrate(input_file, info, backend, threads=None, popen=None, cache=None, slot=None):
+    """Lowest ladder bitrate meeting the quality target for ``input_file``.
+
+    Returns ``(kbps, entry)`` where ``entry`` holds the sample scores per
+    tried bitrate and whether they came from the cache. If the file cannot
+    be sampled, :data:`FALLBACK_BITRATE` is returned with a ``reason``.
+    ``slot()`` is a context manager held only while samples are encoded, so
+    episodes waiting for another one of their series to be sampled do not
+    take an encoder slot.
+    """
+    if info is None or info.video is None or not info.duration:
+        return FALLBACK_BITRATE, {"bitrate": FALLBACK_BITRATE, "reason": "cannot sample"}
+    cache = cache or default_cache()
+    key = cache_key(input_file, info, backend)
+    with cache.sampling(key):
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["bitrate"], {**entry, "cached": True}
+        try:
+            with slot() if slot else contextlib.nullcontext():
+                best, scores = _search(input_file, info, backend, threads, popen)
+        except FFmpegError as e:
+            print(
+                f"Sampling {input_file} failed; using {FALLBACK_BITRATE} kbps:",
+                e,
+                file=sys.stderr,
+            )
+            return FALLBACK_BITRATE, {"bitrate": FALLBACK_BITRATE, "reason": "sampling failed"}
+        entry = {
+            "bitrate": best,
+            "file": input_file,
+            "samples": scores,
+            "updated": time.time(),
+        }
+        cache.put(key, entry)
+        return best, {**entry, "cached": False}
+
+
+def _search(input_file, info, backend, threads, popen):
+    """Binary search of the ladder; returns ``(kbps, scores per tried kbps)``."""
+    ladder = candidates(info)
+    seconds = min(SAMPLE_SECONDS, info.duration)
+    starts = sample_starts(info.duration, seconds=seconds)
+    scores = {}
+    best = ladder[-1]
+    low, high = 0, len(ladder) - 1
+    scratch = tempfile.mkdtemp(prefix="theatre-samples-")
+    try:
+        while low <= high:
+            middle = (low + high) // 2
+            kbps = ladder[middle]
+            results = [
+                measure(input_file, backend, kbps, start, seconds, scratch, threads, popen)
+                for start in starts
+            ]
+            scores[str(kbps)] = results
+            if _meets(results):
+                best = kbps
+                high = middle - 1
+            else:
+                low = middle + 1
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return best, scores
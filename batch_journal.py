@@ -0,0 +1,160 @@
+"""Durable per-file state of the running batch, for resuming after a crash.
+
+The journal starts with one ``batch`` record holding the operation and its
+options, followed by a record per state change of a file:
+
+* ``pending`` – queued, nothing written yet
+* ``encoding`` – a job has started on it
+* ``done`` – the output is finished in ``converted/`` but not committed
+* ``committed`` / ``skipped`` / ``failed`` – nothing left to do
+
+Records are appended and fsynced one at a time, like the commit journal, so
+after a crash :meth:`BatchJournal.interrupted` can tell which outputs can be
+reused and which jobs have to run again. A new batch writes its journal to a
+temporary file and swaps it in, so a crash while starting one leaves the
+previous journal intact.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+# Location of the batch journal. Override with THEATRE_BATCH_JOURNAL.
+BATCH_JOURNAL_FILE = Path(
+    os.getenv("THEATRE_BATCH_JOURNAL", Path.home() / ".theatre_gui_batch_journal.jsonl")
+)
+
+PENDING = "pending"
+ENCODING = "encoding"
+DONE = "done"
+COMMITTED = "committed"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# States that need nothing more from this batch.
+SETTLED = (COMMITTED, SKIPPED, FAILED)
+
+
+class InterruptedBatch(NamedTuple):
+    operation: str
+    options: dict
+    # input files whose job never finished
+    restart: list
+    # ``done`` records whose output is still waiting in converted/
+    finished: list
+
+
+class BatchJournal:
+    """Append-only JSON-lines journal of one batch, fsynced per record."""
+
+    def __init__(self, path=BATCH_JOURNAL_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.operation = None
+        self.options = {}
+        # input file -> latest record
+        self._files = {}
+        # output file -> input file, for marking commits
+        self._outputs = {}
+
+    def _write(self, records, path=None):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path or self.path, "w" if path else "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self, records):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        self._write(records, tmp)
+        os.replace(tmp, self.path)
+
+    def _apply(self, record):
+        if "batch" in record:
+            self.operation = record["batch"]
+            self.options = record.get("options", {})
+            return
+        self._files[record["file"]] = record
+        if record.get("output_file"):
+            self._outputs[record["output_file"]] = record["file"]
+
+    def start(self, operation, options, files):
+        """Begin a new journal with ``files`` pending.
+
+        Outputs of the previous batch that are still waiting to be committed
+        are carried over, so they are not forgotten if this batch crashes.
+        """
+        with self._lock:
+            carried = [r for r in self._files.values() if r["state"] == DONE]
+            queued = set(files)
+            records = [{"batch": operation, "options": options}]
+            records += [r for r in carried if r["file"] not in queued]
+            records += [{"file": f, "state": PENDING} for f in files]
+            self._rewrite(records)
+            self.operation = None
+            self._files = {}
+            self._outputs = {}
+            for record in records:
+                self._apply(record)
+
+    def mark(self, input_file, state, **details):
+        """Record that ``input_file`` moved to ``state``."""
+        record = {"file": input_file, "state": state, **details}
+        with self._lock:
+            if self.operation is None:
+                return
+            self._write([record])
+            self._apply(record)
+
+    def mark_committed(self, outputs):
+        """Mark the jobs whose ``converted/`` outputs were moved into place."""
+        with self._lock:
+            files = [self._outputs[o] for o in outputs if o in self._outputs]
+        for input_file in files:
+            self.mark(input_file, COMMITTED)
+
+    def unsettled(self):
+        with self._lock:
+            return [r for r in self._files.values() if r["state"] not in SETTLED]
+
+    def load(self):
+        """Read the journal left by a previous run, skipping a torn last line."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        with self._lock:
+            for line in lines:
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+
+    def interrupted(self):
+        """The :class:`InterruptedBatch` left by a crash, or ``None``."""
+        if self.operation is None:
+            return None
+        restart = []
+        finished = []
+        for record in self.unsettled():
+            if record["state"] == DONE and os.path.exists(record.get("output_file") or ""):
+                finished.append(record)
+            elif os.path.exists(record["file"]):
+                restart.append(record["file"])
+        if not restart and not finished:
+            return None
+        return InterruptedBatch(self.operation, dict(self.options), restart, finished)
+
+    def clear(self):
+        with self._lock:
+            self.operation = None
+            self.options = {}
+            self._files = {}
+            self._outputs = {}
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,114 @@
+"""Duration-weighted progress, throughput and ETA of a running batch.
+
+Each file counts in proportion to its probed duration, so a three-hour film
+moves the batch further than a two-minute extra. Files whose duration is not
+known count as the average of the others. A file that fails or turns out to
+need no work keeps what it got through, and the rest of its weight leaves the
+batch instead of counting as done. The realtime factor is the media seconds
+the whole pool got through over the last :data:`ROLLING_SECONDS`, which also
+gives the batch ETA. Every update is O(1), so it can run on every progress
+event.
+"""
+
+import collections
+import os
+import threading
+import time
+
+# Window of the rolling speed average, in seconds.
+ROLLING_SECONDS = float(os.getenv("THEATRE_PROGRESS_WINDOW", "30"))
+
+# Speed samples are taken at most this often.
+SAMPLE_INTERVAL = 1.0
+
+
+class BatchProgress:
+    """Progress model for one batch, fed from its PROGRESS/RESULT/ERROR events."""
+
+    def __init__(self, files, durations, window=ROLLING_SECONDS):
+        known = [d for d in (durations.get(f) for f in files) if d]
+        average = sum(known) / len(known) if known else 1.0
+        self.weights = {f: durations.get(f) or average for f in files}
+        self.total_weight = sum(self.weights.values()) or 1.0
+        self.window = window
+        self.started = time.monotonic()
+        self.finished = 0
+        self.failed = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        # input file -> (fraction, latest progress payload) of running jobs
+        self._running = {}
+        self._processed = 0.0
+        self._samples = collections.deque([(self.started, 0.0)])
+
+    def _advance(self, input_file, fraction):
+        old = self._running.get(input_file, (0.0, None))[0]
+        self._processed += (fraction - old) * self.weights.get(input_file, 0.0)
+
+    def _sample(self, now):
+        if now - self._samples[-1][0] >= SAMPLE_INTERVAL:
+            self._samples.append((now, self._processed))
+            while len(self._samples) > 2 and now - self._samples[1][0] > self.window:
+                self._samples.popleft()
+
+    def update(self, input_file, progress):
+        """Record a progress payload from a running job."""
+        fraction = min(max(progress.get("fraction") or 0.0, 0.0), 1.0)
+        with self._lock:
+            self._advance(input_file, fraction)
+            self._running[input_file] = (fraction, progress)
+            self._sample(time.monotonic())
+
+    def _drop(self, input_file):
+        # Only the part actually processed was work; the rest never happens.
+        fraction = self._running.get(input_file, (0.0, None))[0]
+        self.total_weight -= (1.0 - fraction) * self.weights.get(input_file, 0.0)
+
+    def finish(self, input_file, result=None):
+        """Record a finished job; ``result`` is ``None`` for a failed one."""
+        with self._lock:
+            if result is None or result.get("status") == "skipped":
+                self._drop(input_file)
+            else:
+                self._advance(input_file, 1.0)
+            self._running.pop(input_file, None)
+            if result is None:
+                self.failed += 1
+            else:
+                self.finished += 1
+                before = result.get("before_size")
+                after = result.get("after_size", before)
+                if before is not None and after is not None:
+                    self.bytes_saved += before - after
+            self._sample(time.monotonic())
+
+    def snapshot(self):
+        """Current figures, plus a row for every running job.
+
+        ``realtime_factor`` and ``eta`` are ``None`` until the rolling window
+        has data to go on.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._sample(now)
+            then, processed_then = self._samples[0]
+            processed = self._processed
+            running = sorted(self._running.items())
+            done = self.finished + self.failed
+            saved = self.bytes_saved
+            failed = self.failed
+            total = self.total_weight
+        elapsed = now - then
+        speed = (processed - processed_then) / elapsed if elapsed >= SAMPLE_INTERVAL else None
+        remaining = max(total - processed, 0.0)
+        return {
+            "fraction": min(processed / total, 1.0) if total > 0 else 1.0,
+            "files_done": done,
+            "files_failed": failed,
+            "files_total": len(self.weights),
+            "bytes_saved": saved,
+            "realtime_factor": speed,
+            "eta": remaining / speed if speed else None,
+            "elapsed": now - self.started,
+            "running": [dict(progress, file=path) for path, (_, progress) in running],
+        }
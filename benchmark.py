@@ -0,0 +1,471 @@
+"""Reproducible benchmarks of scanning, probing, remuxing, encoding and commit.
+
+Synthetic test media is generated locally with ffmpeg's lavfi sources
+(testsrc2 video, sine-wave audio in two languages, a full and a forced
+subtitle track and chapters), so every machine benchmarks the same input::
+
+    python benchmark.py                          # default libraries
+    python benchmark.py --library 200x5 --library 4x120 --workers 2
+    python benchmark.py --save-baseline          # store results as the baseline
+
+A library ``COUNTxSECONDS`` holds COUNT files of SECONDS each, alternating MKV
+and MP4 and spread over the folder and a season subfolder. For each library
+the benchmark times the same engine calls the front ends use: cold and
+cached folder scans, cold and cached probes, the stream update remux, the HEVC conversion
+and the commit after each. Throughputs are written to ``--output`` as JSON
+and compared with the baseline file; the exit status is 1 if any metric fell
+further below its baseline than the allowed threshold.
+
+Everything runs in a scratch folder with its own caches, manifest and
+journals, so the real ones are never touched.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_LIBRARIES = ("50x5", "4x60")
+
+# Fraction a metric may drop below its baseline before it counts as a
+# regression. The baseline file can override it per metric ("thresholds").
+DEFAULT_THRESHOLD = 0.15
+
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+
+# Flag to prevent opening a console window for subprocesses on Windows.
+CREATE_NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+
+def _srt(duration, every, text):
+    cues = []
+    for number, start in enumerate(range(0, max(int(duration) - 1, 1), every), 1):
+        end = min(start + 1.5, duration)
+        cues.append(
+            f"{number}\n00:{start // 60:02d}:{start % 60:02d},000 --> "
+            f"00:{int(end) // 60:02d}:{int(end) % 60:02d},{int(end % 1 * 1000):03d}\n"
+            f"{text} {number}\n"
+        )
+    return "\n".join(cues)
+
+
+def _chapters(duration):
+    step = max(duration // 4, 1)
+    lines = [";FFMETADATA1", "title=Theatre benchmark"]
+    for number, start in enumerate(range(0, duration, step), 1):
+        lines += [
+            "[CHAPTER]",
+            "TIMEBASE=1/1000",
+            f"START={start * 1000}",
+            f"END={min(start + step, duration) * 1000}",
+            f"title=Chapter {number}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def generate_source(folder, duration, extension, size):
+    """Create one synthetic H.264 file of ``duration`` seconds, once."""
+    path = folder / f"source-{duration}s{extension}"
+    if path.exists():
+        return path
+    folder.mkdir(parents=True, exist_ok=True)
+    subs = folder / f"full-{duration}.srt"
+    forced = folder / f"forced-{duration}.srt"
+    chapters = folder / f"chapters-{duration}.txt"
+    subs.write_text(_srt(duration, 2, "Dialogue"), encoding="utf-8")
+    forced.write_text(_srt(duration, 10, "Sign"), encoding="utf-8")
+    chapters.write_text(_chapters(duration), encoding="utf-8")
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={size}:rate=24:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=660:sample_rate=48000:duration={duration}",
+        "-i",
+        str(subs),
+        "-i",
+        str(forced),
+        "-i",
+        str(chapters),
+        "-map",
+        "0:v",
+        "-map",
+        "1:a",
+        "-map",
+        "2:a",
+        "-map",
+        "3:s",
+        "-map",
+        "4:s",
+        "-map_metadata",
+        "5",
+        "-map_chapters",
+        "5",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "128k",
+        "-c:s",
+        "mov_text" if extension == ".mp4" else "srt",
+        "-metadata:s:a:0",
+        "language=eng",
+        "-metadata:s:a:1",
+        "language=jpn",
+        "-metadata:s:s:0",
+        "language=eng",
+        "-metadata:s:s:0",
+        "title=Full",
+        "-metadata:s:s:1",
+        "language=eng",
+        "-metadata:s:s:1",
+        "title=Forced",
+        "-disposition:s:1",
+        "forced",
+        str(path),
+    ]
+    subprocess.run(cmd, check=True, creationflags=CREATE_NO_WINDOW)
+    return path
+
+
+def build_library(root, name, count, duration, sources):
+    """Copy ``count`` files into a fresh library folder and return their paths."""
+    folder = root / name
+    if folder.exists():
+        shutil.rmtree(folder)
+    season = folder / "Season 02"
+    season.mkdir(parents=True)
+    files = []
+    for number in range(count):
+        extension = (".mkv", ".mp4")[number % 2]
+        parent = folder if number < (count + 1) // 2 else season
+        path = parent / f"Benchmark S01E{number + 1:03d}{extension}"
+        shutil.copyfile(sources[duration, extension], path)
+        files.append(str(path))
+    return folder, files
+
+
+def _best(repeat, fn):
+    """Smallest wall time of ``repeat`` runs of ``fn``."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _size(files):
+    return sum(os.path.getsize(f) for f in files)
+
+
+def _rate(amount, seconds):
+    return round(amount / seconds, 3) if seconds > 0 else None
+
+
+class _Run:
+    """Engine factory and error counter for one benchmark run."""
+
+    def __init__(self, scratch):
+        self.scratch = scratch
+        self.errors = []
+        self._engines = 0
+
+    def log(self, entry):
+        if entry["status"] == "error":
+            self.errors.append(entry)
+            print("ERROR:", entry["message"] or entry["input"], file=sys.stderr)
+
+    def engine(self):
+        """A new engine with empty caches of its own."""
+        from media_probe import ProbeCache
+        from processed_manifest import ProcessedManifest
+        from theatre_engine import TheatreEngine
+
+        self._engines += 1
+        state = self.scratch / "state" / str(self._engines)
+        return TheatreEngine(
+            probe_cache=ProbeCache(state / "probe.sqlite"),
+            manifest=ProcessedManifest(state / "manifest.sqlite"),
+            log=self.log,
+        )
+
+
+def _drive(engine, runner, on_result, error_message):
+    start = time.perf_counter()
+    if runner is not None:
+        engine.run(runner, on_result, error_message)
+    return time.perf_counter() - start
+
+
+def _commit(engine):
+    start = time.perf_counter()
+    report = engine.commit_converted_files()
+    return len(report.committed), time.perf_counter() - start
+
+
+def bench_library(run, root, name, count, duration, sources, args):
+    """Run every stage on one library and return ``{metric: value}``."""
+    from library_scan import ScanCache, iter_videos
+    from theatre_engine import scan_folder, stream_choices
+
+    metrics = {}
+    folder, files = build_library(root, name, count, duration, sources)
+    media_seconds = count * duration
+    errors_before = len(run.errors)
+
+    seconds = _best(args.repeat, lambda: sorted(iter_videos(folder)))
+    metrics["scan.files_per_sec"] = _rate(count, seconds)
+    # Age the folders as in a settled library; listings of folders modified
+    # in the last few seconds are never cached.
+    old = time.time() - 3600
+    for path, _, _ in os.walk(folder):
+        os.utime(path, (old, old))
+    cache = ScanCache(root / f"{name}-scan.json")
+    scan_folder(folder, cache)
+    seconds = _best(args.repeat, lambda: scan_folder(folder, cache))
+    metrics["scan_cached.files_per_sec"] = _rate(count, seconds)
+
+    engine = run.engine()
+    try:
+        seconds = _drive(engine, engine.probe_runner(files), lambda info: None, "ffprobe failed")
+        metrics["probe_cold.files_per_sec"] = _rate(count, seconds)
+        seconds = _best(
+            args.repeat,
+            lambda: _drive(engine, engine.probe_runner(files), lambda info: None, "ffprobe failed"),
+        )
+        metrics["probe_cached.files_per_sec"] = _rate(count, seconds)
+
+        _, audio, _, subtitle = stream_choices(engine.probe_cache.probe(files[0]))
+        size = _size(files)
+        seconds = _drive(
+            engine,
+            engine.streams_runner(files, audio, subtitle),
+            lambda result: engine.record_streams_update(result, audio, subtitle),
+            "FFmpeg failed during stream update",
+        )
+        metrics["streams.files_per_sec"] = _rate(count, seconds)
+        metrics["streams.mb_per_sec"] = _rate(size / 1e6, seconds)
+        committed, seconds = _commit(engine)
+        metrics["streams_commit.files_per_sec"] = _rate(committed, seconds)
+    finally:
+        engine.close()
+
+    if not args.skip_encode:
+        folder, files = build_library(root, name, count, duration, sources)
+        engine = run.engine()
+        try:
+            size = _size(files)
+            seconds = _drive(
+                engine,
+                engine.convert_runner(
+                    files, bitrate=str(args.bitrate), encoder=args.encoder, workers=args.workers
+                ),
+                engine.record_conversion,
+                "FFmpeg failed during conversion",
+            )
+            metrics["convert.files_per_sec"] = _rate(count, seconds)
+            metrics["convert.speed_factor"] = _rate(media_seconds, seconds)
+            metrics["convert.mb_per_sec"] = _rate(size / 1e6, seconds)
+            committed, seconds = _commit(engine)
+            metrics["convert_commit.files_per_sec"] = _rate(committed, seconds)
+        finally:
+            engine.close()
+
+    if len(run.errors) > errors_before:
+        metrics["errors"] = len(run.errors) - errors_before
+    return {f"{name}.{key}": value for key, value in metrics.items()}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare result metrics with ``baseline``; higher values are better.
+
+    Returns one dict per baseline metric with the ratio and whether it is a
+    regression.
+    """
+    thresholds = baseline.get("thresholds", {})
+    rows = []
+    for name, base in sorted(baseline.get("metrics", {}).items()):
+        if not isinstance(base, (int, float)) or name.endswith(".errors"):
+            continue
+        value = results["metrics"].get(name)
+        limit = thresholds.get(name, threshold)
+        ratio = round(value / base, 3) if value is not None and base else None
+        rows.append(
+            {
+                "metric": name,
+                "baseline": base,
+                "value": value,
+                "ratio": ratio,
+                "threshold": limit,
+                "regression": ratio is not None and ratio < 1 - limit,
+                "missing": value is None,
+            }
+        )
+    return rows
+
+
+def _ffmpeg_version():
+    try:
+        out = subprocess.run(
+            ["ffmpeg", "-version"],
+            capture_output=True,
+            text=True,
+            creationflags=CREATE_NO_WINDOW,
+        ).stdout
+    except OSError:
+        return None
+    return out.splitlines()[0] if out else None
+
+
+def _library(text):
+    try:
+        count, duration = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected COUNTxSECONDS, got {text!r}")
+    if count < 1 or duration < 1:
+        raise argparse.ArgumentTypeError("count and duration must be positive")
+    return count, duration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the theatre engine on synthetic media")
+    parser.add_argument(
+        "--library",
+        type=_library,
+        action="append",
+        help=f"COUNTxSECONDS library to benchmark, repeatable (default {' '.join(DEFAULT_LIBRARIES)})",
+    )
+    parser.add_argument("--size", default="1280x720", help="video frame size")
+    parser.add_argument("--bitrate", type=int, default=1500, help="HEVC bitrate in kbps")
+    parser.add_argument("--encoder", default="auto", help="encoder name or auto")
+    parser.add_argument("--workers", type=int, default=1, help="encodes run at once")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of scan and cached probe")
+    parser.add_argument("--skip-encode", action="store_true", help="skip the HEVC conversion")
+    parser.add_argument("--output", default=RESULTS_FILE, help="results file")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline to compare with")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="write the results as the new baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="allowed drop below the baseline, as a fraction",
+    )
+    parser.add_argument("--keep", metavar="DIR", help="work in DIR and keep it (reuses sources)")
+    args = parser.parse_args(argv)
+    libraries = args.library or [_library(text) for text in DEFAULT_LIBRARIES]
+
+    if not (shutil.which("ffmpeg") and shutil.which("ffprobe")):
+        print("ffmpeg and ffprobe are needed to run the benchmark.", file=sys.stderr)
+        return 2
+
+    scratch = Path(args.keep or tempfile.mkdtemp(prefix="theatre-bench-")).resolve()
+    # The engine's modules read their cache and journal locations from the
+    # home folder when they are imported, so point it at the scratch folder
+    # before the first import.
+    home = scratch / "home"
+    home.mkdir(parents=True, exist_ok=True)
+    os.environ["HOME"] = os.environ["USERPROFILE"] = str(home)
+
+    try:
+        sources = {}
+        for _, duration in libraries:
+            for extension in (".mkv", ".mp4"):
+                sources[duration, extension] = generate_source(
+                    scratch / "sources", duration, extension, args.size
+                )
+
+        run = _Run(scratch)
+        metrics = {}
+        for count, duration in libraries:
+            name = f"{count}x{duration}s"
+            print(f"Benchmarking {name}...", file=sys.stderr)
+            metrics.update(
+                bench_library(run, scratch / "libraries", name, count, duration, sources, args)
+            )
+    finally:
+        if not args.keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    results = {
+        "time": datetime.now().isoformat(),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "ffmpeg": _ffmpeg_version(),
+        "params": {
+            "libraries": [f"{count}x{duration}" for count, duration in libraries],
+            "size": args.size,
+            "bitrate": args.bitrate,
+            "encoder": args.encoder,
+            "workers": args.workers,
+            "repeat": args.repeat,
+            "skip_encode": args.skip_encode,
+        },
+        "metrics": metrics,
+    }
+
+    status = 0
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = None
+    if baseline is not None:
+        if baseline.get("params") != results["params"]:
+            print("Warning: baseline was recorded with different parameters.", file=sys.stderr)
+        rows = compare(results, baseline, args.threshold)
+        results["comparison"] = rows
+        for row in rows:
+            ratio = "missing" if row["missing"] else f"{row['ratio']:.2f}x"
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['metric']:<40} {row['value']!s:>10} vs {row['baseline']!s:>10}  {ratio}{flag}")
+        if any(row["regression"] for row in rows):
+            status = 1
+    else:
+        for name, value in sorted(metrics.items()):
+            print(f"{name:<40} {value!s:>10}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        if baseline is not None and "thresholds" in baseline:
+            results = {**results, "thresholds": baseline["thresholds"]}
+        results.pop("comparison", None)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if run.errors:
+        print(f"{len(run.errors)} job(s) failed; their metrics are not comparable.", file=sys.stderr)
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""Verified, journalled commit of ``converted/`` outputs over the originals.
+
+Each output is checked against the probe record of the file it replaces
+(duration within a tolerance and the expected number of streams) before it is
+swapped in with :func:`os.replace`, which is atomic because ``converted/``
+sits on the same filesystem as its parent. The original is kept as a hard
+link until the whole directory is done, and every step is appended to a
+journal, so a commit interrupted by a crash can later be finished or rolled
+back. Directories are committed in parallel.
+"""
+
+import contextlib
+import errno
+import json
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from media_probe import ProbeError
+
+# Location of the commit journal. Override with THEATRE_COMMIT_JOURNAL.
+COMMIT_JOURNAL_FILE = Path(
+    os.getenv("THEATRE_COMMIT_JOURNAL", Path.home() / ".theatre_gui_commit_journal.jsonl")
+)
+
+# Allowed difference in seconds between an output's duration and the original's.
+DURATION_TOLERANCE = float(os.getenv("THEATRE_COMMIT_TOLERANCE", "2.0"))
+
+# Number of converted/ directories committed at once.
+COMMIT_WORKERS = int(os.getenv("THEATRE_COMMIT_WORKERS", "4"))
+
+BACKUP_SUFFIX = ".theatre-backup"
+
+
+class VerificationError(Exception):
+    """An output does not match the file it is meant to replace."""
+
+
+class CommittedFile(NamedTuple):
+    source: str
+    path: str
+
+
+class FailedFile(NamedTuple):
+    source: str
+    reason: str
+
+
+class CommitReport(NamedTuple):
+    committed: list
+    failed: list
+
+
+def backup_path(dst):
+    """Hidden name the original is kept under while its directory commits."""
+    folder, name = os.path.split(dst)
+    return os.path.join(folder, f".{name}{BACKUP_SUFFIX}")
+
+
+def verify_output(probe_cache, src, dst, expected_streams=None, tolerance=DURATION_TOLERANCE):
+    """Check that ``src`` can replace ``dst``; raise :class:`VerificationError`.
+
+    ``expected_streams`` defaults to the original's stream count, which is
+    right for a conversion; stream updates pass the count they kept.
+    """
+    try:
+        output = probe_cache.probe(src)
+    except (OSError, ProbeError) as e:
+        raise VerificationError(f"output cannot be probed: {e}") from e
+    if not output.duration:
+        raise VerificationError("output has no duration")
+
+    try:
+        original = probe_cache.probe(dst) if os.path.exists(dst) else None
+    except ProbeError:
+        original = None
+    if original is None:
+        return output
+
+    if original.duration and abs(output.duration - original.duration) > tolerance:
+        raise VerificationError(
+            f"duration {output.duration:.1f}s does not match original {original.duration:.1f}s"
+        )
+    if expected_streams is None:
+        expected_streams = len(original.streams)
+    if len(output.streams) != expected_streams:
+        raise VerificationError(
+            f"{len(output.streams)} streams, expected {expected_streams}"
+        )
+    return output
+
+
+def _commit_tmp(dst):
+    """Hidden copy of an output that :func:`_replace` swaps in across devices."""
+    folder, name = os.path.split(dst)
+    return os.path.join(folder, f".{name}.commit-tmp")
+
+
+def _remove_commit_tmp(dst):
+    """Remove a copy left by a crash during a cross-device :func:`_replace`."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(_commit_tmp(dst))
+
+
+def _replace(src, dst):
+    """Atomically put ``src`` at ``dst``, copying first if they are on different devices."""
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # converted/ is on another filesystem (e.g. a mount point): copy next to
+    # the destination, flush it, then swap it in atomically.
+    tmp = _commit_tmp(dst)
+    shutil.copy2(src, tmp)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)
+    os.remove(src)
+
+
+def _keep_original(dst, backup):
+    """Keep ``dst`` reachable as ``backup`` without copying it."""
+    if not os.path.exists(dst):
+        return
+    if os.path.exists(backup):
+        os.remove(backup)
+    try:
+        os.link(dst, backup)
+    except OSError:
+        # No hard links on this filesystem; the rename is still atomic and
+        # the journal covers the moment where dst is missing.
+        os.replace(dst, backup)
+
+
+class CommitJournal:
+    """Append-only JSON-lines log of commit steps, fsynced per record."""
+
+    def __init__(self, path=COMMIT_JOURNAL_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def append(self, **record):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def unfinished(self):
+        """Return ``{converted_dir: [file records]}`` for commits never completed."""
+        dirs = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return dirs
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn final write
+            if record.get("state") == "done":
+                dirs.pop(record["dir"], None)
+            else:
+                files = dirs.setdefault(record["dir"], {})
+                files[record["dst"]] = record
+        return {d: list(files.values()) for d, files in dirs.items()}
+
+    def clear(self):
+        with self._lock:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class _Swap(NamedTuple):
+    src: str
+    dst: str
+    backup: Optional[str]
+
+
+def _finish_directory(conv_dir, files, journal):
+    """Remove backups, copies and the empty ``converted/`` folder, then close the entry."""
+    for record in files:
+        if record.get("backup") and os.path.exists(record["backup"]):
+            os.remove(record["backup"])
+        _remove_commit_tmp(record["dst"])
+    try:
+        os.rmdir(conv_dir)
+    except OSError:
+        print(f"Could not remove {conv_dir} — it may not be empty.", file=sys.stderr)
+    journal.append(dir=conv_dir, state="done")
+
+
+def _phase(timer, path, name):
+    return timer.phase(path, name) if timer is not None else contextlib.nullcontext()
+
+
+def commit_directory(conv_dir, probe_cache, journal, expected_streams=None, timer=None):
+    """Verify and swap in every output in ``conv_dir``.
+
+    Outputs that fail verification stay in ``conv_dir``. Returns a
+    :class:`CommitReport`. ``timer`` (a :class:`phase_timing.PhaseTimer`)
+    records the verify and commit phases against each original's path.
+    """
+    expected_streams = expected_streams or {}
+    committed = []
+    failed = []
+    swaps = []
+    parent = os.path.dirname(conv_dir)
+    for name in sorted(os.listdir(conv_dir)):
+        if name.startswith("."):
+            continue  # scratch space such as segment directories
+        src = os.path.join(conv_dir, name)
+        if not os.path.isfile(src):
+            continue
+        dst = os.path.join(parent, name)
+        try:
+            with _phase(timer, dst, "verify"):
+                verify_output(probe_cache, src, dst, expected_streams.get(src))
+        except VerificationError as e:
+            failed.append(FailedFile(src, str(e)))
+            continue
+        swaps.append(_Swap(src, dst, backup_path(dst)))
+
+    records = []
+    for swap in swaps:
+        record = {"dir": conv_dir, "src": swap.src, "dst": swap.dst, "backup": swap.backup}
+        journal.append(state="begin", **record)
+        records.append(record)
+        try:
+            with _phase(timer, swap.dst, "commit"):
+                _keep_original(swap.dst, swap.backup)
+                _replace(swap.src, swap.dst)
+        except OSError as e:
+            failed.append(FailedFile(swap.src, f"could not replace original: {e}"))
+            # Put the original back if the rename fallback moved it away.
+            if not os.path.exists(swap.dst) and os.path.exists(swap.backup):
+                os.replace(swap.backup, swap.dst)
+            continue
+        probe_cache.move(swap.src, swap.dst)
+        committed.append(CommittedFile(swap.src, swap.dst))
+
+    _finish_directory(conv_dir, records, journal)
+    return CommitReport(committed, failed)
+
+
+def commit_all(
+    dirs, probe_cache, journal=None, expected_streams=None, workers=COMMIT_WORKERS, timer=None
+):
+    """Commit several ``converted/`` directories in parallel."""
+    journal = journal or CommitJournal()
+    dirs = [d for d in dirs if os.path.isdir(d)]
+    report = CommitReport([], [])
+    if not dirs:
+        return report
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(dirs)))) as pool:
+        for part in pool.map(
+            lambda d: commit_directory(d, probe_cache, journal, expected_streams, timer), dirs
+        ):
+            report.committed.extend(part.committed)
+            report.failed.extend(part.failed)
+    if not journal.unfinished():
+        journal.clear()
+    return report
+
+
+def finish_interrupted(journal=None, probe_cache=None):
+    """Complete every commit the journal shows was interrupted.
+
+    Returns the :class:`CommittedFile` entries that are now in place.
+    """
+    journal = journal or CommitJournal()
+    committed = []
+    for conv_dir, files in journal.unfinished().items():
+        for record in files:
+            if os.path.exists(record["src"]):
+                _replace(record["src"], record["dst"])
+                if probe_cache is not None:
+                    probe_cache.move(record["src"], record["dst"])
+            if os.path.exists(record["dst"]):
+                committed.append(CommittedFile(record["src"], record["dst"]))
+        _finish_directory(conv_dir, files, journal)
+    journal.clear()
+    return committed
+
+
+def rollback_interrupted(journal=None):
+    """Undo every interrupted commit, returning outputs to ``converted/``.
+
+    Returns the paths of the originals that were restored.
+    """
+    journal = journal or CommitJournal()
+    restored = []
+    for conv_dir, files in journal.unfinished().items():
+        for record in files:
+            src, dst, backup = record["src"], record["dst"], record["backup"]
+            _remove_commit_tmp(dst)
+            if not os.path.exists(backup):
+                continue  # the original was never touched
+            if not os.path.exists(src) and os.path.exists(dst):
+                os.makedirs(conv_dir, exist_ok=True)
+                _replace(dst, src)
+            if os.path.exists(dst) and os.path.samefile(backup, dst):
+                # Still the original's hard link; rename() would do nothing.
+                os.remove(backup)
+            else:
+                os.replace(backup, dst)
+            restored.append(dst)
+        journal.append(dir=conv_dir, state="done")
+    journal.clear()
+    return restored
@@ -0,0 +1,137 @@
+"""Estimate the cost and payoff of converting each file, and plan the queue.
+
+The estimates come from the probe data alone. Encode time is the number of
+pixels to encode divided by a typical rate for hardware or CPU encoders. The
+expected output size is the target bitrate over the duration (see
+:func:`io_scheduler.bitrate_estimate`), and the saving is what that leaves
+of the current size. Files whose streams carry no bitrates have no
+expected size.
+
+:func:`plan` drops files whose expected saving is below a threshold, which
+usually means they are already efficiently encoded, and orders the rest.
+Files with no expected size are never dropped.
+
+* ``longest`` – longest encodes first, so the pool does not end on one
+  long job while the other workers idle
+* ``savings`` – most bytes saved per encode second first (fastest wins)
+* ``path`` – plain path order
+"""
+
+import os
+from typing import NamedTuple, Optional
+
+from auto_bitrate import AUTO, FALLBACK_BITRATE, candidates
+from io_scheduler import bitrate_estimate
+
+QUEUE_ORDERS = ("longest", "savings", "path")
+QUEUE_ORDER = os.getenv("THEATRE_QUEUE_ORDER", "longest")
+
+# Files expected to shrink by less than this percentage are not converted.
+MIN_SAVINGS_PERCENT = float(os.getenv("THEATRE_MIN_SAVINGS", "10"))
+
+# Typical encode rates in megapixels per second.
+CPU_MPIXELS_PER_SECOND = float(os.getenv("THEATRE_CPU_MPIXELS", "40"))
+HARDWARE_MPIXELS_PER_SECOND = float(os.getenv("THEATRE_HW_MPIXELS", "400"))
+
+# Assumed when the probe does not say.
+DEFAULT_FRAME_RATE = 24.0
+DEFAULT_PIXELS = 1920 * 1080
+
+FINISHED_CODECS = ("hevc", "av1")
+
+
+class JobCost(NamedTuple):
+    path: str
+    codec: Optional[str]
+    encode_seconds: float
+    before_size: int
+    expected_size: Optional[int]
+    bits_per_pixel: Optional[float]
+
+    @property
+    def savings(self):
+        """Bytes saved, or ``None`` if the output size is unknown."""
+        if self.expected_size is None:
+            return None
+        return self.before_size - self.expected_size
+
+    @property
+    def savings_percent(self):
+        if self.savings is None:
+            return None
+        return 100.0 * self.savings / self.before_size if self.before_size else 0.0
+
+
+def target_kbps(info, bitrate):
+    """Video bitrate a job will encode ``info`` at; ``auto`` is estimated."""
+    if bitrate != AUTO:
+        return int(bitrate)
+    # Auto never goes above the source, so assume the typical choice capped there.
+    return min(FALLBACK_BITRATE, max(candidates(info)))
+
+
+def estimate(info, bitrate, hardware=False):
+    """:class:`JobCost` of converting the file described by ``info``."""
+    video = info.video
+    codec = info.video_codec
+    pixels = (video.width or 0) * (video.height or 0) if video else 0
+    frame_rate = (video.frame_rate if video else None) or DEFAULT_FRAME_RATE
+    bits_per_pixel = None
+    if video and video.bit_rate and pixels:
+        bits_per_pixel = round(video.bit_rate / (pixels * frame_rate), 4)
+    if codec in FINISHED_CODECS or video is None:
+        # The job only probes and skips (or remuxes) these.
+        return JobCost(info.path, codec, 0.0, info.size, info.size, bits_per_pixel)
+    rate = HARDWARE_MPIXELS_PER_SECOND if hardware else CPU_MPIXELS_PER_SECOND
+    frames = (info.duration or 0) * frame_rate
+    seconds = frames * (pixels or DEFAULT_PIXELS) / (rate * 1e6)
+    expected = bitrate_estimate(info, video_kbps=target_kbps(info, bitrate))
+    return JobCost(info.path, codec, round(seconds, 1), info.size, expected, bits_per_pixel)
+
+
+def plan(
+    files, infos, bitrate, hardware=False, order=QUEUE_ORDER, min_savings=MIN_SAVINGS_PERCENT
+):
+    """Order ``files`` for conversion and pick out the ones not worth it.
+
+    ``infos`` maps paths to probe results (``None`` if the probe failed);
+    files without one are kept and queued last. Returns ``(queue, skipped)``
+    where ``skipped`` holds the :class:`JobCost` of every dropped file.
+    """
+    if order not in QUEUE_ORDERS:
+        raise ValueError(f"Unknown queue order {order!r}; expected one of {QUEUE_ORDERS}")
+    costs = []
+    unknown = []
+    skipped = []
+    for path in files:
+        info = infos.get(path)
+        if info is None or not info.duration:
+            unknown.append(path)
+            continue
+        cost = estimate(info, bitrate, hardware)
+        if (
+            cost.codec not in FINISHED_CODECS
+            and cost.savings_percent is not None
+            and cost.savings_percent < min_savings
+        ):
+            skipped.append(cost)
+        else:
+            costs.append(cost)
+    if order == "longest":
+        costs.sort(key=lambda c: -c.encode_seconds)
+    elif order == "savings":
+        costs.sort(key=lambda c: -(c.savings or 0) / max(c.encode_seconds, 1.0))
+    return [c.path for c in costs] + unknown, skipped
+
+
+def skip_message(cost):
+    """Why :func:`plan` skipped a file, for the status log."""
+    mib = 1024 * 1024
+    sizes = f"{cost.before_size / mib:.0f} MiB -> about {cost.expected_size / mib:.0f} MiB"
+    if cost.savings <= 0:
+        message = f"Not expected to shrink ({sizes})"
+    else:
+        message = f"Expected to save only {cost.savings_percent:.0f}% ({sizes})"
+    if cost.bits_per_pixel is not None:
+        message += f"; already {cost.bits_per_pixel:.3f} bits/pixel {cost.codec}"
+    return message
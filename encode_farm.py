@@ -0,0 +1,584 @@
+"""Distributed encode farm: a job coordinator and a remote worker CLI.
+
+:class:`FarmCoordinator` serves a work list over a small JSON/HTTP protocol
+and exposes the same ``events``/``start``/``cancel`` interface as
+:class:`theatre_engine.BatchRunner`, so the GUI consumes remote progress and
+results exactly like local ones. Workers lease one job at a time, send
+heartbeats with their progress and report the result. A job whose lease
+expires (because the worker died or lost the network) goes back on the queue;
+the coordinator checks for expired leases on its own thread, so a batch ends
+even if every worker is gone. Each lease writes to its own hidden file in
+``converted/``, renamed into place when the job completes, so a worker that
+lost its lease never touches the output of the one that took over.
+
+Files must be reachable from every worker, typically on shared storage. Use
+``--path-map`` when a worker mounts the library at a different path::
+
+    python encode_farm.py worker --server http://encoder-1:8765 \\
+        --path-map "Y:\\Videos=/mnt/videos" --workers 2
+
+Endpoints (all ``POST`` with a JSON body)::
+
+    /lease      {"worker"}                           -> {"job", "lease"} | {"done"} | {}
+    /heartbeat  {"worker", "job_id", "progress"}     -> {"cancel"}
+    /complete   {"worker", "job_id", "result"}       -> {}
+    /fail       {"worker", "job_id", "error"}        -> {}
+"""
+
+import argparse
+import collections
+import contextlib
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import weakref
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from media_probe import ProbeCache
+from resource_governor import POLICY
+from theatre_engine import (
+    CREATE_NO_WINDOW,
+    DONE,
+    ERROR,
+    NOTICE,
+    PROGRESS,
+    RESULT,
+    convert_file,
+    run_prepare,
+)
+
+FARM_HOST = os.getenv("THEATRE_FARM_HOST", "127.0.0.1")
+FARM_PORT = int(os.getenv("THEATRE_FARM_PORT", "8765"))
+# Optional shared secret sent by workers in the X-Farm-Token header.
+FARM_TOKEN = os.getenv("THEATRE_FARM_TOKEN", "")
+
+# A leased job is handed to another worker if no heartbeat arrives in time.
+LEASE_SECONDS = 60
+HEARTBEAT_SECONDS = 2
+# Seconds an idle worker waits before asking for work again.
+POLL_SECONDS = 5
+# Jobs are given up on after this many expired leases or failures.
+MAX_ATTEMPTS = 3
+
+
+class RemoteJobError(RuntimeError):
+    """A job failed on a farm worker."""
+
+
+class _Job:
+    __slots__ = ("id", "input_file", "state", "worker", "expires", "attempts", "leases")
+
+    def __init__(self, job_id, input_file):
+        self.id = job_id
+        self.input_file = input_file
+        self.state = "pending"
+        self.worker = None
+        self.expires = 0.0
+        self.attempts = 0
+        # Every lease handed out, oldest first.
+        self.leases = []
+
+
+def lease_output_name(lease, input_file):
+    """Hidden name in ``converted/`` that the holder of ``lease`` writes to."""
+    return f".lease-{lease}-{os.path.basename(input_file)}"
+
+
+class FarmCoordinator:
+    """Hand ``files`` out to remote workers and collect their results.
+
+    ``options`` are passed through to :func:`theatre_engine.convert_file` on
+    the worker (for example ``bitrate``, ``encoder`` and ``segmented``).
+    ``prepare`` works as for :class:`theatre_engine.BatchRunner`; workers
+    are told to wait until it has returned the queue.
+    """
+
+    def __init__(
+        self,
+        files,
+        options,
+        host=FARM_HOST,
+        port=FARM_PORT,
+        token=FARM_TOKEN,
+        lease_seconds=LEASE_SECONDS,
+        max_attempts=MAX_ATTEMPTS,
+        prepare=None,
+    ):
+        self.files = list(files)
+        self.prepare = prepare
+        self.options = dict(options)
+        self.address = (host, port)
+        self.token = token
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.events = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pending = collections.deque()
+        self._remaining = 0
+        self._queued = False
+        self._cancelled = False
+        self._finished = False
+        self._done = threading.Event()
+        self._server = None
+        self._thread = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2] if self._server else self.address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start serving; raises ``OSError`` if the port cannot be bound."""
+        self._server = ThreadingHTTPServer(self.address, _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._reap_loop, daemon=True).start()
+        if self.prepare is None:
+            self._queue(self.files)
+        else:
+            threading.Thread(target=lambda: self._queue(run_prepare(self)), daemon=True).start()
+        return self
+
+    def _queue(self, files):
+        with self._lock:
+            self.files = list(files)
+            self._jobs = {str(i): _Job(str(i), f) for i, f in enumerate(self.files)}
+            self._pending.extend(self._jobs)
+            self._remaining = len(self._jobs)
+            self._queued = True
+        if not self._jobs:
+            self._finish()
+
+    def cancel(self):
+        """Stop handing out work; running workers are told to cancel."""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+        self._finish()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _finish(self):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        self._done.set()
+        self.events.put((DONE, None, None))
+        if self._server is None:
+            return
+        # shutdown() blocks until serve_forever returns, so never call it
+        # from a request thread directly.
+        threading.Thread(target=self._stop_server, daemon=True).start()
+
+    def _stop_server(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _reap_loop(self):
+        # Leases are also checked here, as no lease request may ever come
+        # again once every worker has died.
+        while not self._done.wait(self.lease_seconds / 4):
+            with self._lock:
+                self._reap_expired(time.monotonic())
+                finished = self._queued and self._remaining == 0
+            if finished:
+                self._finish()
+
+    def _reap_expired(self, now):
+        """Requeue jobs whose worker stopped sending heartbeats."""
+        for job in self._jobs.values():
+            if job.state == "leased" and job.expires < now:
+                self.events.put(
+                    (NOTICE, job.input_file, {"message": f"Lease expired on {job.worker}"})
+                )
+                self._retry_or_fail(job, f"worker {job.worker} stopped responding")
+
+    def _retry_or_fail(self, job, error):
+        job.attempts += 1
+        job.worker = None
+        if job.attempts >= self.max_attempts:
+            job.state = "failed"
+            self._remaining -= 1
+            self.events.put((ERROR, job.input_file, RemoteJobError(error)))
+        else:
+            job.state = "pending"
+            self._pending.append(job.id)
+            self.events.put((PROGRESS, job.input_file, {"fraction": 0.0, "worker": None}))
+
+    def lease(self, worker):
+        finished = False
+        with self._lock:
+            if not self._queued:
+                return {}
+            if self._cancelled or self._remaining == 0:
+                return {"done": True}
+            now = time.monotonic()
+            self._reap_expired(now)
+            job = None
+            while self._pending:
+                job = self._jobs[self._pending.popleft()]
+                if job.state == "pending":
+                    break
+                job = None
+            if job is None:
+                finished = self._remaining == 0
+            else:
+                job.state = "leased"
+                job.worker = worker
+                job.expires = now + self.lease_seconds
+                job.leases.append(f"{job.id}.{len(job.leases)}")
+        if finished:
+            self._finish()
+            return {"done": True}
+        if job is None:
+            return {}
+        self.events.put((PROGRESS, job.input_file, {"fraction": 0.0, "worker": worker}))
+        return {
+            "job": {"id": job.id, "input_file": job.input_file, "options": self.options},
+            "lease": job.leases[-1],
+            "lease_seconds": self.lease_seconds,
+        }
+
+    def _current_job(self, worker, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.state != "leased" or job.worker != worker:
+            return None
+        return job
+
+    def heartbeat(self, worker, job_id, progress):
+        with self._lock:
+            job = self._current_job(worker, job_id)
+            if job is None or self._cancelled:
+                return {"cancel": True}
+            job.expires = time.monotonic() + self.lease_seconds
+        self.events.put((PROGRESS, job.input_file, dict(progress or {}, worker=worker)))
+        return {"cancel": False}
+
+    def complete(self, worker, job_id, result):
+        with self._lock:
+            job = self._current_job(worker, job_id)
+            if job is None:
+                return {}
+            job.state = "done"
+            self._remaining -= 1
+            finished = self._remaining == 0
+        self._remove_lost_outputs(job, result)
+        self.events.put((RESULT, job.input_file, result))
+        if finished:
+            self._finish()
+        return {}
+
+    @staticmethod
+    def _remove_lost_outputs(job, result):
+        # Workers whose lease expired may have left a partial output behind.
+        converted_dir = result.get("converted_dir")
+        if not converted_dir:
+            return
+        for lease in job.leases[:-1]:
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(converted_dir, lease_output_name(lease, job.input_file)))
+
+    def fail(self, worker, job_id, error):
+        with self._lock:
+            job = self._current_job(worker, job_id)
+            if job is None:
+                return {}
+            self._retry_or_fail(job, f"{worker}: {error}")
+            finished = self._remaining == 0
+        if finished:
+            self._finish()
+        return {}
+
+
+def _handler_for(coordinator):
+    routes = {
+        "/lease": lambda body: coordinator.lease(body["worker"]),
+        "/heartbeat": lambda body: coordinator.heartbeat(
+            body["worker"], body["job_id"], body.get("progress")
+        ),
+        "/complete": lambda body: coordinator.complete(
+            body["worker"], body["job_id"], body["result"]
+        ),
+        "/fail": lambda body: coordinator.fail(
+            body["worker"], body["job_id"], body.get("error", "")
+        ),
+    }
+
+    class FarmRequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            route = routes.get(self.path)
+            if route is None:
+                self.send_error(404)
+                return
+            if coordinator.token and self.headers.get("X-Farm-Token") != coordinator.token:
+                self.send_error(403)
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                reply = json.dumps(route(body)).encode()
+            except (KeyError, ValueError) as e:
+                self.send_error(400, str(e))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, format, *args):
+            pass  # one line per heartbeat would drown the console
+
+    return FarmRequestHandler
+
+
+class PathMap:
+    """Translate coordinator paths to local mount points and back."""
+
+    def __init__(self, pairs=()):
+        self.pairs = []
+        for pair in pairs:
+            remote, sep, local = pair.partition("=")
+            if not sep:
+                raise ValueError(f"Path map must look like REMOTE=LOCAL: {pair}")
+            self.pairs.append((remote, local))
+
+    @staticmethod
+    def _swap(path, src, dst):
+        rest = path[len(src):].replace("\\", "/").strip("/")
+        sep = "\\" if "\\" in dst or (len(dst) > 1 and dst[1] == ":") else "/"
+        return dst.rstrip("\\/") + (sep + rest.replace("/", sep) if rest else "")
+
+    def to_local(self, path):
+        for remote, local in self.pairs:
+            if path.startswith(remote):
+                return self._swap(path, remote, local)
+        return path
+
+    def to_remote(self, path):
+        for remote, local in self.pairs:
+            if path.startswith(local):
+                return self._swap(path, local, remote)
+        return path
+
+
+class FarmClient:
+    """Minimal JSON/HTTP client for the coordinator."""
+
+    def __init__(self, server, token=FARM_TOKEN, timeout=30):
+        self.server = server.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def call(self, endpoint, **body):
+        request = urllib.request.Request(
+            self.server + endpoint,
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json", "X-Farm-Token": self.token},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read() or b"{}")
+
+
+class RemoteJobContext:
+    """Job context that forwards progress to the coordinator as heartbeats."""
+
+    def __init__(self, client, worker, job_id, input_file, log=None):
+        self._client = client
+        self._log = log or _print_log
+        self._worker = worker
+        self._job_id = job_id
+        self.input_file = input_file
+        self._progress = {}
+        self._cancel = threading.Event()
+        self._stop = threading.Event()
+        self._processes = weakref.WeakSet()
+        self._thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def report(self, **progress):
+        # Only the latest update is sent with the next heartbeat.
+        self._progress = progress
+
+    def phase(self, name):
+        # Phase timings are only collected for local batches.
+        return contextlib.nullcontext()
+
+    def popen(self, cmd, **kwargs):
+        kwargs.setdefault("creationflags", CREATE_NO_WINDOW | POLICY.creationflags())
+        process = subprocess.Popen(cmd, **kwargs)
+        POLICY.apply(process.pid)
+        self._processes.add(process)
+        if self._cancel.is_set():
+            process.terminate()
+        return process
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                reply = self._client.call(
+                    "/heartbeat",
+                    worker=self._worker,
+                    job_id=self._job_id,
+                    progress=self._progress,
+                )
+            except (OSError, ValueError) as e:
+                self._log(f"{self._worker}: heartbeat failed: {e}")
+                continue
+            if reply.get("cancel") and not self._cancel.is_set():
+                self._log(f"{self._worker}: coordinator cancelled {self.input_file}")
+                self._cancel.set()
+                for process in list(self._processes):
+                    if process.poll() is None:
+                        process.terminate()
+
+
+def _print_log(message):
+    print(f"{datetime.now():%H:%M:%S} {message}", file=sys.stderr)
+
+
+def _map_result(result, path_map):
+    mapped = dict(result)
+    for key in ("input_file", "output_file", "converted_dir"):
+        if mapped.get(key):
+            mapped[key] = path_map.to_remote(mapped[key])
+    return mapped
+
+
+def _claim_output(result, input_file, ctx):
+    """Rename this lease's output to its real name in ``converted/``."""
+    output = result.get("output_file")
+    if not output:
+        return result
+    if ctx.cancelled:
+        # The lease was lost; its output is no longer ours to commit.
+        os.remove(output)
+        raise RemoteJobError(f"lease lost while converting {input_file}")
+    final = os.path.join(os.path.dirname(output), os.path.basename(input_file))
+    os.replace(output, final)
+    return dict(result, output_file=final)
+
+
+def _worker_loop(client, name, path_map, threads, once, log=_print_log):
+    probe_cache = ProbeCache()
+    while True:
+        try:
+            reply = client.call("/lease", worker=name)
+        except (OSError, ValueError) as e:
+            if once:
+                return
+            log(f"{name}: coordinator unreachable ({e}); retrying")
+            time.sleep(POLL_SECONDS)
+            continue
+        job = reply.get("job")
+        if job is None:
+            if once and reply.get("done"):
+                return
+            time.sleep(POLL_SECONDS)
+            continue
+
+        input_file = path_map.to_local(job["input_file"])
+        log(f"{name}: encoding {input_file}")
+        ctx = RemoteJobContext(client, name, job["id"], input_file, log)
+        try:
+            result = convert_file(
+                input_file,
+                ctx,
+                probe_cache,
+                threads=threads,
+                output_name=lease_output_name(reply["lease"], input_file),
+                **job["options"],
+            )
+            result = _claim_output(result, input_file, ctx)
+        except Exception as e:
+            endpoint, payload = "/fail", {"error": str(e) or type(e).__name__}
+        else:
+            endpoint, payload = "/complete", {"result": _map_result(result, path_map)}
+        finally:
+            ctx.close()
+        try:
+            client.call(endpoint, worker=name, job_id=job["id"], **payload)
+        except (OSError, ValueError) as e:
+            log(f"{name}: could not report {input_file}: {e}")
+
+
+def run_worker(
+    server, name=None, workers=1, path_map=(), once=False, token=FARM_TOKEN, log=_print_log
+):
+    """Run ``workers`` encode loops against the coordinator at ``server``.
+
+    ``log`` receives every diagnostic line (printed to stderr by default).
+    """
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    client = FarmClient(server, token=token)
+    paths = PathMap(path_map)
+    threads = POLICY.cpu_threads(workers)
+    loops = [
+        threading.Thread(
+            target=_worker_loop,
+            args=(client, f"{name}/{i}", paths, threads, once, log),
+            daemon=True,
+        )
+        for i in range(max(1, workers))
+    ]
+    for loop in loops:
+        loop.start()
+    try:
+        for loop in loops:
+            loop.join()
+    except KeyboardInterrupt:
+        log("Worker stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encode farm worker")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="lease and encode jobs from a coordinator")
+    worker.add_argument("--server", default=f"http://{FARM_HOST}:{FARM_PORT}")
+    worker.add_argument("--name", help="worker name shown in the coordinator")
+    worker.add_argument("--workers", type=int, default=1, help="jobs run at once")
+    worker.add_argument(
+        "--path-map",
+        action="append",
+        default=[],
+        metavar="REMOTE=LOCAL",
+        help="map a coordinator path prefix to a local one (repeatable)",
+    )
+    worker.add_argument(
+        "--once", action="store_true", help="exit when the coordinator has no more work"
+    )
+    args = parser.parse_args(argv)
+    run_worker(args.server, args.name, args.workers, args.path_map, args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
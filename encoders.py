@@ -0,0 +1,259 @@
+"""HEVC encoder detection and pluggable encoder backends.
+
+``ffmpeg -encoders`` tells us which encoders were compiled in, but hardware
+encoders also need a matching GPU and driver. Every candidate is therefore
+checked with a one-frame test encode, and the list of working backends is
+cached in memory and on disk (keyed on the ffmpeg binary) so the check only
+runs when ffmpeg changes.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+# Flag to prevent opening a console window for subprocesses on Windows.
+CREATE_NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+ENCODER_CACHE_FILE = Path(
+    os.getenv("THEATRE_ENCODER_CACHE", Path.home() / ".theatre_gui_encoders.json")
+)
+
+# Encoder used when "auto" is selected. Set THEATRE_ENCODER to force one.
+DEFAULT_ENCODER = os.getenv("THEATRE_ENCODER", "auto")
+
+VAAPI_DEVICE = os.getenv("THEATRE_VAAPI_DEVICE", "/dev/dri/renderD128")
+X265_PRESET = os.getenv("THEATRE_X265_PRESET", "medium")
+
+
+class EncoderUnavailable(RuntimeError):
+    """No usable HEVC encoder was found."""
+
+
+class EncoderBackend:
+    """An ffmpeg HEVC encoder and the arguments it needs.
+
+    Lower ``priority`` values are faster and are preferred by
+    :func:`select_backend`.
+    """
+
+    name = ""
+    label = ""
+    priority = 100
+    hardware = True
+
+    def input_args(self):
+        """Options that must appear before ``-i``."""
+        return []
+
+    def video_args(self, bitrate_kbps, threads=None):
+        """Options selecting and configuring the encoder for ``-c:v``."""
+        return ["-c:v", self.name, "-b:v", f"{bitrate_kbps}k"]
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+
+class AmfBackend(EncoderBackend):
+    name = "hevc_amf"
+    label = "AMD AMF"
+    priority = 10
+
+    def video_args(self, bitrate_kbps, threads=None):
+        return ["-c:v", self.name, "-usage", "transcoding", "-b:v", f"{bitrate_kbps}k"]
+
+
+class NvencBackend(EncoderBackend):
+    name = "hevc_nvenc"
+    label = "NVIDIA NVENC"
+    priority = 10
+
+    def video_args(self, bitrate_kbps, threads=None):
+        return ["-c:v", self.name, "-preset", "p5", "-b:v", f"{bitrate_kbps}k"]
+
+
+class QsvBackend(EncoderBackend):
+    name = "hevc_qsv"
+    label = "Intel Quick Sync"
+    priority = 20
+
+    def video_args(self, bitrate_kbps, threads=None):
+        return ["-c:v", self.name, "-preset", "medium", "-b:v", f"{bitrate_kbps}k"]
+
+
+class VaapiBackend(EncoderBackend):
+    name = "hevc_vaapi"
+    label = "VA-API"
+    priority = 20
+
+    def input_args(self):
+        return ["-vaapi_device", VAAPI_DEVICE]
+
+    def video_args(self, bitrate_kbps, threads=None):
+        return [
+            "-filter:v:0",
+            "format=nv12,hwupload",
+            "-c:v",
+            self.name,
+            "-b:v",
+            f"{bitrate_kbps}k",
+        ]
+
+
+class VideoToolboxBackend(EncoderBackend):
+    name = "hevc_videotoolbox"
+    label = "Apple VideoToolbox"
+    priority = 20
+
+
+class X265Backend(EncoderBackend):
+    """Pure CPU encoder that works on any machine with a full ffmpeg build."""
+
+    name = "libx265"
+    label = "libx265 (CPU)"
+    priority = 50
+    hardware = False
+
+    def video_args(self, bitrate_kbps, threads=None):
+        params = "log-level=error"
+        if threads:
+            params += f":pools={threads}"
+        return [
+            "-c:v",
+            self.name,
+            "-preset",
+            X265_PRESET,
+            "-b:v",
+            f"{bitrate_kbps}k",
+            "-x265-params",
+            params,
+        ]
+
+
+BACKENDS = [
+    AmfBackend(),
+    NvencBackend(),
+    QsvBackend(),
+    VaapiBackend(),
+    VideoToolboxBackend(),
+    X265Backend(),
+]
+BACKENDS_BY_NAME = {backend.name: backend for backend in BACKENDS}
+
+_lock = threading.Lock()
+_working = None
+
+
+def list_encoders():
+    """Return the names of all encoders compiled into ffmpeg."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-encoders"],
+        capture_output=True,
+        text=True,
+        creationflags=CREATE_NO_WINDOW,
+    )
+    names = set()
+    in_table = False
+    for line in result.stdout.splitlines():
+        if line.strip().startswith("------"):
+            in_table = True
+            continue
+        parts = line.split()
+        if in_table and len(parts) >= 2:
+            names.add(parts[1])
+    return names
+
+
+def backend_works(backend):
+    """Encode a single synthetic frame to check the encoder really works."""
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-v",
+        "error",
+        *backend.input_args(),
+        "-f",
+        "lavfi",
+        "-i",
+        "color=black:s=256x256:d=0.1",
+        *backend.video_args(1000, threads=1),
+        "-frames:v",
+        "1",
+        "-f",
+        "null",
+        "-",
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, timeout=30, creationflags=CREATE_NO_WINDOW
+        )
+    except subprocess.TimeoutExpired:
+        return False
+    return result.returncode == 0
+
+
+def _ffmpeg_fingerprint():
+    path = shutil.which("ffmpeg")
+    if not path:
+        return None
+    try:
+        return {"path": path, "mtime_ns": os.stat(path).st_mtime_ns}
+    except OSError:
+        return None
+
+
+def _load_cached(fingerprint):
+    try:
+        data = json.loads(ENCODER_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return None
+    if data.get("ffmpeg") != fingerprint:
+        return None
+    return [BACKENDS_BY_NAME[n] for n in data.get("working", []) if n in BACKENDS_BY_NAME]
+
+
+def _save_cached(fingerprint, backends):
+    try:
+        ENCODER_CACHE_FILE.write_text(
+            json.dumps({"ffmpeg": fingerprint, "working": [b.name for b in backends]})
+        )
+    except OSError as e:
+        print("Could not save encoder cache:", e, file=sys.stderr)
+
+
+def detect_backends(refresh=False):
+    """Return working backends, fastest first.
+
+    The result is cached for the life of the process and on disk until the
+    ffmpeg binary changes. Raises ``FileNotFoundError`` if ffmpeg is missing.
+    """
+    global _working
+    with _lock:
+        if _working is not None and not refresh:
+            return list(_working)
+        fingerprint = _ffmpeg_fingerprint()
+        if fingerprint is None:
+            raise FileNotFoundError("ffmpeg")
+        working = None if refresh else _load_cached(fingerprint)
+        if working is None:
+            compiled = list_encoders()
+            working = [b for b in BACKENDS if b.name in compiled and backend_works(b)]
+            _save_cached(fingerprint, working)
+        _working = sorted(working, key=lambda b: b.priority)
+        return list(_working)
+
+
+def select_backend(name=DEFAULT_ENCODER):
+    """Return the backend called ``name``, or the fastest one for ``"auto"``."""
+    working = detect_backends()
+    if name and name != "auto":
+        for backend in working:
+            if backend.name == name:
+                return backend
+        raise EncoderUnavailable(f"Encoder {name} is not available on this machine")
+    if not working:
+        raise EncoderUnavailable("No working HEVC encoder found in ffmpeg")
+    return working[0]
@@ -0,0 +1,142 @@
+"""Run ffmpeg with machine-readable progress reporting.
+
+ffmpeg is started with ``-progress pipe:1 -nostats`` so that progress arrives
+on stdout as ``key=value`` blocks terminated by a ``progress=`` line. Each
+block is turned into an :class:`FFmpegProgress` event. Stderr is drained on a
+separate thread into a bounded ring buffer that is only used for error
+reports.
+"""
+
+import collections
+import functools
+import subprocess
+import sys
+import threading
+from typing import NamedTuple, Optional
+
+# Flag to prevent opening a console window for subprocesses on Windows.
+CREATE_NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+# Number of stderr lines kept for error reports.
+STDERR_TAIL_LINES = 40
+
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+
+class FFmpegProgress(NamedTuple):
+    out_time: float
+    frame: Optional[int]
+    fps: Optional[float]
+    speed: Optional[float]
+    bitrate_kbps: Optional[float]
+    total_size: Optional[int]
+    fraction: float
+    eta: Optional[float]
+    done: bool
+
+
+class FFmpegError(subprocess.CalledProcessError):
+    """ffmpeg exited with an error; ``stderr`` holds the tail of its output."""
+
+    def __str__(self):
+        message = super().__str__()
+        tail = self.last_line()
+        return f"{message}\n{tail}" if tail else message
+
+    def last_line(self):
+        lines = (self.stderr or "").strip().splitlines()
+        return lines[-1] if lines else ""
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProgressParser:
+    """Incremental parser for ffmpeg's ``-progress`` output."""
+
+    def __init__(self, duration=None):
+        self.duration = duration or None
+        self._fields = {}
+
+    def feed(self, line):
+        """Consume one line; return an event when a block is complete."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self._fields[key] = value
+            return None
+        fields, self._fields = self._fields, {}
+        return self._build(fields, done=value == "end")
+
+    def _build(self, fields, done):
+        out_us = _number(fields.get("out_time_us"), int)
+        if out_us is None:
+            # Older builds only provide out_time_ms, which is also microseconds.
+            out_us = _number(fields.get("out_time_ms"), int)
+        out_time = max(out_us or 0, 0) / 1_000_000
+        speed = _number(fields.get("speed", "").rstrip("x"))
+        bitrate = _number(fields.get("bitrate", "").replace("kbits/s", ""))
+
+        fraction = 1.0 if done else 0.0
+        eta = 0.0 if done else None
+        if self.duration and not done:
+            fraction = min(out_time / self.duration, 1.0)
+            if speed:
+                eta = max(self.duration - out_time, 0.0) / speed
+        return FFmpegProgress(
+            out_time=out_time,
+            frame=_number(fields.get("frame"), int),
+            fps=_number(fields.get("fps")),
+            speed=speed,
+            bitrate_kbps=bitrate,
+            total_size=_number(fields.get("total_size"), int),
+            fraction=fraction,
+            eta=eta,
+            done=done,
+        )
+
+
+def with_progress_args(cmd):
+    """Return ``cmd`` with the ``-progress`` options added after the binary."""
+    return [cmd[0], *PROGRESS_ARGS, *cmd[1:]]
+
+
+def _drain(stream, tail):
+    for line in stream:
+        tail.append(line)
+
+
+def run_ffmpeg(cmd, duration=None, on_progress=None, popen=None):
+    """Run ``cmd`` to completion, calling ``on_progress`` for every update.
+
+    ``popen`` can replace :class:`subprocess.Popen` (for example to let a
+    batch runner track the process). Raises :class:`FFmpegError` with the
+    stderr tail if ffmpeg fails.
+    """
+    popen = popen or functools.partial(subprocess.Popen, creationflags=CREATE_NO_WINDOW)
+    cmd = with_progress_args(cmd)
+    process = popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+    )
+    tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+    stderr_thread = threading.Thread(target=_drain, args=(process.stderr, tail), daemon=True)
+    stderr_thread.start()
+
+    parser = ProgressParser(duration)
+    for line in process.stdout:
+        event = parser.feed(line)
+        if event is not None and on_progress is not None:
+            on_progress(event)
+    ret = process.wait()
+    stderr_thread.join()
+    if ret != 0:
+        raise FFmpegError(ret, cmd, stderr="".join(tail))
@@ -0,0 +1,175 @@
+"""Per-device I/O limits and free-space admission for batch jobs.
+
+Every job writes a full copy of its file into ``converted/``. Jobs are grouped
+by the device that directory lives on: each device has its own cap on
+concurrent jobs, and a job is only admitted once the device has room for its
+estimated output on top of what running jobs still have to write. This keeps
+several remuxes from thrashing one NAS volume, and stops a full disk from
+killing jobs halfway through.
+"""
+
+import contextlib
+import errno
+import itertools
+import os
+import shutil
+import threading
+
+# Concurrent stream updates (pure remuxes, bound by disk I/O) per device.
+IO_JOBS_PER_DEVICE = int(os.getenv("THEATRE_IO_PER_DEVICE", "2"))
+
+# Concurrent encodes per device; 0 leaves them to the Parallel jobs setting,
+# as encoders read and write far more slowly than the disk can go.
+ENCODE_JOBS_PER_DEVICE = int(os.getenv("THEATRE_ENCODE_PER_DEVICE", "0"))
+
+# Space kept free on every device, in MiB.
+FREE_SPACE_RESERVE = int(os.getenv("THEATRE_FREE_SPACE_RESERVE_MB", "1024")) * 1024 * 1024
+
+# Muxing overhead added to bitrate-based size estimates.
+CONTAINER_OVERHEAD = 1.02
+
+
+class InsufficientSpace(OSError):
+    """The estimated output cannot fit even with no other job running."""
+
+    def __init__(self, path, needed, free):
+        super().__init__(
+            errno.ENOSPC,
+            f"Need about {needed // (1024 * 1024)} MiB for {os.path.basename(path)} "
+            f"but only {max(free, 0) // (1024 * 1024)} MiB is free",
+        )
+
+
+class AdmissionCancelled(RuntimeError):
+    """The batch was cancelled while the job waited to be admitted."""
+
+
+def device_of(path):
+    """Identifier of the device holding ``path`` (an existing file or folder)."""
+    return os.stat(path).st_dev
+
+
+def interleave_by_device(files):
+    """Order ``files`` round-robin across devices so jobs spread out."""
+    groups = {}
+    for path in files:
+        try:
+            key = device_of(os.path.dirname(path) or ".")
+        except OSError:
+            key = None
+        groups.setdefault(key, []).append(path)
+    return [
+        path
+        for batch in itertools.zip_longest(*groups.values())
+        for path in batch
+        if path is not None
+    ]
+
+
+def _copied_bitrate(info, streams):
+    """Bits per second of ``streams``, which are copied without re-encoding."""
+    known = [s.bit_rate for s in streams if s.bit_rate]
+    if known:
+        return sum(known)
+    video = info.video
+    if info.bit_rate and video is not None and video.bit_rate:
+        return max(info.bit_rate - video.bit_rate, 0)
+    return None
+
+
+def bitrate_estimate(info, video_kbps=None, keep=None):
+    """Bytes a job writes for ``info`` going by bitrates, or ``None``.
+
+    ``video_kbps`` is the target bitrate when the video is re-encoded;
+    otherwise it is copied. ``keep`` lists the stream indexes of a stream
+    update (``None`` keeps everything). Returns ``None`` when the probe data
+    is too thin to estimate from, as with Matroska files that carry no
+    per-stream bitrates.
+    """
+    if info is None or not info.duration:
+        return None
+    streams = [s for s in info.streams if keep is None or s.index in keep]
+    video = info.video
+    others = [s for s in streams if video is None or s.index != video.index]
+    copied = _copied_bitrate(info, others) if others else 0
+    if video_kbps is not None:
+        video_bps = int(video_kbps) * 1000
+    elif video is not None and (keep is None or video.index in keep):
+        video_bps = video.bit_rate
+    else:
+        video_bps = 0
+    if copied is None or video_bps is None:
+        return None
+    estimate = int((video_bps + copied) * info.duration / 8 * CONTAINER_OVERHEAD)
+    return min(estimate, info.size) if video_kbps is None else estimate
+
+
+def estimate_output_size(info, video_kbps=None, keep=None):
+    """Estimate the bytes a job writes for the file described by ``info``.
+
+    Same as :func:`bitrate_estimate`, but falls back to the input size when
+    the probe data is too thin to estimate from.
+    """
+    if info is None:
+        return 0
+    estimate = bitrate_estimate(info, video_kbps, keep)
+    return info.size if estimate is None else estimate
+
+
+class IOScheduler:
+    """Admit jobs per device, bounded by concurrency and free space.
+
+    One scheduler is shared by every job of a front end, so stream updates
+    and conversions running on the same volume see each other.
+    """
+
+    def __init__(self, reserve_bytes=FREE_SPACE_RESERVE, poll_seconds=2.0):
+        self.reserve_bytes = reserve_bytes
+        self.poll_seconds = poll_seconds
+        self._cond = threading.Condition()
+        self._active = {}
+        # device -> {token: (output path, estimated size)}
+        self._reservations = {}
+
+    def _still_to_write(self, device):
+        pending = 0
+        for path, size in self._reservations.get(device, {}).values():
+            try:
+                written = os.path.getsize(path)
+            except OSError:
+                written = 0
+            pending += max(size - written, 0)
+        return pending
+
+    @contextlib.contextmanager
+    def admit(self, output_path, estimated_size, per_device=0, cancelled=None):
+        """Block until ``output_path``'s device can take another job.
+
+        ``per_device`` caps the jobs running on the device (0 for no cap).
+        Raises :class:`InsufficientSpace` if the output cannot fit even once
+        the device is idle, or :class:`AdmissionCancelled` if ``cancelled()``
+        becomes true while waiting.
+        """
+        folder = os.path.dirname(output_path)
+        device = device_of(folder)
+        token = object()
+        with self._cond:
+            while True:
+                if cancelled is not None and cancelled():
+                    raise AdmissionCancelled(f"Cancelled before starting {output_path}")
+                if not per_device or self._active.get(device, 0) < per_device:
+                    free = shutil.disk_usage(folder).free - self.reserve_bytes
+                    if estimated_size <= free - self._still_to_write(device):
+                        break
+                    if not self._reservations.get(device):
+                        raise InsufficientSpace(output_path, estimated_size, free)
+                self._cond.wait(self.poll_seconds)
+            self._active[device] = self._active.get(device, 0) + 1
+            self._reservations.setdefault(device, {})[token] = (output_path, estimated_size)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[device] -= 1
+                del self._reservations[device][token]
+                self._cond.notify_all()
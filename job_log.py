@@ -0,0 +1,120 @@
+"""Append-only JSON-lines run logs with size-based rotation.
+
+Each finished file adds one line to ``convert.jsonl`` or ``streams.jsonl`` as
+soon as it is recorded, so a crash loses at most the line being written and
+nothing is ever rewritten. When a log grows past its size limit it is
+compressed to ``<name>.<timestamp>.jsonl.gz`` and a new file is started; only
+the newest few archives are kept. :func:`read_history` reads the archives,
+the live file and the ``.json`` list written by older versions back as one
+stream of records, oldest first.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# Size at which a log is compressed and restarted, in MiB.
+LOG_MAX_BYTES = int(os.getenv("THEATRE_LOG_MAX_MB", "8")) * 1024 * 1024
+
+# Compressed archives kept per log; older ones are deleted.
+LOG_KEEP = int(os.getenv("THEATRE_LOG_KEEP", "10"))
+
+
+class JobLog:
+    """One append-only JSONL log, e.g. ``~/Documents/convert.jsonl``."""
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, keep=LOG_KEEP):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, record):
+        """Write ``record`` as one line and flush it to the OS."""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+                if self._file.tell() and not _ends_with_newline(self.path):
+                    # A crash tore the last line; end it so this record is
+                    # not glued to it and lost with it.
+                    self._file.write("\n")
+            self._file.write(line)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def archives(self):
+        """Compressed archives of this log, oldest first."""
+        # Timestamps sort lexically, so name order is age order.
+        return sorted(self.path.parent.glob(f"{self.path.stem}.*{self.path.suffix}.gz"))
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        archive = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}.gz")
+        with open(self.path, "rb") as src, gzip.open(archive, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+        for old in self.archives()[: -self.keep or None] if self.keep else []:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def history(self):
+        """Every record of this log across runs; see :func:`read_history`."""
+        return read_history(self.path)
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _lines(path):
+    opener = gzip.open if path.suffix == ".gz" else open
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            yield from f
+    except OSError:
+        return
+
+
+def _legacy_records(path):
+    """Records from the ``.json`` list that older versions rewrote each run."""
+    try:
+        with open(path.with_suffix(".json"), encoding="utf-8") as f:
+            records = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return records if isinstance(records, list) else []
+
+
+def read_history(path):
+    """Yield the records of the log at ``path`` from all runs, oldest first.
+
+    Torn or unreadable lines (e.g. from a crash mid-write) are skipped.
+    """
+    path = Path(path)
+    yield from _legacy_records(path)
+    for part in JobLog(path).archives() + [path]:
+        for line in _lines(part):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
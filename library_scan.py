@@ -0,0 +1,200 @@
+"""Single-pass folder scan with a per-directory cache.
+
+One ``os.scandir`` walk finds every supported video below a folder, skipping
+the ``converted/`` output folders. Paths are yielded as they are found, so
+front ends can show a large library while it is still being scanned.
+
+The name lists of every directory are cached on disk together with the
+directory's modification time. A directory's mtime changes whenever an entry
+is added, removed or renamed in it, so on a rescan an unchanged directory
+costs one ``stat`` instead of a listing. On a NAS share this turns a
+multi-minute rescan of a big library into seconds. Directories modified
+within :data:`RACY_SECONDS` of being listed are not cached, as a coarse
+filesystem clock could hide a later change.
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+VIDEO_EXTENSIONS = (".mkv", ".mp4")
+
+# Location of the directory cache. Override with THEATRE_SCAN_CACHE.
+SCAN_CACHE_FILE = Path(
+    os.getenv("THEATRE_SCAN_CACHE", Path.home() / ".theatre_gui_scan_cache.json")
+)
+
+# Listings of directories changed this recently are not trusted on rescans
+# (FAT and some SMB servers keep mtimes to 2 seconds).
+RACY_SECONDS = 2.0
+
+# Output folders of the engine, never scanned.
+SKIPPED_DIRS = ("converted",)
+
+
+def is_video(name):
+    return name.lower().endswith(VIDEO_EXTENSIONS)
+
+
+class ScanCache:
+    """Thread-safe JSON store of directory listings keyed on path.
+
+    Each entry is ``[mtime_ns, video names, subdirectory names]``.
+    """
+
+    def __init__(self, path=SCAN_CACHE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, folder):
+        with self._lock:
+            return self._load().get(folder)
+
+    def replace(self, root, listings):
+        """Store ``listings`` as the whole cache for the tree below ``root``.
+
+        Entries of directories that no longer exist under ``root`` are
+        dropped; other trees are left alone.
+        """
+        prefix = os.path.join(root, "")
+        with self._lock:
+            entries = {
+                folder: entry
+                for folder, entry in self._load().items()
+                if folder != root and not folder.startswith(prefix)
+            }
+            entries.update(listings)
+            self._entries = entries
+            tmp = self.path.with_suffix(".tmp")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp.write_text(json.dumps(entries, separators=(",", ":")), encoding="utf-8")
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print("Could not save scan cache:", e, file=sys.stderr)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def default_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ScanCache()
+        return _cache
+
+
+def _list(folder):
+    """``(videos, subdirectories)`` in ``folder``, both sorted by name."""
+    videos = []
+    dirs = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if entry.name not in SKIPPED_DIRS:
+                        dirs.append(entry.name)
+                elif is_video(entry.name) and entry.is_file():
+                    videos.append(entry.name)
+            except OSError:
+                continue
+    return sorted(videos), sorted(dirs)
+
+
+def iter_videos(folder, cache=None, cancelled=None, require_root=True):
+    """Yield every video below ``folder``, walking the tree once.
+
+    Like the GUI always has, nothing is yielded unless the folder itself (not
+    just a subfolder) contains a video; ``require_root=False`` lifts that for
+    folders of season subfolders. The files of each directory come out
+    together in name order, the folder's own first. With a ``cache`` the
+    listings are reused and, once the walk completes, saved back.
+    ``cancelled`` is polled between directories to stop early.
+    """
+    root = os.path.abspath(folder)
+    listings = {}
+    # (st_dev, st_ino) of visited directories, so symlink loops end
+    visited = set()
+    stack = [root]
+    while stack:
+        if cancelled is not None and cancelled():
+            return
+        path = stack.pop()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        key = (stat.st_dev, stat.st_ino)
+        if key in visited:
+            continue
+        visited.add(key)
+        entry = cache.get(path) if cache is not None else None
+        if entry is not None and entry[0] == stat.st_mtime_ns:
+            videos, dirs = entry[1], entry[2]
+        else:
+            try:
+                videos, dirs = _list(path)
+            except OSError:
+                continue
+        if time.time_ns() - stat.st_mtime_ns > RACY_SECONDS * 1e9:
+            listings[path] = [stat.st_mtime_ns, videos, dirs]
+        if require_root and path == root and not videos:
+            return
+        for name in videos:
+            yield os.path.join(path, name)
+        stack.extend(os.path.join(path, name) for name in reversed(dirs))
+    if cache is not None:
+        cache.replace(root, listings)
+
+
+class FolderScan:
+    """Run :func:`iter_videos` on a thread, for front ends that poll.
+
+    Found paths arrive on ``batches`` in lists, at least every ``interval``
+    seconds while the walk finds any; ``None`` follows the last one. The
+    shared :class:`ScanCache` is used unless another ``cache`` is given.
+    """
+
+    def __init__(self, folder, cache=None, interval=0.2):
+        self.folder = folder
+        self.cache = cache or default_cache()
+        self.interval = interval
+        self.batches = queue.Queue()
+        self._cancel = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _run(self):
+        batch = []
+        flushed = time.monotonic()
+        try:
+            for path in iter_videos(self.folder, self.cache, self._cancel.is_set):
+                batch.append(path)
+                if time.monotonic() - flushed >= self.interval:
+                    self.batches.put(batch)
+                    batch = []
+                    flushed = time.monotonic()
+        finally:
+            if batch:
+                self.batches.put(batch)
+            self.batches.put(None)
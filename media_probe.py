@@ -0,0 +1,324 @@
+"""Single-call ffprobe wrapper with a persistent cache.
+
+Every file is probed once with ``-show_streams -show_format`` and the JSON is
+reduced to a compact :class:`MediaInfo` record. Records are kept in a SQLite
+database keyed on path, size and modification time, so reopening a library
+only runs ffprobe for files that are new or have changed. The most recently
+used records are also kept in memory. New rows are committed in chunks, so
+prefetching a large folder does not wait on one disk sync per file.
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+# Flag to prevent opening a console window for subprocesses on Windows.
+CREATE_NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+# Location of the probe cache. Override with THEATRE_PROBE_CACHE.
+PROBE_CACHE_FILE = Path(
+    os.getenv("THEATRE_PROBE_CACHE", Path.home() / ".theatre_gui_probe_cache.sqlite")
+)
+
+# Bump when the shape of MediaInfo changes so stale rows are re-probed.
+CACHE_SCHEMA = 1
+
+# Records kept in memory in front of the database.
+MEMORY_ENTRIES = int(os.getenv("THEATRE_PROBE_MEMORY", "20000"))
+
+# New rows are committed once this many are waiting, or this many seconds
+# after the first of them.
+COMMIT_ROWS = 500
+COMMIT_SECONDS = 1.0
+
+
+class ProbeError(Exception):
+    """Raised when ffprobe cannot read a file."""
+
+
+class StreamInfo(NamedTuple):
+    index: int
+    codec_type: str
+    codec_name: str
+    language: str
+    title: str
+    default: bool
+    forced: bool
+    attached_pic: bool
+    width: Optional[int]
+    height: Optional[int]
+    frame_rate: Optional[float]
+    bit_rate: Optional[int]
+
+
+class MediaInfo(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    duration: Optional[float]
+    bit_rate: Optional[int]
+    format_name: str
+    streams: Tuple[StreamInfo, ...]
+
+    def streams_of(self, codec_type):
+        return [s for s in self.streams if s.codec_type == codec_type]
+
+    @property
+    def video(self):
+        """First real video stream (cover art is ignored), or ``None``."""
+        for stream in self.streams:
+            if stream.codec_type == "video" and not stream.attached_pic:
+                return stream
+        return None
+
+    @property
+    def video_codec(self):
+        video = self.video
+        return video.codec_name if video else None
+
+    @property
+    def audio_streams(self):
+        return self.streams_of("audio")
+
+    @property
+    def subtitle_streams(self):
+        return self.streams_of("subtitle")
+
+    def to_json(self):
+        data = self._asdict()
+        data["streams"] = [list(s) for s in self.streams]
+        return json.dumps(data, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        data["streams"] = tuple(StreamInfo(*s) for s in data["streams"])
+        return cls(**data)
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(value):
+    """Convert an ffprobe rate such as ``24000/1001`` to frames per second."""
+    try:
+        num, _, den = value.partition("/")
+        rate = float(num) / float(den or 1)
+    except (AttributeError, ValueError, ZeroDivisionError):
+        return None
+    return rate or None
+
+
+def parse_probe_output(path, size, mtime_ns, data):
+    """Build a :class:`MediaInfo` from ffprobe's JSON output."""
+    streams = []
+    for stream in data.get("streams", []):
+        tags = stream.get("tags", {})
+        disposition = stream.get("disposition", {})
+        streams.append(
+            StreamInfo(
+                index=stream.get("index"),
+                codec_type=stream.get("codec_type", ""),
+                codec_name=(stream.get("codec_name") or "").lower(),
+                language=tags.get("language", "und"),
+                title=tags.get("title", ""),
+                default=bool(disposition.get("default")),
+                forced=bool(disposition.get("forced")),
+                attached_pic=bool(disposition.get("attached_pic")),
+                width=_int_or_none(stream.get("width")),
+                height=_int_or_none(stream.get("height")),
+                frame_rate=_frame_rate(stream.get("avg_frame_rate")),
+                bit_rate=_int_or_none(stream.get("bit_rate")),
+            )
+        )
+    fmt = data.get("format", {})
+    return MediaInfo(
+        path=str(path),
+        size=size,
+        mtime_ns=mtime_ns,
+        duration=_float_or_none(fmt.get("duration")),
+        bit_rate=_int_or_none(fmt.get("bit_rate")),
+        format_name=fmt.get("format_name", ""),
+        streams=tuple(streams),
+    )
+
+
+def run_probe(path, stat=None):
+    """Probe ``path`` with a single ffprobe call.
+
+    Raises ``FileNotFoundError`` if ffprobe is not installed and
+    :class:`ProbeError` if the file cannot be read.
+    """
+    stat = stat or os.stat(path)
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_streams",
+            "-show_format",
+            "-of",
+            "json",
+            str(path),
+        ],
+        capture_output=True,
+        text=True,
+        creationflags=CREATE_NO_WINDOW,
+    )
+    if result.returncode != 0:
+        raise ProbeError(f"ffprobe failed for {path}: {result.stderr.strip()}")
+    try:
+        data = json.loads(result.stdout)
+    except ValueError as e:
+        raise ProbeError(f"ffprobe returned invalid JSON for {path}") from e
+    return parse_probe_output(path, stat.st_size, stat.st_mtime_ns, data)
+
+
+class ProbeCache:
+    """Thread-safe memory + SQLite cache of :class:`MediaInfo` records.
+
+    The memory side holds the ``memory_entries`` most recently used records.
+    """
+
+    def __init__(self, db_path=PROBE_CACHE_FILE, memory_entries=MEMORY_ENTRIES):
+        self.db_path = Path(db_path)
+        self.memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self._db = None
+        self._uncommitted = 0
+        self._commit_timer = None
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS probes ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " schema INTEGER NOT NULL,"
+                " info TEXT NOT NULL)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            # The cache is an optimisation; fall back to memory only.
+            print(f"Probe cache unavailable ({self.db_path}):", e, file=sys.stderr)
+            self._db = None
+
+    def get(self, path, stat=None):
+        """Return the cached record for ``path`` if it is still current."""
+        path = str(path)
+        stat = stat or os.stat(path)
+        with self._lock:
+            info = self._memory.get(path)
+            if info is not None:
+                self._memory.move_to_end(path)
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT info FROM probes WHERE path = ? AND size = ?"
+                    " AND mtime_ns = ? AND schema = ?",
+                    (path, stat.st_size, stat.st_mtime_ns, CACHE_SCHEMA),
+                ).fetchone()
+                if row:
+                    info = MediaInfo.from_json(row[0])
+                    self._remember(info)
+        if info is None or info.size != stat.st_size or info.mtime_ns != stat.st_mtime_ns:
+            return None
+        return info
+
+    def _remember(self, info):
+        self._memory[info.path] = info
+        self._memory.move_to_end(info.path)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _commit(self):
+        if self._commit_timer is not None:
+            self._commit_timer.cancel()
+            self._commit_timer = None
+        self._db.commit()
+        self._uncommitted = 0
+
+    def put(self, info):
+        with self._lock:
+            self._remember(info)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)",
+                (info.path, info.size, info.mtime_ns, CACHE_SCHEMA, info.to_json()),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= COMMIT_ROWS:
+                self._commit()
+            elif self._commit_timer is None:
+                # Never hold the write lock for long; other processes share the file.
+                self._commit_timer = threading.Timer(COMMIT_SECONDS, self.flush)
+                self._commit_timer.daemon = True
+                self._commit_timer.start()
+
+    def flush(self):
+        """Commit the rows written since the last commit."""
+        with self._lock:
+            if self._db is not None:
+                self._commit()
+
+    def probe(self, path):
+        """Return a record for ``path``, running ffprobe only on a cache miss."""
+        stat = os.stat(path)
+        info = self.get(path, stat)
+        if info is None:
+            info = run_probe(path, stat)
+            self.put(info)
+        return info
+
+    def move(self, src, dst):
+        """Re-key a record after ``src`` was renamed to ``dst``.
+
+        A rename keeps size and mtime, so the record stays valid as long as
+        the destination still matches it.
+        """
+        src, dst = str(src), str(dst)
+        with self._lock:
+            info = self._memory.pop(src, None)
+            if info is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT info FROM probes WHERE path = ? AND schema = ?",
+                    (src, CACHE_SCHEMA),
+                ).fetchone()
+                info = MediaInfo.from_json(row[0]) if row else None
+            if self._db is not None:
+                self._db.execute("DELETE FROM probes WHERE path IN (?, ?)", (src, dst))
+                self._commit()
+        if info is None:
+            return
+        try:
+            stat = os.stat(dst)
+        except OSError:
+            return
+        if stat.st_size == info.size and stat.st_mtime_ns == info.mtime_ns:
+            self.put(info._replace(path=dst))
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._commit()
+                self._db.close()
+                self._db = None
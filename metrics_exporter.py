@@ -0,0 +1,289 @@
+"""Batched InfluxDB export of job and progress metrics.
+
+Points are turned into line protocol and appended to an in-memory buffer, so
+recording one never waits on the network. A background thread writes the
+buffer to the InfluxDB v2 ``/api/v2/write`` endpoint when a batch fills up or
+every few seconds. When the server cannot be reached, batches are moved to a
+size-capped spool file that is replayed, oldest first, once writes succeed
+again. Retries back off exponentially.
+
+Export is off unless ``INFLUXDB_URL`` is set.
+"""
+
+import collections
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+# InfluxDB configuration, from the environment. Metrics are only exported
+# when INFLUXDB_URL is set; the token is never stored in the source.
+INFLUXDB_URL = os.getenv("INFLUXDB_URL", "")
+INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN", "")
+INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "Waterfall")
+INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET", "Video_Update")
+
+# Points per write request, and the longest a point waits before being sent.
+BATCH_SIZE = int(os.getenv("THEATRE_METRICS_BATCH", "500"))
+FLUSH_SECONDS = float(os.getenv("THEATRE_METRICS_FLUSH_SECONDS", "5"))
+
+# Points held in memory; the oldest are dropped beyond this.
+MAX_BUFFERED = 20000
+
+# Where unsent batches go while the server is down, and its size cap.
+SPOOL_FILE = Path(
+    os.getenv("THEATRE_METRICS_SPOOL", Path.home() / ".theatre_gui_metrics_spool.lp")
+)
+SPOOL_MAX_BYTES = int(os.getenv("THEATRE_METRICS_SPOOL_MB", "16")) * 1024 * 1024
+
+MAX_BACKOFF_SECONDS = 300
+REQUEST_TIMEOUT = 10
+
+# How long close() waits for the final write: one request, then spooling.
+CLOSE_TIMEOUT = REQUEST_TIMEOUT + 5
+
+
+def _escape(value, chars):
+    value = str(value).replace("\\", "\\\\")
+    for char in chars:
+        value = value.replace(char, "\\" + char)
+    return value.replace("\n", "\\n")
+
+
+def _field_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def format_line(measurement, tags, fields, timestamp_ns=None):
+    """Encode one point as InfluxDB line protocol, or ``None`` if it has no fields.
+
+    Tags and fields whose value is ``None`` (or an empty tag) are left out.
+    """
+    field_text = ",".join(
+        f"{_escape(key, ',= ')}={_field_value(value)}"
+        for key, value in sorted(fields.items())
+        if value is not None
+    )
+    if not field_text:
+        return None
+    tag_text = "".join(
+        f",{_escape(key, ',= ')}={_escape(value, ',= ')}"
+        for key, value in sorted(tags.items())
+        if value not in (None, "")
+    )
+    if timestamp_ns is None:
+        timestamp_ns = time.time_ns()
+    return f"{_escape(measurement, ', ')}{tag_text} {field_text} {timestamp_ns}"
+
+
+class _Rejected(Exception):
+    """The server refused the data itself; resending will not help."""
+
+
+class MetricsExporter:
+    """Buffer points and write them to InfluxDB from a background thread."""
+
+    def __init__(
+        self,
+        url=INFLUXDB_URL,
+        token=INFLUXDB_TOKEN,
+        org=INFLUXDB_ORG,
+        bucket=INFLUXDB_BUCKET,
+        batch_size=BATCH_SIZE,
+        flush_seconds=FLUSH_SECONDS,
+        spool_path=SPOOL_FILE,
+        spool_max_bytes=SPOOL_MAX_BYTES,
+    ):
+        query = urllib.parse.urlencode({"org": org, "bucket": bucket, "precision": "ns"})
+        self.write_url = f"{url.rstrip('/')}/api/v2/write?{query}"
+        self.token = token
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.spool_path = Path(spool_path)
+        self.spool_max_bytes = spool_max_bytes
+        self.host = socket.gethostname()
+        self._buffer = collections.deque(maxlen=MAX_BUFFERED)
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, measurement, tags=None, fields=None, timestamp_ns=None):
+        """Queue one point; never blocks on the network."""
+        tags = {"host": self.host, **(tags or {})}
+        line = format_line(measurement, tags, fields or {}, timestamp_ns)
+        if line is None:
+            return
+        with self._lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Send what is buffered (or spool it) and stop the thread."""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _take(self):
+        with self._lock:
+            count = min(len(self._buffer), self.batch_size)
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def _spool_buffer(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            self._spool(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            if time.monotonic() < self._retry_at:
+                # Server is down: keep memory flat by moving points to disk.
+                self._spool_buffer()
+                continue
+            self._flush()
+        # Final pass: one attempt unless backing off; the rest is spooled.
+        if time.monotonic() >= self._retry_at:
+            self._flush()
+        self._spool_buffer()
+
+    def _flush(self):
+        """Send the buffer, then the spool, stopping at the first failure."""
+        while True:
+            batch = self._take()
+            if not batch:
+                break
+            if not self._send_or_spool(batch):
+                return
+        self._replay_spool()
+
+    def _send_or_spool(self, batch):
+        try:
+            self._write(batch)
+        except _Rejected as e:
+            print("InfluxDB rejected metrics:", e, file=sys.stderr)
+            return True
+        except OSError as e:
+            self._spool(batch)
+            self._failed(e)
+            return False
+        self._backoff = 0.0
+        return True
+
+    def _failed(self, error):
+        self._backoff = min(max(self._backoff * 2, self.flush_seconds), MAX_BACKOFF_SECONDS)
+        self._retry_at = time.monotonic() + self._backoff
+        print(
+            f"InfluxDB unreachable, spooling metrics (retry in {self._backoff:.0f}s):",
+            error,
+            file=sys.stderr,
+        )
+
+    def _write(self, lines):
+        request = urllib.request.Request(
+            self.write_url,
+            data="\n".join(lines).encode("utf-8"),
+            method="POST",
+            headers={
+                "Authorization": f"Token {self.token}",
+                "Content-Type": "text/plain; charset=utf-8",
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT):
+                pass
+        except urllib.error.HTTPError as e:
+            # 429 and 5xx are temporary; other errors mean bad data or config.
+            if e.code == 429 or e.code >= 500:
+                raise
+            raise _Rejected(f"HTTP {e.code}: {e.read(200).decode('utf-8', 'replace')}") from e
+
+    def _spool(self, lines):
+        """Append ``lines`` to the spool file, keeping only the newest data."""
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with self._spool_lock:
+            try:
+                self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.spool_path, "ab") as f:
+                    f.write(data)
+                if self.spool_path.stat().st_size > self.spool_max_bytes:
+                    self._trim_spool()
+            except OSError as e:
+                print("Could not spool metrics:", e, file=sys.stderr)
+
+    def _trim_spool(self):
+        with open(self.spool_path, "rb") as f:
+            f.seek(-self.spool_max_bytes // 2, os.SEEK_END)
+            tail = f.read()
+        # Drop the partial first line so only whole points are kept.
+        tail = tail[tail.find(b"\n") + 1:]
+        tmp = self.spool_path.with_suffix(".tmp")
+        tmp.write_bytes(tail)
+        os.replace(tmp, self.spool_path)
+
+    def _replay_spool(self):
+        """Resend the spool, oldest first.
+
+        The spool is renamed aside while it is sent and the copy is deleted
+        only once every line in it was acknowledged, so a failure or crash
+        part way keeps the unsent points for the next replay.
+        """
+        replay = self.spool_path.with_suffix(".replay")
+        while True:
+            with self._spool_lock:
+                try:
+                    if not replay.exists():
+                        os.replace(self.spool_path, replay)
+                    lines = replay.read_text(encoding="utf-8").splitlines()
+                except OSError:
+                    return
+            for start in range(0, len(lines), self.batch_size):
+                try:
+                    self._write(lines[start:start + self.batch_size])
+                except _Rejected as e:
+                    print("InfluxDB rejected spooled metrics:", e, file=sys.stderr)
+                except OSError as e:
+                    self._keep_unsent(replay, lines[start:])
+                    self._failed(e)
+                    return
+            try:
+                replay.unlink()
+            except OSError as e:
+                print("Could not remove replayed metrics:", e, file=sys.stderr)
+                return
+
+    def _keep_unsent(self, replay, lines):
+        tmp = replay.with_suffix(".tmp")
+        try:
+            tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            os.replace(tmp, replay)
+        except OSError as e:
+            # The whole copy stays; resent points overwrite their first copy.
+            print("Could not trim replayed metrics:", e, file=sys.stderr)
+
+
+def exporter_from_env():
+    """Exporter for the configured server, or ``None`` if export is disabled."""
+    if not INFLUXDB_URL:
+        return None
+    return MetricsExporter()
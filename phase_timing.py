@@ -0,0 +1,186 @@
+"""Per-file phase timing and optional profiling for batches.
+
+A :class:`PhaseTimer` collects how long each file spends in each phase
+(queue, probe, sample, wait, encode, verify, commit) plus batch-wide phases such as
+GUI repaints. The per-file records and a summary with the encode speed factor
+and throughput are written to ``timings.json`` next to ``convert.jsonl``.
+
+Two opt-in hooks help dig deeper:
+
+* ``THEATRE_PROFILE=1`` runs every job under :mod:`cProfile` and writes the
+  merged statistics to ``theatre_profile.pstats``.
+* ``THEATRE_TRACE=1`` writes the phase spans as a Chrome trace
+  (``timings.trace.json``) that can be opened in Perfetto or chrome://tracing.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+
+PROFILE_JOBS = os.getenv("THEATRE_PROFILE", "") not in ("", "0")
+WRITE_TRACE = os.getenv("THEATRE_TRACE", "") not in ("", "0")
+
+# Per-file phases in the order they happen.
+PHASES = ("queue", "probe", "sample", "wait", "encode", "verify", "commit")
+
+# Spans kept for the trace; later ones are dropped.
+MAX_SPANS = 100000
+
+
+class PhaseTimer:
+    """Thread-safe accumulator of phase durations for one batch."""
+
+    def __init__(self, profile=PROFILE_JOBS):
+        self.started = time.monotonic()
+        self.finished = None
+        self._lock = threading.Lock()
+        self._files = {}
+        self._batch = {}
+        self._spans = []
+        self._profile = profile
+        self._stats = None
+
+    def _file(self, input_file):
+        return self._files.setdefault(input_file, {"phases": {}})
+
+    def add(self, input_file, name, seconds, start=None):
+        """Add ``seconds`` to phase ``name`` of ``input_file`` (``None`` for the batch)."""
+        with self._lock:
+            phases = self._batch if input_file is None else self._file(input_file)["phases"]
+            phases[name] = phases.get(name, 0.0) + seconds
+            if start is not None and len(self._spans) < MAX_SPANS:
+                self._spans.append(
+                    (input_file, name, start, seconds, threading.get_ident())
+                )
+
+    @contextlib.contextmanager
+    def phase(self, input_file, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(input_file, name, time.monotonic() - start, start)
+
+    def note(self, input_file, **values):
+        """Attach values such as ``duration`` or ``after_size`` to a file."""
+        with self._lock:
+            self._file(input_file).update(
+                {key: value for key, value in values.items() if value is not None}
+            )
+
+    @contextlib.contextmanager
+    def profiled(self):
+        """Profile the calling thread if profiling is enabled."""
+        if not self._profile:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def records(self):
+        """Per-file dicts with the phase times, speed factor and throughput."""
+        with self._lock:
+            files = {path: dict(data, phases=dict(data["phases"])) for path, data in self._files.items()}
+        records = []
+        for path, data in sorted(files.items()):
+            encode = data["phases"].get("encode")
+            record = {"file": path, **data}
+            if encode:
+                if data.get("duration"):
+                    record["speed_factor"] = round(data["duration"] / encode, 3)
+                if data.get("before_size"):
+                    record["read_bytes_per_sec"] = int(data["before_size"] / encode)
+                if data.get("after_size"):
+                    record["write_bytes_per_sec"] = int(data["after_size"] / encode)
+            records.append(record)
+        return records
+
+    def summary(self):
+        """Batch totals: wall time, seconds per phase, speed and throughput."""
+        records = self.records()
+        totals = {}
+        for record in records:
+            for name, seconds in record["phases"].items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        with self._lock:
+            batch = dict(self._batch)
+        encode = totals.get("encode", 0.0)
+        media = sum(r.get("duration", 0.0) for r in records if "encode" in r["phases"])
+        read = sum(r.get("before_size", 0) for r in records if "encode" in r["phases"])
+        end = self.finished or time.monotonic()
+        summary = {
+            "files": len(records),
+            "wall_seconds": round(end - self.started, 3),
+            "phase_seconds": {name: round(s, 3) for name, s in totals.items()},
+            "batch_seconds": {name: round(s, 3) for name, s in batch.items()},
+        }
+        if encode:
+            summary["speed_factor"] = round(media / encode, 3) if media else None
+            summary["read_bytes_per_sec"] = int(read / encode) if read else None
+        slowest = sorted(records, key=lambda r: -sum(r["phases"].values()))[:5]
+        summary["slowest"] = [
+            {"file": r["file"], "seconds": round(sum(r["phases"].values()), 3)} for r in slowest
+        ]
+        return summary
+
+    def write(self, log_dir, name="timings"):
+        """Write ``<name>.json`` (and the trace/profile when enabled) to ``log_dir``."""
+        log_dir.mkdir(parents=True, exist_ok=True)
+        with open(log_dir / f"{name}.json", "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "files": self.records()}, f, indent=2)
+        if WRITE_TRACE:
+            self._write_trace(log_dir / f"{name}.trace.json")
+        with self._lock:
+            stats = self._stats
+        if stats is not None:
+            stats.dump_stats(str(log_dir / "theatre_profile.pstats"))
+
+    def _write_trace(self, path):
+        with self._lock:
+            spans = list(self._spans)
+        events = [
+            {
+                "name": name,
+                "cat": "batch" if input_file is None else "file",
+                "ph": "X",
+                "ts": int((start - self.started) * 1e6),
+                "dur": int(seconds * 1e6),
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"file": input_file},
+            }
+            for input_file, name, start, seconds, tid in spans
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events}, f)
+
+
+def format_summary(summary):
+    """One-line human summary of :meth:`PhaseTimer.summary`."""
+    phases = summary["phase_seconds"]
+    parts = [f"{name} {phases[name]:.1f}s" for name in PHASES if name in phases]
+    parts += [f"{name} {s:.1f}s" for name, s in summary["batch_seconds"].items()]
+    text = f"{summary['files']} file(s) in {summary['wall_seconds']:.1f}s"
+    if parts:
+        text += ": " + ", ".join(parts)
+    if summary.get("speed_factor"):
+        text += f"; {summary['speed_factor']:.2f}x realtime"
+    if summary.get("read_bytes_per_sec"):
+        text += f", {summary['read_bytes_per_sec'] / (1024 * 1024):.1f} MiB/s read"
+    return text
@@ -0,0 +1,183 @@
+"""Persistent record of files that no longer need converting.
+
+Each entry is keyed on path, size and modification time (and optionally a
+quick hash of the first and last blocks) and stores the outcome, codec and
+output size. Re-running a batch filters the work list against the manifest
+before any ffprobe or ffmpeg process is started.
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+# Location of the manifest. Override with THEATRE_MANIFEST.
+MANIFEST_FILE = Path(
+    os.getenv("THEATRE_MANIFEST", Path.home() / ".theatre_gui_manifest.sqlite")
+)
+
+# Set THEATRE_MANIFEST_HASH=1 to also compare a partial content hash.
+USE_PARTIAL_HASH = os.getenv("THEATRE_MANIFEST_HASH", "") not in ("", "0")
+
+# Codecs that mean a file is finished as far as conversion is concerned.
+FINISHED_CODECS = ("hevc", "av1")
+
+HASH_BLOCK = 64 * 1024
+
+
+class ManifestEntry(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    partial_hash: Optional[str]
+    outcome: str
+    codec: Optional[str]
+    output_size: Optional[int]
+    updated: float
+
+    @property
+    def finished(self):
+        return self.outcome in ("skipped", "committed") and self.codec in FINISHED_CODECS
+
+
+def partial_hash(path, size=None):
+    """Hash the size plus the first and last 64 KiB of ``path``."""
+    size = os.path.getsize(path) if size is None else size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        digest.update(f.read(HASH_BLOCK))
+        if size > HASH_BLOCK:
+            f.seek(max(size - HASH_BLOCK, HASH_BLOCK))
+            digest.update(f.read(HASH_BLOCK))
+    return digest.hexdigest()
+
+
+class ProcessedManifest:
+    """Thread-safe SQLite store of :class:`ManifestEntry` rows."""
+
+    def __init__(self, db_path=MANIFEST_FILE, use_hash=USE_PARTIAL_HASH):
+        self.db_path = Path(db_path)
+        self.use_hash = use_hash
+        self._lock = threading.Lock()
+        self._db = None
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS manifest ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " partial_hash TEXT,"
+                " outcome TEXT NOT NULL,"
+                " codec TEXT,"
+                " output_size INTEGER,"
+                " updated REAL NOT NULL)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Processed-file manifest unavailable ({self.db_path}):", e, file=sys.stderr)
+            self._db = None
+
+    def _rows(self, paths):
+        """Fetch the stored entries for ``paths`` in a few bulk queries."""
+        entries = {}
+        paths = list(paths)
+        with self._lock:
+            if self._db is None:
+                return entries
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                for row in self._db.execute(
+                    f"SELECT * FROM manifest WHERE path IN ({marks})", chunk
+                ):
+                    entries[row[0]] = ManifestEntry(*row)
+        return entries
+
+    def _is_current(self, entry, path, stat):
+        if entry.size != stat.st_size or entry.mtime_ns != stat.st_mtime_ns:
+            return False
+        if self.use_hash and entry.partial_hash:
+            return entry.partial_hash == partial_hash(path, stat.st_size)
+        return True
+
+    def lookup(self, path, stat=None):
+        """Return the entry for ``path`` if the file has not changed since."""
+        path = str(path)
+        entry = self._rows([path]).get(path)
+        if entry is None:
+            return None
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return None
+        return entry if self._is_current(entry, path, stat) else None
+
+    def filter_pending(self, paths):
+        """Split ``paths`` into ``(pending, finished_entries)``."""
+        paths = [str(p) for p in paths]
+        entries = self._rows(paths)
+        pending = []
+        finished = []
+        for path in paths:
+            entry = entries.get(path)
+            if entry is not None and entry.finished:
+                try:
+                    if self._is_current(entry, path, os.stat(path)):
+                        finished.append(entry)
+                        continue
+                except OSError:
+                    pass
+            pending.append(path)
+        return pending, finished
+
+    def record(self, path, outcome, codec=None, output_size=None):
+        """Store the outcome for ``path`` against its current size and mtime."""
+        path = str(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        digest = partial_hash(path, stat.st_size) if self.use_hash else None
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    digest,
+                    outcome,
+                    codec,
+                    output_size,
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def move(self, src, dst):
+        """Re-key the entry of ``src`` after it was renamed to ``dst``.
+
+        A rename keeps size and mtime, so the entry stays current.
+        """
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute("DELETE FROM manifest WHERE path = ?", (str(dst),))
+            self._db.execute(
+                "UPDATE manifest SET path = ? WHERE path = ?", (str(dst), str(src))
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
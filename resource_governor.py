@@ -0,0 +1,328 @@
+"""Keep batch encodes from starving other programs on the same machine.
+
+Every ffmpeg process a batch starts gets the :data:`POLICY` from the
+environment:
+
+* ``THEATRE_NICE`` – CPU niceness (10 by default; 0 leaves it alone). On
+  Windows any positive value starts ffmpeg below normal priority, and 19
+  starts it at idle priority.
+* ``THEATRE_IONICE`` – I/O class: ``best-effort`` (default, with
+  ``THEATRE_IONICE_LEVEL`` 0-7, by default 7, the lowest), ``idle`` or
+  ``none``. Linux only. ``idle`` only gets the disk when nothing else wants
+  it, so a busy disk can stall encodes for good; it is not the default.
+* ``THEATRE_AFFINITY`` – CPUs the encoders may use, e.g. ``2-7,10``. Linux
+  only. Encoder threads are shared out over these CPUs.
+* ``THEATRE_ENCODER_THREADS`` – thread cap per encoder, e.g.
+  ``libx265=4,libsvtav1=6``, or a single number for every encoder.
+
+While a batch runs, a :class:`Governor` thread checks the machine every
+:data:`GOVERN_SECONDS`. :class:`AdaptiveSlots` admits fewer encodes when the
+load average is above ``THEATRE_MAX_LOAD`` or free memory falls below
+``THEATRE_MIN_FREE_MB``, and more again once the pressure is gone. Running
+encodes are never cut short. The batch's own encodes count towards the load,
+so ``THEATRE_MAX_LOAD`` has to be set above what the batch alone produces.
+Both limits are off (0) by default. During the ``THEATRE_PAUSE_HOURS`` windows (e.g.
+``18:00-23:30``), running ffmpeg processes are suspended (SIGSTOP, or
+NtSuspendProcess on Windows) and resumed afterwards. Front ends can pause and
+resume a batch the same way.
+"""
+
+import contextlib
+import ctypes
+import os
+import platform
+import signal
+import subprocess
+import sys
+import threading
+from datetime import datetime
+from typing import NamedTuple, Tuple
+
+NICE_LEVEL = int(os.getenv("THEATRE_NICE", "10"))
+IONICE_CLASS = os.getenv("THEATRE_IONICE", "best-effort")
+IONICE_LEVEL = int(os.getenv("THEATRE_IONICE_LEVEL", "7"))
+AFFINITY = os.getenv("THEATRE_AFFINITY", "")
+ENCODER_THREADS = os.getenv("THEATRE_ENCODER_THREADS", "")
+
+# Load average (1 minute) above which fewer encodes are admitted; 0 is off.
+MAX_LOAD = float(os.getenv("THEATRE_MAX_LOAD", "0"))
+
+# Free memory in MiB below which fewer encodes are admitted; 0 is off.
+MIN_FREE_MB = int(os.getenv("THEATRE_MIN_FREE_MB", "0"))
+
+# Local times during which batches are paused, e.g. "18:00-23:30,07:00-08:00".
+PAUSE_HOURS = os.getenv("THEATRE_PAUSE_HOURS", "")
+
+# Seconds between checks of the load, memory and pause schedule.
+GOVERN_SECONDS = float(os.getenv("THEATRE_GOVERN_INTERVAL", "15"))
+
+# Pressure must fall below this share of a limit before slots are added back.
+RECOVERY = 0.8
+
+IONICE_CLASSES = {"none": 0, "best-effort": 2, "idle": 3}
+
+# ioprio_set syscall numbers per architecture (there is no libc wrapper).
+IOPRIO_SET = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "armv7l": 314}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+
+PROCESS_SUSPEND_RESUME = 0x0800
+
+
+def parse_cpus(text):
+    """CPU numbers from a list like ``0-3,8``; empty for all CPUs."""
+    cpus = set()
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return tuple(sorted(cpus))
+
+
+def parse_thread_caps(text):
+    """``{encoder: threads}`` from ``libx265=4,...``; a bare number is ``"*"``."""
+    caps = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, _, value = part.rpartition("=")
+        caps[name.strip() or "*"] = int(value)
+    return caps
+
+
+def parse_windows(text):
+    """``[(start_minute, end_minute)]`` from ``HH:MM-HH:MM,...``."""
+    windows = []
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        start, _, end = part.partition("-")
+        minutes = []
+        for clock in (start, end):
+            hours, _, mins = clock.strip().partition(":")
+            minutes.append(int(hours) * 60 + int(mins or 0))
+        windows.append(tuple(minutes))
+    return windows
+
+
+def in_windows(windows, now):
+    """True if ``now`` falls in any window; windows may span midnight."""
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        if start <= end:
+            if start <= minute < end:
+                return True
+        elif minute >= start or minute < end:
+            return True
+    return False
+
+
+class ResourcePolicy(NamedTuple):
+    nice: int
+    ionice_class: str
+    ionice_level: int
+    cpus: Tuple[int, ...]
+    thread_caps: dict
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            NICE_LEVEL,
+            IONICE_CLASS,
+            IONICE_LEVEL,
+            parse_cpus(AFFINITY),
+            parse_thread_caps(ENCODER_THREADS),
+        )
+
+    def creationflags(self):
+        """Windows priority class for new processes (0 elsewhere)."""
+        if sys.platform != "win32" or self.nice <= 0:
+            return 0
+        if self.nice >= 19:
+            return subprocess.IDLE_PRIORITY_CLASS
+        return subprocess.BELOW_NORMAL_PRIORITY_CLASS
+
+    def cpu_threads(self, workers):
+        """Encoder threads per job when ``workers`` jobs share the allowed CPUs."""
+        cpus = len(self.cpus) or os.cpu_count() or 1
+        return max(1, cpus // max(1, workers))
+
+    def encoder_threads(self, encoder, threads):
+        """``threads`` limited by the cap for ``encoder``, if one is set."""
+        cap = self.thread_caps.get(encoder, self.thread_caps.get("*"))
+        if not cap:
+            return threads
+        return min(threads, cap) if threads else cap
+
+    def apply(self, pid):
+        """Apply niceness, I/O class and affinity to every thread of ``pid``.
+
+        Linux keeps these per thread, so threads that already exist are set
+        one by one; threads started later inherit from the main thread.
+        Failures are ignored: the policy only protects other programs.
+        """
+        if sys.platform == "win32":
+            return
+        for tid in _threads(pid):
+            if self.nice > 0:
+                with contextlib.suppress(OSError, AttributeError):
+                    os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+            if IONICE_CLASSES.get(self.ionice_class):
+                _set_ioprio(tid, IONICE_CLASSES[self.ionice_class], self.ionice_level)
+            if self.cpus:
+                with contextlib.suppress(OSError, AttributeError):
+                    os.sched_setaffinity(tid, self.cpus)
+
+
+def _threads(pid):
+    try:
+        return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except OSError:
+        return [pid]
+
+
+_libc = None
+
+
+def _set_ioprio(tid, ioclass, level):
+    global _libc
+    number = IOPRIO_SET.get(platform.machine())
+    if not sys.platform.startswith("linux") or number is None:
+        return
+    with contextlib.suppress(OSError, AttributeError):
+        if _libc is None:
+            _libc = ctypes.CDLL(None, use_errno=True)
+        level = level if ioclass == IONICE_CLASSES["best-effort"] else 0
+        _libc.syscall(number, IOPRIO_WHO_PROCESS, tid, (ioclass << IOPRIO_CLASS_SHIFT) | level)
+
+
+POLICY = ResourcePolicy.from_env()
+
+
+def suspend(process):
+    """Stop ``process`` until :func:`resume`; ``False`` if that failed."""
+    return _signal(process, "NtSuspendProcess", getattr(signal, "SIGSTOP", None))
+
+
+def resume(process):
+    return _signal(process, "NtResumeProcess", getattr(signal, "SIGCONT", None))
+
+
+def _signal(process, nt_call, signum):
+    if process.poll() is not None:
+        return False
+    try:
+        if sys.platform == "win32":
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(PROCESS_SUSPEND_RESUME, False, process.pid)
+            if not handle:
+                return False
+            try:
+                return getattr(ctypes.windll.ntdll, nt_call)(handle) == 0
+            finally:
+                kernel32.CloseHandle(handle)
+        os.kill(process.pid, signum)
+        return True
+    except OSError:
+        return False
+
+
+def _load_average():
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def _free_mb():
+    """``MemAvailable`` from ``/proc/meminfo``, or ``None`` elsewhere."""
+    try:
+        with open("/proc/meminfo", encoding="ascii") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class AdaptiveSlots:
+    """Encoder slots, like a semaphore whose size follows system pressure.
+
+    Holds at most ``workers`` slots; :meth:`adjust` moves the limit by one
+    step at a time between 1 and ``workers``.
+    """
+
+    def __init__(self, workers, max_load=MAX_LOAD, min_free_mb=MIN_FREE_MB):
+        self.workers = max(1, workers)
+        self.limit = self.workers
+        self.max_load = max_load
+        self.min_free_mb = min_free_mb
+        self._active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def adjust(self, load=None, free_mb=None):
+        """Re-evaluate the limit; returns it if it changed, else ``None``."""
+        load = _load_average() if load is None and self.max_load else load
+        free_mb = _free_mb() if free_mb is None and self.min_free_mb else free_mb
+        pressed = (self.max_load and load is not None and load > self.max_load) or (
+            self.min_free_mb and free_mb is not None and free_mb < self.min_free_mb
+        )
+        relaxed = (not self.max_load or load is None or load < self.max_load * RECOVERY) and (
+            not self.min_free_mb or free_mb is None or free_mb > self.min_free_mb / RECOVERY
+        )
+        with self._cond:
+            old = self.limit
+            if pressed:
+                self.limit = max(1, self.limit - 1)
+            elif relaxed:
+                self.limit = min(self.workers, self.limit + 1)
+            if self.limit == old:
+                return None
+            self._cond.notify_all()
+            return self.limit
+
+
+class Governor:
+    """Background thread applying slot limits and the pause schedule to a runner."""
+
+    def __init__(self, runner, slots=None, pause_hours=PAUSE_HOURS, interval=GOVERN_SECONDS):
+        self.runner = runner
+        self.slots = slots
+        self.windows = parse_windows(pause_hours)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._scheduled = False
+
+    def start(self):
+        if self.slots is not None or self.windows:
+            threading.Thread(target=self._loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self, now=None):
+        if self.slots is not None:
+            limit = self.slots.adjust()
+            if limit is not None:
+                print(f"Encoder slots now {limit} of {self.slots.workers}", file=sys.stderr)
+        if self.windows:
+            due = in_windows(self.windows, now or datetime.now())
+            if due and not self._scheduled:
+                self._scheduled = True
+                self.runner.pause()
+            elif not due and self._scheduled:
+                self._scheduled = False
+                self.runner.resume()
+
+    def _loop(self):
+        self.check()
+        while not self._stop.wait(self.interval):
+            self.check()
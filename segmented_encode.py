@@ -0,0 +1,215 @@
+"""Split-and-stitch encoding of a single long file.
+
+The main video stream is cut into segments with the segment muxer (stream
+copy, so every cut lands on a keyframe at or after the requested time), the
+segments are encoded in parallel and then joined with the concat demuxer.
+A final stream-copy pass adds back every other stream, in the original's
+order, and the chapters and metadata, matching the ``-map 0`` /
+``-map_chapters 0`` output of a normal conversion.
+"""
+
+import csv
+import math
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_runner import run_ffmpeg
+
+# Files at least this long are split when segmented mode is enabled.
+SEGMENT_MIN_DURATION = float(os.getenv("THEATRE_SEGMENT_MIN_DURATION", 20 * 60))
+
+# Target length of each segment in seconds.
+SEGMENT_SECONDS = float(os.getenv("THEATRE_SEGMENT_SECONDS", 180))
+
+
+def plan_cut_times(duration, segment_seconds=SEGMENT_SECONDS):
+    """Evenly spaced cut points that split ``duration`` into segments."""
+    parts = max(1, math.ceil(duration / segment_seconds))
+    step = duration / parts
+    return [round(step * i, 3) for i in range(1, parts)]
+
+
+def _read_segment_list(path):
+    """Return ``(filename, duration)`` pairs from a csv segment list."""
+    segments = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) >= 3:
+                segments.append((row[0], float(row[2]) - float(row[1])))
+    return segments
+
+
+class _SegmentProgress:
+    """Combine per-segment progress into one event for the whole file."""
+
+    def __init__(self, duration, on_progress):
+        self.duration = duration
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._done = {}
+        self._speed = {}
+        self._fps = {}
+
+    def update(self, name, event):
+        if self.on_progress is None:
+            return
+        with self._lock:
+            self._done[name] = event.out_time
+            if event.done:
+                self._speed.pop(name, None)
+                self._fps.pop(name, None)
+            else:
+                self._speed[name] = event.speed or 0.0
+                self._fps[name] = event.fps or 0.0
+            done = sum(self._done.values())
+            speed = sum(self._speed.values())
+            fps = sum(self._fps.values())
+        fraction = min(done / self.duration, 1.0) if self.duration else 0.0
+        eta = max(self.duration - done, 0.0) / speed if speed else None
+        self.on_progress(
+            {"fraction": fraction, "fps": fps or None, "speed": speed or None, "eta": eta}
+        )
+
+
+def mux_map_args(info, stream_args=None):
+    """``-map`` options of the final mux of the joined video (input ``0``).
+
+    Without ``stream_args`` every stream of the original (input ``1``) is
+    kept in its own order, with the encoded video in the main video's place,
+    as ``-map 0`` would. ``stream_args`` select the other streams instead and
+    follow the video.
+    """
+    if stream_args:
+        return ["-map", "0:v:0", *stream_args]
+    args = []
+    for stream in info.streams:
+        args += ["-map", "0:v:0" if stream.index == info.video.index else f"1:{stream.index}"]
+    return args
+
+
+def encode_segmented(
+    input_file,
+    output_path,
+    info,
+    backend,
+    bitrate,
+    threads=None,
+    workers=1,
+    slots=None,
+    popen=None,
+    on_progress=None,
+    segment_seconds=SEGMENT_SECONDS,
+    stream_args=None,
+):
+    """Encode ``input_file`` to ``output_path`` in parallel segments.
+
+    ``info`` is the file's :class:`media_probe.MediaInfo`. Up to ``workers``
+    segments are encoded at once; if ``slots`` (a semaphore shared with the
+    rest of the batch) is given, each segment encode also holds one slot so
+    the batch never runs more encoders than it was configured for.
+
+    ``stream_args`` are the options selecting the other streams from the
+    original (input ``1`` of the final mux); by default all of them are kept.
+    """
+    video = info.video
+    if video is None or not info.duration:
+        raise ValueError(f"{input_file} has no video stream or duration to split")
+
+    workdir = tempfile.mkdtemp(prefix=".segments-", dir=os.path.dirname(output_path))
+    try:
+        segment_list = os.path.join(workdir, "segments.csv")
+        run_ffmpeg(
+            [
+                "ffmpeg",
+                "-y",
+                "-i",
+                input_file,
+                "-map",
+                f"0:{video.index}",
+                "-c",
+                "copy",
+                "-f",
+                "segment",
+                "-segment_times",
+                ",".join(str(t) for t in plan_cut_times(info.duration, segment_seconds))
+                or str(info.duration),
+                "-segment_list",
+                segment_list,
+                "-segment_list_type",
+                "csv",
+                "-reset_timestamps",
+                "1",
+                os.path.join(workdir, "src_%04d.mkv"),
+            ],
+            popen=popen,
+        )
+        segments = _read_segment_list(segment_list)
+        progress = _SegmentProgress(info.duration, on_progress)
+
+        def encode(segment):
+            name, duration = segment
+            encoded = os.path.join(workdir, "enc_" + name.split("_", 1)[1])
+            cmd = [
+                "ffmpeg",
+                "-y",
+                *backend.input_args(),
+                "-i",
+                os.path.join(workdir, name),
+                "-map",
+                "0:v:0",
+                *backend.video_args(bitrate, threads),
+                encoded,
+            ]
+            if slots is not None:
+                slots.acquire()
+            try:
+                run_ffmpeg(
+                    cmd,
+                    duration,
+                    on_progress=lambda event: progress.update(name, event),
+                    popen=popen,
+                )
+            finally:
+                if slots is not None:
+                    slots.release()
+            return os.path.basename(encoded)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            encoded = list(pool.map(encode, segments))
+
+        concat_list = os.path.join(workdir, "concat.txt")
+        with open(concat_list, "w", encoding="utf-8") as f:
+            for name in encoded:
+                f.write(f"file '{name}'\n")
+
+        run_ffmpeg(
+            [
+                "ffmpeg",
+                "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                concat_list,
+                "-i",
+                input_file,
+                *mux_map_args(info, stream_args),
+                "-c",
+                "copy",
+                "-map_metadata",
+                "1",
+                "-map_metadata:s:v:0",
+                f"1:s:{video.index}",
+                "-map_chapters",
+                "1",
+                output_path,
+            ],
+            info.duration,
+            popen=popen,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,202 @@
+"""Merge mislabelled season folders and renumber episodes.
+
+Python version of ``series rename.ps1``. All episodes below a series folder
+are taken in path order and dealt out over the true season lengths, so five
+folders of 12 episodes become seasons of 24, 12 and 24 episodes. Each file
+goes to ``Season N/[INDEX] Show - SxxEyy [hash].mkv``, where the show is
+the series folder's name and the hash is the trailing ``[...]`` tag of the
+old name.
+
+:func:`plan_renames` works out the whole plan in one pass over a file list,
+for example the list a batch just converted and committed, so no second walk
+of the library is needed. The plan can be shown as a dry run before
+:func:`apply_plan` carries it out with same-filesystem renames. Every file is
+first renamed to a temporary name in its new folder and then to its final
+name. That way files can swap names, and no rename replaces another file. The
+plan is journalled in the series folder first, so :func:`finish_interrupted`
+can complete a run cut short by a crash.
+"""
+
+import bisect
+import itertools
+import json
+import os
+import re
+from typing import NamedTuple
+
+from library_scan import iter_videos
+
+# Episode file name; the hash tag is only added when the old name had one.
+NAME_FORMAT = "[INDEX] {show} - S{season:02d}E{episode:02d}"
+SEASON_FOLDER = "Season {season}"
+
+# Written to the series folder while a plan is applied.
+JOURNAL_NAME = ".theatre_reorganize.json"
+
+_HASH = re.compile(r"\[([^\[\]]*)\]$")
+
+
+class RenameStep(NamedTuple):
+    source: str
+    destination: str
+    season: int
+    episode: int
+
+
+class RenamePlan(NamedTuple):
+    root: str
+    steps: list
+    # Files past the last season's episodes, left where they are
+    unassigned: list
+    # Episodes that already have their final name
+    in_place: int
+
+
+def parse_seasons(text):
+    """Episode counts from ``"24,12,24"``; raises ``ValueError`` if malformed."""
+    counts = [int(part) for part in text.split(",") if part.strip()]
+    if not counts or min(counts) <= 0:
+        raise ValueError(f"Expected positive episode counts like 24,12,24, not {text!r}")
+    return counts
+
+
+def episode_hash(path):
+    """The ``[...]`` tag at the end of a file's stem, or ``""``."""
+    match = _HASH.search(os.path.splitext(os.path.basename(path))[0])
+    return match.group(1) if match else ""
+
+
+def episode_name(show, season, episode, source):
+    tag = episode_hash(source)
+    name = NAME_FORMAT.format(show=show, season=season, episode=episode)
+    return f"{name} [{tag}]" if tag else name
+
+
+def plan_renames(root, seasons, files=None):
+    """Plan the moves that give ``root`` the season layout ``seasons``.
+
+    ``files`` are the episodes to place (every video below ``root`` if not
+    given); files outside ``root`` are ignored. Episodes are ordered by path,
+    ignoring case as the PowerShell script did.
+    """
+    root = os.path.abspath(root)
+    prefix = os.path.join(root, "")
+    if files is None:
+        files = iter_videos(root, require_root=False)
+    episodes = sorted(
+        {os.path.abspath(f) for f in files if os.path.abspath(f).startswith(prefix)},
+        key=lambda path: (path.lower(), path),
+    )
+    show = os.path.basename(root)
+    # Index of the first episode of each later season
+    ends = list(itertools.accumulate(seasons))
+    steps = []
+    in_place = 0
+    for index, source in enumerate(episodes):
+        season = bisect.bisect_right(ends, index)
+        if season >= len(seasons):
+            return RenamePlan(root, steps, episodes[index:], in_place)
+        episode = index - (ends[season - 1] if season else 0) + 1
+        name = episode_name(show, season + 1, episode, source)
+        destination = os.path.join(
+            root,
+            SEASON_FOLDER.format(season=season + 1),
+            name + os.path.splitext(source)[1],
+        )
+        if destination == source:
+            in_place += 1
+        else:
+            steps.append(RenameStep(source, destination, season + 1, episode))
+    return RenamePlan(root, steps, [], in_place)
+
+
+def format_step(step):
+    """One dry-run line for ``step``."""
+    return (
+        f"Season {step.season} Episode {step.episode:02d}: "
+        f"{os.path.basename(step.source)} -> {os.path.basename(step.destination)}"
+    )
+
+
+def _check(plan):
+    sources = {step.source for step in plan.steps}
+    device = os.stat(plan.root).st_dev
+    for step in plan.steps:
+        if os.stat(step.source).st_dev != device:
+            raise OSError(f"{step.source} is on another filesystem than {plan.root}")
+        if os.path.exists(step.destination) and step.destination not in sources:
+            raise FileExistsError(f"{step.destination} already exists")
+
+
+def _write_journal(root, moves, phase=1):
+    path = os.path.join(root, JOURNAL_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"moves": moves, "phase": phase}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _complete(root, moves, on_moved, phase=1):
+    """Finish ``[[source, temporary, destination]]`` moves from any point.
+
+    Phase 1 renames the sources to their temporary names and phase 2 the
+    temporary names to the destinations. The journal records when phase 2
+    starts: from then on a source path may already hold a finished episode,
+    which must not be moved back.
+    """
+    if phase < 2:
+        for source, temporary, _ in moves:
+            if os.path.exists(source) and not os.path.exists(temporary):
+                os.rename(source, temporary)
+                if on_moved is not None:
+                    on_moved(source, temporary)
+        _write_journal(root, moves, phase=2)
+    for _, temporary, destination in moves:
+        if os.path.exists(temporary):
+            os.rename(temporary, destination)
+            if on_moved is not None:
+                on_moved(temporary, destination)
+    os.remove(os.path.join(root, JOURNAL_NAME))
+    # Drop the old season folders that are now empty.
+    for folder in sorted({os.path.dirname(s) for s, _, _ in moves}, key=len, reverse=True):
+        while folder != root and folder.startswith(os.path.join(root, "")):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+
+def apply_plan(plan, on_moved=None):
+    """Carry out ``plan``; ``on_moved(old, new)`` follows every rename.
+
+    Raises before renaming anything if a file is on another filesystem or a
+    destination is taken by a file the plan does not move.
+    """
+    if not plan.steps:
+        return
+    _check(plan)
+    moves = []
+    for number, step in enumerate(plan.steps):
+        folder = os.path.dirname(step.destination)
+        os.makedirs(folder, exist_ok=True)
+        moves.append(
+            [step.source, os.path.join(folder, f".reorganize-{number}.tmp"), step.destination]
+        )
+    _write_journal(plan.root, moves)
+    _complete(plan.root, moves, on_moved)
+
+
+def interrupted(root):
+    """True if a reorganisation of ``root`` was cut short."""
+    return os.path.exists(os.path.join(root, JOURNAL_NAME))
+
+
+def finish_interrupted(root, on_moved=None):
+    """Complete a reorganisation of ``root`` that was cut short."""
+    root = os.path.abspath(root)
+    with open(os.path.join(root, JOURNAL_NAME), encoding="utf-8") as f:
+        journal = json.load(f)
+    _complete(root, journal["moves"], on_moved, journal.get("phase", 1))
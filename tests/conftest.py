@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live at the top of the repository, next to this folder.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import media_probe  # noqa: E402
+import theatre_engine  # noqa: E402
+from batch_journal import BatchJournal  # noqa: E402
+from commit_phase import CommitJournal  # noqa: E402
+from media_probe import ProbeCache  # noqa: E402
+from processed_manifest import ProcessedManifest  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """A :class:`TheatreEngine` whose caches, journals and logs live in ``tmp_path``."""
+    monkeypatch.setattr(theatre_engine, "LOG_DIR", tmp_path / "logs")
+    entries = []
+    engine = theatre_engine.TheatreEngine(
+        probe_cache=ProbeCache(tmp_path / "probe.db"),
+        manifest=ProcessedManifest(tmp_path / "manifest.db"),
+        log=entries.append,
+    )
+    engine.commit_journal = CommitJournal(tmp_path / "commit.jsonl")
+    engine.batch_journal = BatchJournal(tmp_path / "batch.jsonl")
+    engine.entries = entries
+    yield engine
+    engine.close()
+
+
+def write_video(path, duration=60.0, streams=3, tag=""):
+    """Write a stand-in video whose ffprobe output :func:`fake_ffprobe` makes up."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"duration": duration, "streams": streams, "tag": tag}))
+    return str(path)
+
+
+def read_tag(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["tag"]
+
+
+@pytest.fixture
+def fake_ffprobe(monkeypatch):
+    """Answer ffprobe calls from the JSON written by :func:`write_video`."""
+
+    def run(cmd, **kwargs):
+        try:
+            with open(cmd[-1], encoding="utf-8") as f:
+                spec = json.load(f)
+        except (OSError, ValueError):
+            return subprocess.CompletedProcess(cmd, 1, "", "Invalid data found")
+        types = ["video"] + ["audio"] * (spec["streams"] - 1)
+        data = {
+            "streams": [
+                {"index": i, "codec_type": t, "codec_name": "h264" if t == "video" else "aac"}
+                for i, t in enumerate(types)
+            ],
+            "format": {"duration": str(spec["duration"])},
+        }
+        return subprocess.CompletedProcess(cmd, 0, json.dumps(data), "")
+
+    monkeypatch.setattr(media_probe.subprocess, "run", run)
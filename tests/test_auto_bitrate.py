@@ -0,0 +1,69 @@
+import contextlib
+import threading
+from types import SimpleNamespace
+
+import auto_bitrate
+from auto_bitrate import FALLBACK_BITRATE, SampleCache, choose_bitrate
+from ffmpeg_runner import FFmpegError
+
+INFO = SimpleNamespace(
+    video=SimpleNamespace(height=1080, bit_rate=None), duration=1200.0, bit_rate=None
+)
+BACKEND = SimpleNamespace(name="libx265")
+
+
+def test_failed_sample_falls_back(tmp_path, monkeypatch):
+    def measure(*args):
+        raise FFmpegError(1, ["ffmpeg"], stderr="Invalid data found")
+
+    monkeypatch.setattr(auto_bitrate, "measure", measure)
+    cache = SampleCache(tmp_path / "samples.json")
+    kbps, entry = choose_bitrate("Show S01E01.mkv", INFO, BACKEND, cache=cache)
+    assert kbps == FALLBACK_BITRATE
+    assert entry["reason"] == "sampling failed"
+    # A failure is not remembered for the rest of the series.
+    assert cache.get(auto_bitrate.cache_key("Show S01E01.mkv", INFO, BACKEND)) is None
+
+
+def test_waiting_episode_holds_no_slot(tmp_path, monkeypatch):
+    sampling = threading.Event()
+    release = threading.Event()
+
+    def measure(input_file, backend, kbps, *args):
+        sampling.set()
+        release.wait(5)
+        return {"ssim": 0.99, "psnr": None, "kbps": kbps}
+
+    monkeypatch.setattr(auto_bitrate, "measure", measure)
+    cache = SampleCache(tmp_path / "samples.json")
+    slots = []
+
+    def slot_for(name):
+        @contextlib.contextmanager
+        def slot():
+            slots.append(name)
+            yield
+
+        return slot
+
+    results = {}
+
+    def choose(name):
+        results[name] = choose_bitrate(
+            f"Show {name}.mkv", INFO, BACKEND, cache=cache, slot=slot_for(name)
+        )
+
+    first = threading.Thread(target=choose, args=("S01E01",))
+    first.start()
+    assert sampling.wait(5)
+    second = threading.Thread(target=choose, args=("S01E02",))
+    second.start()
+    second.join(0.2)
+    assert second.is_alive() and slots == ["S01E01"]
+
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert slots == ["S01E01"]
+    assert results["S01E02"][1]["cached"]
+    assert results["S01E02"][0] == results["S01E01"][0]
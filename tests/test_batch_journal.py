@@ -0,0 +1,80 @@
+import pytest
+
+import batch_journal
+from batch_journal import DONE, ENCODING, FAILED, BatchJournal
+from conftest import write_video
+
+
+def _crashed_batch(tmp_path):
+    files = [write_video(tmp_path / "Show" / f"{n}.mkv") for n in ("a", "b", "c")]
+    converted = str(tmp_path / "Show" / "converted")
+    output = write_video(tmp_path / "Show" / "converted" / "b.mkv", tag="new")
+    journal = BatchJournal(tmp_path / "batch.jsonl")
+    journal.start("convert", {"bitrate": "2000", "encoder": "auto"}, files)
+    journal.mark(files[0], ENCODING)
+    journal.mark(files[1], ENCODING)
+    journal.mark(files[1], DONE, output_file=output, converted_dir=converted, expected_streams=3)
+    journal.mark(files[2], FAILED, error="boom")
+    # The process dies while writing the next record.
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"file": "')
+    return files, converted, output
+
+
+def test_interrupted_batch_after_crash(tmp_path):
+    files, converted, output = _crashed_batch(tmp_path)
+    journal = BatchJournal(tmp_path / "batch.jsonl")
+    journal.load()
+    batch = journal.interrupted()
+    assert batch.operation == "convert"
+    assert batch.options == {"bitrate": "2000", "encoder": "auto"}
+    assert batch.restart == [files[0]]
+    assert [r["output_file"] for r in batch.finished] == [output]
+
+
+def test_done_outputs_are_carried_into_the_next_batch(tmp_path):
+    files, converted, output = _crashed_batch(tmp_path)
+    journal = BatchJournal(tmp_path / "batch.jsonl")
+    journal.load()
+    journal.start("streams", {"audio": "eng"}, [files[0]])
+    journal.mark_committed([output])
+    reloaded = BatchJournal(journal.path)
+    reloaded.load()
+    assert [r["state"] for r in reloaded.unsettled()] == [batch_journal.PENDING]
+    journal.clear()
+    assert not journal.path.exists()
+
+
+def test_engine_resumes_only_unfinished_jobs(engine, tmp_path, fake_ffprobe):
+    files, converted, output = _crashed_batch(tmp_path)
+    engine.batch_journal.load()
+    runner = engine.resume_runner()
+    assert runner.files == [files[0]]
+    assert engine.processed_dirs == {converted}
+    assert engine.expected_streams == {output: 3}
+    assert any("1 finished output(s) kept" in e["message"] for e in engine.entries)
+
+    # Committing the kept output settles its record.
+    report = engine.commit_converted_files()
+    assert [entry.path for entry in report.committed] == [files[1]]
+    assert engine.batch_journal.interrupted().restart == [files[0]]
+
+
+def test_crash_while_starting_keeps_previous_journal(tmp_path, monkeypatch):
+    files, converted, output = _crashed_batch(tmp_path)
+    journal = BatchJournal(tmp_path / "batch.jsonl")
+    journal.load()
+
+    def crash(src, dst):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(batch_journal.os, "replace", crash)
+    with pytest.raises(KeyboardInterrupt):
+        journal.start("convert", {}, [write_video(tmp_path / "Other" / "d.mkv")])
+    monkeypatch.undo()
+
+    reloaded = BatchJournal(tmp_path / "batch.jsonl")
+    reloaded.load()
+    batch = reloaded.interrupted()
+    assert batch.restart == [files[0]]
+    assert [r["output_file"] for r in batch.finished] == [output]
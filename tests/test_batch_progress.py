@@ -0,0 +1,53 @@
+import pytest
+
+import batch_progress
+from batch_progress import BatchProgress
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(batch_progress.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_skipped_file_mid_batch_does_not_count_as_throughput(clock):
+    durations = {"a": 600.0, "film": 7200.0, "b": 600.0}
+    progress = BatchProgress(["a", "film", "b"], durations, window=1000)
+    # "a" encodes at 10x realtime.
+    for second in range(1, 61):
+        clock[0] += 1
+        progress.update("a", {"fraction": second / 60})
+    progress.finish("a", {"status": "converted", "before_size": 10, "after_size": 4})
+    # The film turns out to need no work a second after it starts.
+    clock[0] += 1
+    progress.update("film", {"fraction": 0.0})
+    progress.finish("film", {"status": "skipped"})
+    for second in range(1, 31):
+        clock[0] += 1
+        progress.update("b", {"fraction": second / 60})
+
+    snapshot = progress.snapshot()
+    assert snapshot["files_done"] == 2
+    assert snapshot["fraction"] == pytest.approx(900 / 1200)
+    assert snapshot["realtime_factor"] == pytest.approx(900 / 91, rel=0.01)
+    assert snapshot["eta"] == pytest.approx(300 / (900 / 91), rel=0.01)
+    assert snapshot["bytes_saved"] == 6
+
+
+def test_failed_file_keeps_only_the_work_it_did(clock):
+    progress = BatchProgress(["a", "b"], {"a": 100.0, "b": 100.0})
+    clock[0] += 10
+    progress.update("a", {"fraction": 0.25})
+    progress.finish("a")
+    snapshot = progress.snapshot()
+    assert snapshot["files_failed"] == 1
+    assert snapshot["fraction"] == pytest.approx(25 / 125)
+    progress.finish("b", {"status": "converted"})
+    assert progress.snapshot()["fraction"] == pytest.approx(1.0)
+
+
+def test_every_file_skipped_is_complete(clock):
+    progress = BatchProgress(["a"], {"a": 100.0})
+    progress.finish("a", {"status": "skipped"})
+    assert progress.snapshot()["fraction"] == 1.0
@@ -0,0 +1,104 @@
+import threading
+from types import SimpleNamespace
+
+import theatre_engine
+from encoders import EncoderUnavailable
+from theatre_engine import DONE, QUEUED, RESULT, SKIPPED, BatchRunner
+
+
+def _drain(runner):
+    events = []
+    while True:
+        event = runner.events.get(timeout=10)
+        events.append(event)
+        if event[0] == DONE:
+            return events
+
+
+def test_prepare_runs_on_batch_thread():
+    caller = threading.current_thread()
+    seen = []
+
+    def prepare(runner):
+        seen.append(threading.current_thread())
+        runner.events.put((SKIPPED, "b", {"message": "not worth it"}))
+        return ["c", "a"]
+
+    runner = BatchRunner(lambda path, ctx: {"file": path}, ["a", "b", "c"], prepare=prepare)
+    events = _drain(runner.start())
+    assert seen and seen[0] is not caller
+    assert events[0] == (SKIPPED, "b", {"message": "not worth it"})
+    assert events[1] == (QUEUED, None, ["c", "a"])
+    assert sorted(e[1] for e in events if e[0] == RESULT) == ["a", "c"]
+
+
+def test_convert_runner_plans_off_the_caller_thread(engine, tmp_path, monkeypatch):
+    files = []
+    for n in range(3):
+        path = tmp_path / f"{n}.mkv"
+        path.write_bytes(b"x")
+        files.append(str(path))
+    caller = threading.current_thread()
+    threads = []
+
+    def select_backend(encoder):
+        threads.append(threading.current_thread())
+        raise EncoderUnavailable(encoder)
+
+    def probe_many(paths):
+        threads.append(threading.current_thread())
+        return dict.fromkeys(paths)
+
+    def plan(paths, infos, *args, **kwargs):
+        return [], [SimpleNamespace(path=p, codec="h264", before_size=1) for p in paths]
+
+    def on_batch_thread(method):
+        def spy(*args):
+            threads.append(threading.current_thread())
+            return method(*args)
+
+        return spy
+
+    monkeypatch.setattr(theatre_engine, "select_backend", select_backend)
+    monkeypatch.setattr(engine, "_probe_many", probe_many)
+    monkeypatch.setattr(
+        engine.manifest, "filter_pending", on_batch_thread(engine.manifest.filter_pending)
+    )
+    monkeypatch.setattr(engine, "_batch_progress", on_batch_thread(engine._batch_progress))
+    monkeypatch.setattr(theatre_engine, "plan", plan)
+    monkeypatch.setattr(theatre_engine, "skip_message", lambda cost: "not worth it")
+
+    runner = engine.convert_runner(files, bitrate="2000")
+    assert threads == []
+    engine.run(runner, engine.record_conversion, "failed")
+    assert len(threads) == 4 and caller not in threads
+    skipped = [e["input"] for e in engine.entries if e["status"] == "skipped"]
+    assert skipped == files
+    assert engine.progress.snapshot()["files_total"] == 0
+
+
+def test_manifest_skips_are_reported_from_the_batch(engine, tmp_path, monkeypatch):
+    files = []
+    for n in range(2):
+        path = tmp_path / f"{n}.mkv"
+        path.write_bytes(b"x")
+        files.append(str(path))
+    engine.manifest.record(files[0], "committed", codec="hevc")
+    planned = []
+
+    def plan(paths, infos, *args, **kwargs):
+        planned.extend(paths)
+        return [], []
+
+    monkeypatch.setattr(
+        theatre_engine, "select_backend", lambda encoder: SimpleNamespace(hardware=False)
+    )
+    monkeypatch.setattr(engine, "_probe_many", lambda paths: dict.fromkeys(paths))
+    monkeypatch.setattr(theatre_engine, "plan", plan)
+
+    runner = engine.convert_runner(files, bitrate="2000")
+    assert engine.entries == []
+    engine.run(runner, engine.record_conversion, "failed")
+    assert planned == files[1:]
+    messages = [e["message"] for e in engine.entries if e["status"] == "skipped"]
+    assert messages == ["1 file(s) already processed according to the manifest"]
@@ -0,0 +1,161 @@
+import errno
+import os
+
+import pytest
+
+import commit_phase
+from commit_phase import (
+    CommitJournal,
+    backup_path,
+    commit_all,
+    finish_interrupted,
+    rollback_interrupted,
+)
+from conftest import read_tag, write_video
+from media_probe import ProbeCache
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def library(tmp_path, fake_ffprobe):
+    folder = tmp_path / "Show"
+    originals = [write_video(folder / f"{n}.mkv", tag="original") for n in ("a", "b")]
+    outputs = [write_video(folder / "converted" / f"{n}.mkv", tag="new") for n in ("a", "b")]
+    probe_cache = ProbeCache(tmp_path / "probe.db")
+    journal = CommitJournal(tmp_path / "commit.jsonl")
+    yield str(folder / "converted"), originals, outputs, probe_cache, journal
+    probe_cache.close()
+
+
+def test_commit_replaces_originals(library):
+    conv_dir, originals, outputs, probe_cache, journal = library
+    report = commit_all([conv_dir], probe_cache, journal)
+    assert sorted(entry.path for entry in report.committed) == originals
+    assert report.failed == []
+    assert [read_tag(path) for path in originals] == ["new", "new"]
+    assert not os.path.exists(conv_dir)
+    assert not any(os.path.exists(backup_path(path)) for path in originals)
+    assert not journal.path.exists()
+
+
+def test_failed_verification_keeps_original(library):
+    conv_dir, originals, outputs, probe_cache, journal = library
+    write_video(outputs[1], duration=30, tag="new")
+    report = commit_all([conv_dir], probe_cache, journal)
+    assert [entry.path for entry in report.committed] == [originals[0]]
+    assert [failure.source for failure in report.failed] == [outputs[1]]
+    assert "duration" in report.failed[0].reason
+    assert read_tag(originals[1]) == "original"
+    assert read_tag(outputs[1]) == "new"
+
+
+def test_wrong_stream_count_is_rejected(library):
+    conv_dir, originals, outputs, probe_cache, journal = library
+    write_video(outputs[0], streams=2, tag="new")
+    report = commit_all([conv_dir], probe_cache, journal, {outputs[1]: 3})
+    assert [failure.source for failure in report.failed] == [outputs[0]]
+    # A stream update says how many streams it kept.
+    report = commit_all([conv_dir], probe_cache, journal, {outputs[0]: 2})
+    assert [entry.path for entry in report.committed] == [originals[0]]
+
+
+def _crash_on_second(monkeypatch, name):
+    real = getattr(commit_phase, name)
+    calls = []
+
+    def crash(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise Crash()
+        return real(*args)
+
+    monkeypatch.setattr(commit_phase, name, crash)
+
+
+def test_finish_after_crash_mid_directory(library, monkeypatch):
+    conv_dir, originals, outputs, probe_cache, journal = library
+    _crash_on_second(monkeypatch, "_replace")
+    with pytest.raises(Crash):
+        commit_all([conv_dir], probe_cache, journal)
+    monkeypatch.undo()
+    assert list(journal.unfinished()) == [conv_dir]
+    assert read_tag(originals[1]) == "original"
+
+    committed = finish_interrupted(journal, probe_cache)
+    assert sorted(entry.path for entry in committed) == originals
+    assert [read_tag(path) for path in originals] == ["new", "new"]
+    assert not os.path.exists(conv_dir)
+    assert not any(os.path.exists(backup_path(path)) for path in originals)
+    assert journal.unfinished() == {}
+
+
+def test_rollback_after_crash_mid_directory(library, monkeypatch):
+    conv_dir, originals, outputs, probe_cache, journal = library
+    _crash_on_second(monkeypatch, "_replace")
+    with pytest.raises(Crash):
+        commit_all([conv_dir], probe_cache, journal)
+    monkeypatch.undo()
+
+    restored = rollback_interrupted(journal)
+    assert sorted(restored) == originals
+    assert [read_tag(path) for path in originals] == ["original", "original"]
+    assert [read_tag(path) for path in outputs] == ["new", "new"]
+    assert not any(os.path.exists(backup_path(path)) for path in originals)
+    assert journal.unfinished() == {}
+
+
+def test_rollback_after_every_swap(library, monkeypatch):
+    conv_dir, originals, outputs, probe_cache, journal = library
+
+    def crash(*args):
+        raise Crash()
+
+    monkeypatch.setattr(commit_phase, "_finish_directory", crash)
+    with pytest.raises(Crash):
+        commit_all([conv_dir], probe_cache, journal)
+    monkeypatch.undo()
+    assert [read_tag(path) for path in originals] == ["new", "new"]
+
+    rollback_interrupted(journal)
+    assert [read_tag(path) for path in originals] == ["original", "original"]
+    assert [read_tag(path) for path in outputs] == ["new", "new"]
+
+
+def test_journal_skips_torn_line(tmp_path):
+    journal = CommitJournal(tmp_path / "commit.jsonl")
+    journal.append(dir="d", src="d/a", dst="a", backup=".a", state="begin")
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"dir": "d", "src"')
+    assert [r["dst"] for r in journal.unfinished()["d"]] == ["a"]
+
+
+def _crash_after_cross_device_copy(monkeypatch):
+    real = os.replace
+
+    def replace(src, dst):
+        if os.path.basename(os.path.dirname(src)) == "converted":
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        if src.endswith(".commit-tmp"):
+            raise Crash()
+        return real(src, dst)
+
+    monkeypatch.setattr(commit_phase.os, "replace", replace)
+
+
+@pytest.mark.parametrize("recover", [finish_interrupted, rollback_interrupted])
+def test_cross_device_copy_is_removed_after_crash(library, monkeypatch, recover):
+    conv_dir, originals, outputs, probe_cache, journal = library
+    _crash_after_cross_device_copy(monkeypatch)
+    with pytest.raises(Crash):
+        commit_all([conv_dir], probe_cache, journal)
+    monkeypatch.undo()
+    folder = os.path.dirname(conv_dir)
+    assert ".a.mkv.commit-tmp" in os.listdir(folder)
+
+    recover(journal)
+    # b.mkv was never started, so converted/ still holds its output.
+    assert sorted(os.listdir(folder)) == ["a.mkv", "b.mkv", "converted"]
+    assert read_tag(originals[0]) == ("new" if recover is finish_interrupted else "original")
@@ -0,0 +1,60 @@
+from cost_model import estimate, plan
+from media_probe import parse_probe_output
+
+MBPS = 1000 * 1000
+
+
+def _mkv(path, duration=1420.0, total_bps=8 * MBPS, video_bps=None, audio_bps=None):
+    """Probe result for an H.264/AAC file; Matroska leaves stream bitrates out."""
+    video = {
+        "index": 0,
+        "codec_type": "video",
+        "codec_name": "h264",
+        "width": 1920,
+        "height": 1080,
+        "avg_frame_rate": "24000/1001",
+    }
+    audio = {"index": 1, "codec_type": "audio", "codec_name": "aac"}
+    if video_bps:
+        video["bit_rate"] = str(video_bps)
+    if audio_bps:
+        audio["bit_rate"] = str(audio_bps)
+    data = {
+        "streams": [video, audio],
+        "format": {"duration": str(duration), "bit_rate": str(total_bps)},
+    }
+    return parse_probe_output(path, int(total_bps * duration / 8), 0, data)
+
+
+def test_file_without_stream_bitrates_is_queued():
+    info = _mkv("a.mkv")
+    cost = estimate(info, "2000")
+    assert cost.expected_size is None
+    assert cost.savings_percent is None
+    queue, skipped = plan(["a.mkv"], {"a.mkv": info}, "2000")
+    assert queue == ["a.mkv"]
+    assert skipped == []
+
+
+def test_copied_streams_use_format_rate_minus_video_rate():
+    info = _mkv("a.mkv", video_bps=7800 * 1000)
+    cost = estimate(info, "2000")
+    # 2000 kbps of video plus the 200 kbps left over for the audio.
+    assert cost.expected_size == int(2200 * 1000 * 1420 / 8 * 1.02)
+    assert plan(["a.mkv"], {"a.mkv": info}, "2000") == (["a.mkv"], [])
+
+
+def test_file_already_near_target_is_skipped():
+    info = _mkv("a.mkv", total_bps=2100 * 1000, video_bps=1900 * 1000, audio_bps=192 * 1000)
+    queue, skipped = plan(["a.mkv"], {"a.mkv": info}, "2000")
+    assert queue == []
+    assert [c.path for c in skipped] == ["a.mkv"]
+
+
+def test_unknown_sizes_sort_with_savings_order():
+    known = _mkv("known.mkv", video_bps=7800 * 1000)
+    unknown = _mkv("unknown.mkv")
+    infos = {"known.mkv": known, "unknown.mkv": unknown}
+    queue, skipped = plan(["unknown.mkv", "known.mkv"], infos, "2000", order="savings")
+    assert queue == ["known.mkv", "unknown.mkv"]
+    assert skipped == []
@@ -0,0 +1,154 @@
+import os
+import subprocess
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import encode_farm
+import theatre_engine
+from encode_farm import FarmCoordinator, RemoteJobError
+from resource_governor import ResourcePolicy
+from theatre_engine import DONE, ERROR, NOTICE, QUEUED, RESULT
+
+
+class StubPopen:
+    """Stands in for ffmpeg: exits at once with success."""
+
+    calls = []
+
+    def __init__(self, cmd, **kwargs):
+        StubPopen.calls.append(cmd)
+        self.pid = 0
+        self.returncode = 0
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def terminate(self):
+        pass
+
+
+def fake_convert_file(input_file, ctx, probe_cache, threads=0, **options):
+    process = ctx.popen(["ffmpeg", "-i", input_file, "-b:v", options["bitrate"]])
+    process.wait()
+    ctx.report(fraction=1.0)
+    return {"input_file": input_file, "status": "converted", "threads": threads}
+
+
+@pytest.fixture
+def farm(monkeypatch):
+    StubPopen.calls = []
+    monkeypatch.setattr(subprocess, "Popen", StubPopen)
+    monkeypatch.setattr(encode_farm, "convert_file", fake_convert_file)
+    monkeypatch.setattr(encode_farm, "ProbeCache", lambda: None)
+    monkeypatch.setattr(encode_farm, "POLL_SECONDS", 0.05)
+    monkeypatch.setattr(encode_farm, "HEARTBEAT_SECONDS", 0.05)
+    # The stub's pid is 0, which would renice the test process itself.
+    monkeypatch.setattr(encode_farm, "POLICY", ResourcePolicy(0, "none", 0, (), {}))
+
+
+def _events(coordinator, timeout=10):
+    events = []
+    while True:
+        event = coordinator.events.get(timeout=timeout)
+        events.append(event)
+        if event[0] == DONE:
+            return events
+
+
+def _coordinator(files, **kwargs):
+    return FarmCoordinator(files, {"bitrate": "2000"}, host="127.0.0.1", port=0, **kwargs)
+
+
+def test_several_workers_share_the_batch(farm, capsys):
+    files = [f"/library/{n}.mkv" for n in range(8)]
+    coordinator = _coordinator(files).start()
+    lines = []
+    workers = threading.Thread(
+        target=encode_farm.run_worker,
+        args=(coordinator.url,),
+        kwargs={"name": "test", "workers": 3, "once": True, "log": lines.append},
+    )
+    workers.start()
+    events = _events(coordinator)
+    workers.join(10)
+
+    results = [payload for kind, _, payload in events if kind == RESULT]
+    assert sorted(r["input_file"] for r in results) == files
+    assert not [e for e in events if e[0] == ERROR]
+    assert len(StubPopen.calls) == len(files)
+    assert {line.split(":")[0] for line in lines} <= {"test/0", "test/1", "test/2"}
+    assert not workers.is_alive()
+    assert capsys.readouterr().err == ""
+
+
+def test_batch_ends_when_every_worker_dies(farm):
+    coordinator = _coordinator(["/library/a.mkv"], lease_seconds=0.2, max_attempts=1).start()
+    # A worker leases the job and is never heard from again.
+    assert coordinator.lease("gone")["job"]["input_file"] == "/library/a.mkv"
+
+    events = _events(coordinator, timeout=5)
+    kinds = [kind for kind, _, _ in events]
+    assert NOTICE in kinds
+    error = next(payload for kind, _, payload in events if kind == ERROR)
+    assert isinstance(error, RemoteJobError)
+
+
+def test_prepare_runs_before_jobs_are_leased(farm):
+    release = threading.Event()
+
+    def prepare(coordinator):
+        release.wait(5)
+        return ["/library/b.mkv"]
+
+    coordinator = _coordinator(["/library/a.mkv", "/library/b.mkv"], prepare=prepare).start()
+    assert coordinator.lease("early") == {}
+    release.set()
+    assert coordinator.events.get(timeout=5) == (QUEUED, None, ["/library/b.mkv"])
+    job = coordinator.lease("w")["job"]
+    assert job["input_file"] == "/library/b.mkv"
+    coordinator.complete("w", job["id"], {"input_file": job["input_file"]})
+    assert [kind for kind, _, _ in _events(coordinator)][-1] == DONE
+    coordinator.join(5)
+
+
+def test_lost_lease_never_touches_the_new_output(farm, monkeypatch, tmp_path):
+    source = tmp_path / "a.mkv"
+    source.write_text("source")
+    converted = tmp_path / "converted"
+
+    def convert_file(input_file, ctx, probe_cache, threads=0, output_name=None, **options):
+        converted_dir, output = theatre_engine.converted_path(input_file, output_name)
+        with open(output, "w") as f:
+            f.write("new")
+        return {"input_file": input_file, "output_file": output, "converted_dir": converted_dir}
+
+    monkeypatch.setattr(encode_farm, "convert_file", convert_file)
+    coordinator = _coordinator([str(source)], lease_seconds=0.3).start()
+    # The first worker starts writing, then stops responding.
+    lost = coordinator.lease("lost")
+    converted.mkdir()
+    partial = converted / encode_farm.lease_output_name(lost["lease"], str(source))
+    partial.write_text("partial")
+    while coordinator.events.get(timeout=5)[0] != NOTICE:
+        pass
+
+    encode_farm.run_worker(coordinator.url, name="new", once=True, log=lambda line: None)
+    results = [payload for kind, _, payload in _events(coordinator) if kind == RESULT]
+    assert results[0]["output_file"] == str(converted / "a.mkv")
+    assert sorted(os.listdir(converted)) == ["a.mkv"]
+    assert (converted / "a.mkv").read_text() == "new"
+
+    # The first worker comes back and learns it lost the lease.
+    assert coordinator.heartbeat("lost", lost["job"]["id"], {})["cancel"]
+    partial.write_text("partial")
+    with pytest.raises(RemoteJobError):
+        encode_farm._claim_output(
+            {"output_file": str(partial)}, str(source), SimpleNamespace(cancelled=True)
+        )
+    assert sorted(os.listdir(converted)) == ["a.mkv"]
+    assert (converted / "a.mkv").read_text() == "new"
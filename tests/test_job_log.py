@@ -0,0 +1,23 @@
+from job_log import JobLog, read_history
+
+
+def test_append_after_torn_line(tmp_path):
+    path = tmp_path / "convert.jsonl"
+    path.write_text('{"file": "a.mkv"}\n{"file": "b.m', encoding="utf-8")
+    log = JobLog(path)
+    log.append({"file": "c.mkv"})
+    log.append({"file": "d.mkv"})
+    log.close()
+    assert [r["file"] for r in read_history(path)] == ["a.mkv", "c.mkv", "d.mkv"]
+
+
+def test_rotation_keeps_history(tmp_path):
+    path = tmp_path / "streams.jsonl"
+    log = JobLog(path, max_bytes=64, keep=2)
+    for n in range(10):
+        log.append({"file": f"{n}.mkv"})
+    log.close()
+    files = [r["file"] for r in read_history(path)]
+    assert files == sorted(files, key=lambda name: int(name.split(".")[0]))
+    assert files[-1] == "9.mkv"
+    assert len(log.archives()) <= 2
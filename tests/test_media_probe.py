@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+import media_probe
+from media_probe import MediaInfo, ProbeCache
+
+
+def _info(n):
+    return MediaInfo(f"/library/{n}.mkv", n, n, 60.0, None, "matroska", ())
+
+
+def _stored(path):
+    with sqlite3.connect(str(path)) as db:
+        return db.execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+
+
+def test_rows_are_committed_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_probe, "COMMIT_ROWS", 100)
+    monkeypatch.setattr(media_probe, "COMMIT_SECONDS", 60)
+    cache = ProbeCache(tmp_path / "probe.db")
+    commits = []
+    cache._db.set_trace_callback(lambda sql: sql == "COMMIT" and commits.append(sql))
+    for n in range(250):
+        cache.put(_info(n))
+    assert len(commits) == 2
+    assert _stored(tmp_path / "probe.db") == 200
+    cache.close()
+    assert _stored(tmp_path / "probe.db") == 250
+
+
+def test_waiting_rows_are_committed_soon(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_probe, "COMMIT_SECONDS", 0.05)
+    cache = ProbeCache(tmp_path / "probe.db")
+    cache.put(_info(1))
+    deadline = time.monotonic() + 5
+    while _stored(tmp_path / "probe.db") == 0 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert _stored(tmp_path / "probe.db") == 1
+    cache.close()
+
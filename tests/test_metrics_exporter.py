@@ -0,0 +1,42 @@
+import metrics_exporter
+from metrics_exporter import MetricsExporter
+
+
+def _exporter(tmp_path, monkeypatch, fail_after):
+    exporter = MetricsExporter(
+        url="http://metrics.invalid:8086",
+        batch_size=2,
+        flush_seconds=3600,
+        spool_path=tmp_path / "spool.lp",
+    )
+    sent = []
+
+    def write(lines):
+        if len(sent) >= fail_after:
+            raise OSError("server down")
+        sent.append(list(lines))
+
+    monkeypatch.setattr(exporter, "_write", write)
+    return exporter, sent
+
+
+def test_export_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(metrics_exporter, "INFLUXDB_URL", "")
+    assert metrics_exporter.exporter_from_env() is None
+
+
+def test_replay_keeps_unsent_points(tmp_path, monkeypatch):
+    exporter, sent = _exporter(tmp_path, monkeypatch, fail_after=1)
+    exporter._spool(["a 1", "b 2", "c 3", "d 4", "e 5"])
+    exporter._replay_spool()
+    assert sent == [["a 1", "b 2"]]
+    replay = exporter.spool_path.with_suffix(".replay")
+    assert replay.read_text().splitlines() == ["c 3", "d 4", "e 5"]
+
+    # Points spooled meanwhile are sent after the older, unsent ones.
+    exporter._spool(["f 6"])
+    monkeypatch.setattr(exporter, "_write", lambda lines: sent.append(list(lines)))
+    exporter._replay_spool()
+    assert sent[1:] == [["c 3", "d 4"], ["e 5"], ["f 6"]]
+    assert not replay.exists() and not exporter.spool_path.exists()
+    exporter.close()
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from resource_governor import AdaptiveSlots, in_windows, parse_cpus, parse_windows
+
+
+def test_parsers():
+    assert parse_cpus("0-2,8") == (0, 1, 2, 8)
+    windows = parse_windows("22:00-06:30")
+    assert in_windows(windows, datetime(2026, 1, 1, 23, 0))
+    assert not in_windows(windows, datetime(2026, 1, 1, 12, 0))
+
+
+def test_slots_follow_memory_pressure():
+    slots = AdaptiveSlots(3, max_load=0, min_free_mb=1000)
+    assert slots.adjust(free_mb=500) == 2
+    assert slots.adjust(free_mb=500) == 1
+    assert slots.adjust(free_mb=500) is None
+    assert slots.adjust(free_mb=1100) is None  # not yet past the recovery margin
+    assert slots.adjust(free_mb=2000) == 2
@@ -0,0 +1,22 @@
+from media_probe import parse_probe_output
+from segmented_encode import mux_map_args, plan_cut_times
+
+
+def _info(*types):
+    streams = [{"index": i, "codec_type": t, "codec_name": "x"} for i, t in enumerate(types)]
+    return parse_probe_output("a.mkv", 1, 1, {"streams": streams, "format": {"duration": "60"}})
+
+
+def test_mux_keeps_original_stream_order():
+    info = _info("audio", "video", "subtitle", "attachment")
+    assert mux_map_args(info) == ["-map", "1:0", "-map", "0:v:0", "-map", "1:2", "-map", "1:3"]
+
+
+def test_mux_with_selected_streams_puts_video_first():
+    info = _info("audio", "video")
+    assert mux_map_args(info, ["-map", "1:0", "-sn"]) == ["-map", "0:v:0", "-map", "1:0", "-sn"]
+
+
+def test_cut_times_cover_duration():
+    times = plan_cut_times(600, 180)
+    assert times == sorted(times) and all(0 < t < 600 for t in times)
@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+import series_reorganizer
+from series_reorganizer import RenamePlan, RenameStep
+
+
+class Crash(Exception):
+    pass
+
+
+def _chain(root):
+    """E01 -> E02 -> E03 -> E04, each destination the next step's source."""
+    folder = root / "Season 1"
+    folder.mkdir()
+    paths = [str(folder / f"E0{n}.mkv") for n in range(1, 5)]
+    for path in paths[:3]:
+        with open(path, "w") as f:
+            f.write(os.path.basename(path))
+    steps = [RenameStep(paths[n], paths[n + 1], 1, n + 2) for n in (2, 1, 0)]
+    return RenamePlan(str(root), steps, [], 0), paths
+
+
+def _contents(paths):
+    result = {}
+    for path in paths:
+        if os.path.exists(path):
+            with open(path) as f:
+                result[os.path.basename(path)] = f.read()
+    return result
+
+
+def _leftovers(root):
+    return [
+        name
+        for _, _, names in os.walk(root)
+        for name in names
+        if name.startswith(".reorganize-") or name == series_reorganizer.JOURNAL_NAME
+    ]
+
+
+def test_apply_chain(tmp_path):
+    plan, paths = _chain(tmp_path)
+    moved = []
+    series_reorganizer.apply_plan(plan, on_moved=lambda old, new: moved.append(new))
+    assert _contents(paths) == {"E02.mkv": "E01.mkv", "E03.mkv": "E02.mkv", "E04.mkv": "E03.mkv"}
+    assert _leftovers(tmp_path) == []
+    assert moved[-3:] == [paths[3], paths[2], paths[1]]
+
+
+# A run of the chain writes the journal, makes three renames, marks phase 2
+# in the journal and makes three more renames.
+@pytest.mark.parametrize("crash_at", range(8))
+def test_crash_at_every_step_recovers(tmp_path, monkeypatch, crash_at):
+    root = tmp_path / "Show"
+    root.mkdir()
+    plan, paths = _chain(root)
+    calls = []
+    rename, replace = os.rename, os.replace
+
+    def failing(real):
+        def call(*args):
+            if len(calls) == crash_at:
+                raise Crash()
+            calls.append(args)
+            return real(*args)
+
+        return call
+
+    monkeypatch.setattr(os, "rename", failing(rename))
+    monkeypatch.setattr(os, "replace", failing(replace))
+    with pytest.raises(Crash):
+        series_reorganizer.apply_plan(plan)
+    monkeypatch.undo()
+
+    if series_reorganizer.interrupted(str(root)):
+        series_reorganizer.finish_interrupted(str(root))
+        assert _contents(paths) == {
+            "E02.mkv": "E01.mkv",
+            "E03.mkv": "E02.mkv",
+            "E04.mkv": "E03.mkv",
+        }
+    else:
+        # Crashed while writing the journal, before anything was renamed.
+        assert _contents(paths) == {name: name for name in ("E01.mkv", "E02.mkv", "E03.mkv")}
+    assert _leftovers(root) == []
+
+
+def test_plan_renames_deals_out_seasons(tmp_path):
+    root = tmp_path / "Show"
+    for season in (1, 2):
+        (root / f"Season {season}").mkdir(parents=True)
+        for episode in (1, 2, 3):
+            (root / f"Season {season}" / f"ep{episode} [ab{season}{episode}].mkv").touch()
+    plan = series_reorganizer.plan_renames(str(root), [4, 1])
+    names = [os.path.relpath(step.destination, root) for step in plan.steps]
+    assert os.path.join("Season 1", "[INDEX] Show - S01E04 [ab21].mkv") in names
+    assert os.path.join("Season 2", "[INDEX] Show - S02E01 [ab22].mkv") in names
+    assert [os.path.basename(p) for p in plan.unassigned] == ["ep3 [ab23].mkv"]
+
+
+def test_dry_run_leaves_interrupted_journal(engine, tmp_path, monkeypatch):
+    root = tmp_path / "Show"
+    root.mkdir()
+    plan, paths = _chain(root)
+    rename = os.rename
+
+    calls = []
+
+    def crash_on_third(*args):
+        calls.append(args)
+        if len(calls) == 3:
+            raise Crash()
+        return rename(*args)
+
+    monkeypatch.setattr(os, "rename", crash_on_third)
+    with pytest.raises(Crash):
+        series_reorganizer.apply_plan(plan)
+    monkeypatch.undo()
+    before = sorted(os.listdir(root / "Season 1"))
+
+    assert engine.plan_reorganize(str(root), [4]) is None
+    assert sorted(os.listdir(root / "Season 1")) == before
+    assert series_reorganizer.interrupted(str(root))
+
+    assert engine.finish_reorganize(str(root))
+    assert _contents(paths) == {"E02.mkv": "E01.mkv", "E03.mkv": "E02.mkv", "E04.mkv": "E03.mkv"}
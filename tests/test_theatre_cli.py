@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import theatre_cli
+from commit_phase import CommitJournal
+from library_scan import ScanCache
+from media_probe import ProbeCache
+from processed_manifest import ProcessedManifest
+from theatre_engine import TheatreEngine, scan_folder
+
+from conftest import write_video
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch, fake_ffprobe):
+    """Run :func:`theatre_cli.main` with its caches and journals in ``tmp_path``."""
+
+    def engine(**kwargs):
+        engine = TheatreEngine(
+            probe_cache=ProbeCache(tmp_path / "probe.db"),
+            manifest=ProcessedManifest(tmp_path / "manifest.db"),
+            **kwargs,
+        )
+        engine.commit_journal = CommitJournal(tmp_path / "commit.jsonl")
+        return engine
+
+    monkeypatch.setattr(theatre_cli, "TheatreEngine", engine)
+    monkeypatch.setattr(theatre_cli, "ffmpeg_tools_available", lambda: True)
+    monkeypatch.setattr(
+        theatre_cli,
+        "scan_folder",
+        lambda folder: scan_folder(folder, ScanCache(tmp_path / "scan.json")),
+    )
+    monkeypatch.setattr("theatre_engine.LOG_DIR", tmp_path / "logs")
+    return theatre_cli.main
+
+
+def _events(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_failing_probe_keeps_stdout_json(cli, tmp_path, capsys):
+    folder = tmp_path / "show"
+    write_video(folder / "good.mkv")
+    (folder / "broken.mkv").write_bytes(b"\x1a\x45\xdf\xa3 not a video")
+    cli(["scan", str(folder)])
+    events = _events(capsys)
+    assert [e["file"] for e in events if e["event"] == "media"] == [str(folder / "good.mkv")]
+
+
+def test_leftover_converted_folder_keeps_stdout_json(cli, tmp_path, capsys):
+    folder = tmp_path / "show"
+    write_video(folder / "a.mkv", tag="old")
+    write_video(folder / "converted" / "a.mkv", tag="new")
+    (folder / "converted" / ".segments").mkdir()
+    assert cli(["commit", str(folder)]) == 0
+    events = _events(capsys)
+    assert [e["file"] for e in events if e["event"] == "committed"] == [str(folder / "a.mkv")]
@@ -0,0 +1,75 @@
+import os
+
+import batch_journal
+from conftest import write_video
+from theatre_cli import ProgressPrinter
+from theatre_engine import SKIPPED, BatchRunner
+from watch_folder import StabilityTracker, WatchDaemon
+
+
+def _fake_batch(engine, video):
+    converted = os.path.join(os.path.dirname(video), "converted")
+    output = os.path.join(converted, os.path.basename(video))
+
+    def run(runner, on_result, error_message, on_progress=None):
+        engine.batch_journal.start("convert", {}, [video])
+        engine.batch_journal.mark(
+            video, batch_journal.DONE, output_file=output, converted_dir=converted
+        )
+        engine.processed_dirs.add(converted)
+        engine.expected_streams[output] = 3
+
+    return run
+
+
+def test_uncommitted_batches_are_forgotten(engine, tmp_path, monkeypatch):
+    video = str(tmp_path / "a.mkv")
+    with open(video, "wb") as f:
+        f.write(b"x")
+    monkeypatch.setattr(engine, "convert_runner", lambda files, **options: object())
+    monkeypatch.setattr(engine, "run", _fake_batch(engine, video))
+    daemon = WatchDaemon(engine, tmp_path)
+    for _ in range(3):
+        daemon._process([video])
+        assert not engine.processed_dirs
+        assert not engine.expected_streams
+        assert not engine.batch_journal.path.exists()
+        assert engine.batch_journal.interrupted() is None
+
+
+def test_stability_tracker_waits_for_settle(tmp_path):
+    video = tmp_path / "a.mkv"
+    video.write_bytes(b"x")
+    tracker = StabilityTracker(settle=5, limit=1)
+    assert tracker.add(str(video), now=0)
+    assert not tracker.add(str(tmp_path / "b.mkv"), now=0)
+    assert tracker.ready(now=1) == []
+    video.write_bytes(b"xy")
+    assert tracker.ready(now=4) == []
+    assert [path for path, _ in tracker.ready(now=10)] == [str(video)]
+
+
+def test_long_running_watch_stays_bounded(engine, tmp_path, monkeypatch, fake_ffprobe):
+    engine.probe_cache.memory_entries = 10
+    printer = ProgressPrinter(engine, interval=0)
+
+    def job(path, ctx):
+        engine.probe_cache.probe(path)
+        ctx.report(fraction=0.5)
+        if path.endswith("3.mkv"):
+            raise RuntimeError("broken")
+        return {"input_file": path}
+
+    def convert_runner(files, **options):
+        runner = BatchRunner(job, files, prepare=lambda runner: files[1:])
+        runner.events.put((SKIPPED, files[0], {"message": "not worth it"}))
+        return runner
+
+    monkeypatch.setattr(engine, "convert_runner", convert_runner)
+    monkeypatch.setattr(engine, "record_conversion", lambda result: None)
+    daemon = WatchDaemon(engine, tmp_path, on_progress=printer)
+    for batch in range(20):
+        files = [write_video(tmp_path / str(batch) / f"{n}.mkv") for n in range(5)]
+        daemon._process(files)
+        assert not printer._last
+        assert len(engine.probe_cache._memory) <= 10
@@ -0,0 +1,510 @@
+"""Command-line front end to the theatre engine, for servers and cron jobs.
+
+Mirrors the GUI operations without needing a display::
+
+    python theatre_cli.py scan FOLDER
+    python theatre_cli.py convert FOLDER --bitrate 2000 --workers 4 --commit
+    python theatre_cli.py streams FOLDER --audio auto --subtitle none --commit
+    python theatre_cli.py commit FOLDER
+    python theatre_cli.py recover [--rollback]
+    python theatre_cli.py resume [--commit | --discard]
+    python theatre_cli.py history [convert|streams]
+    python theatre_cli.py watch [FOLDER] --streams --bitrate auto --commit
+    python theatre_cli.py reorganize SERIES --seasons 24,12,24 [--apply]
+
+Every line written to stdout is a JSON object with an ``event`` key
+(``media``, ``progress``, ``batch``, ``log``, ``committed``, ``history``,
+``rename`` or ``summary``) so that other tools can follow a batch as it runs.
+"""
+
+import argparse
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from cost_model import MIN_SAVINGS_PERCENT, QUEUE_ORDER, QUEUE_ORDERS
+from encoders import DEFAULT_ENCODER
+from job_log import read_history
+from series_reorganizer import interrupted, parse_seasons
+from metrics_exporter import exporter_from_env
+from theatre_engine import (
+    DEFAULT_VIDEO_DIR,
+    LOG_DIR,
+    TheatreEngine,
+    ffmpeg_tools_available,
+    missing_tool_message,
+    scan_folder,
+    stream_choices,
+    stream_index,
+)
+from watch_folder import SETTLE_SECONDS, WatchDaemon
+
+# Minimum seconds between progress lines for the same file.
+PROGRESS_INTERVAL = 1.0
+
+# Status log entries that mean a file was handled successfully.
+DONE_STATUSES = ("converted", "skipped", "streams_updated")
+
+_emit_lock = threading.Lock()
+
+
+def emit(event, **fields):
+    """Write one JSON event line to stdout."""
+    line = json.dumps({"event": event, "time": time.time(), **fields})
+    with _emit_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+class ProgressPrinter:
+    """Emit progress events, at most one per file per ``interval`` seconds.
+
+    With an ``engine``, a ``batch`` event with the duration-weighted batch
+    progress, realtime factor, ETA and bytes saved follows at the same rate.
+    """
+
+    def __init__(self, engine=None, interval=PROGRESS_INTERVAL):
+        self.engine = engine
+        self.interval = interval
+        self._last = {}
+
+    def __call__(self, input_file, progress):
+        if progress is None:
+            # The file is finished; its rate limit is no longer needed.
+            self._last.pop(input_file, None)
+            return
+        now = time.monotonic()
+        if now - self._last.get(input_file, 0.0) >= self.interval:
+            self._last[input_file] = now
+            emit("progress", file=input_file, **progress)
+        if self.engine is not None and self.engine.progress is not None:
+            if now - self._last.get(None, 0.0) >= self.interval:
+                self._last[None] = now
+                snapshot = self.engine.progress.snapshot()
+                del snapshot["running"]
+                emit("batch", **snapshot)
+
+
+def _choose(labels, default, wanted, allow_none=False):
+    """Pick the label for ``wanted`` ("auto", "none" or a stream index)."""
+    if wanted == "auto":
+        return default
+    if allow_none and wanted == "none":
+        return ""
+    for label in labels:
+        if label and stream_index(label) == wanted:
+            return label
+    return None
+
+
+def _bitrate(text):
+    if text == "auto":
+        return text
+    try:
+        return str(int(text))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected kbps or auto")
+
+
+def _files(engine, folder):
+    files = scan_folder(folder)
+    if not files:
+        engine.log_status("error", message="No MKV or MP4 files found in selected folder.")
+    return files
+
+
+def _finish(engine, commit, args=None, files=None):
+    if commit:
+        engine.commit_converted_files()
+    engine.finish_timings()
+    if commit and getattr(args, "reorganize", None):
+        # The committed files keep their paths, so the batch's list is current
+        # unless an interrupted reorganisation moves them first.
+        if interrupted(args.folder):
+            files = None
+        if engine.finish_reorganize(args.folder):
+            plan = engine.plan_reorganize(args.folder, args.reorganize, files)
+            if plan is not None:
+                engine.apply_reorganize(plan)
+    errors = sum(1 for entry in engine.status_log if entry["status"] == "error")
+    emit(
+        "summary",
+        processed=sum(1 for entry in engine.status_log if entry["status"] in DONE_STATUSES),
+        errors=errors,
+        uncommitted=sorted(engine.processed_dirs),
+    )
+    return 1 if errors else 0
+
+
+def cmd_scan(engine, args):
+    files = _files(engine, args.folder)
+    runner = engine.probe_runner(files)
+
+    def on_result(info):
+        if info is not None:
+            emit(
+                "media",
+                file=info.path,
+                codec=info.video_codec,
+                duration=info.duration,
+                size=info.size,
+            )
+
+    engine.run(runner, on_result, "ffprobe failed")
+    return 0 if files else 1
+
+
+def _selected_streams(engine, files, args):
+    """Resolve ``--audio``/``--subtitle`` against the first file.
+
+    Returns ``(audio, subtitle)`` labels, or ``None`` after logging an error.
+    """
+    info = engine.probe_cache.probe(files[0])
+    audio_options, default_audio, subtitle_options, default_subtitle = stream_choices(info)
+    audio = _choose(audio_options, default_audio, args.audio)
+    subtitle = _choose(subtitle_options, default_subtitle, args.subtitle, allow_none=True)
+    if not audio:
+        engine.log_status("error", message="Please select an audio stream.")
+        return None
+    if subtitle is None:
+        engine.log_status("error", message=f"No subtitle stream {args.subtitle} in {files[0]}")
+        return None
+    return audio, subtitle
+
+
+def cmd_convert(engine, args):
+    files = _files(engine, args.folder)
+    if not files:
+        return 1
+    audio = subtitle = None
+    if args.audio or args.subtitle:
+        args.audio = args.audio or "auto"
+        args.subtitle = args.subtitle or "auto"
+        selected = _selected_streams(engine, files, args)
+        if selected is None:
+            return 1
+        audio, subtitle = selected
+    runner = engine.convert_runner(
+        files,
+        bitrate=args.bitrate,
+        encoder=args.encoder,
+        workers=max(1, args.workers),
+        segmented=args.segmented,
+        farm=args.farm,
+        audio=audio,
+        subtitle=subtitle,
+        order=args.order,
+        min_savings=args.min_savings,
+    )
+    if runner is not None:
+        if args.farm:
+            engine.log_status("info", message=f"Waiting for encode farm workers on {runner.url}")
+        engine.run(
+            runner,
+            engine.record_conversion,
+            "Encode farm job failed" if args.farm else "FFmpeg failed during conversion",
+            on_progress=ProgressPrinter(engine),
+        )
+    return _finish(engine, args.commit, args, files)
+
+
+def cmd_streams(engine, args):
+    files = _files(engine, args.folder)
+    if not files:
+        return 1
+    selected = _selected_streams(engine, files, args)
+    if selected is None:
+        return 1
+    audio, subtitle = selected
+    engine.run(
+        engine.streams_runner(files, audio, subtitle),
+        functools.partial(engine.record_streams_update, audio=audio, subtitle=subtitle),
+        "FFmpeg failed during stream update",
+        on_progress=ProgressPrinter(engine),
+    )
+    return _finish(engine, args.commit, args, files)
+
+
+def cmd_commit(engine, args):
+    engine.processed_dirs.update(
+        os.path.join(root, "converted")
+        for root, dirs, _ in os.walk(args.folder)
+        if "converted" in dirs
+    )
+    report = engine.commit_converted_files()
+    for entry in report.committed:
+        emit("committed", file=entry.path)
+    return 1 if report.failed else 0
+
+
+def cmd_recover(engine, args):
+    if not engine.interrupted_commits():
+        engine.log_status("info", message="No interrupted commits")
+        return 0
+    engine.recover_commits(rollback=args.rollback)
+    return 0
+
+
+def cmd_resume(engine, args):
+    batch = engine.interrupted_batch()
+    if batch is None:
+        engine.log_status("info", message="No interrupted batch")
+        return 0
+    if args.discard:
+        engine.discard_batch()
+        engine.log_status("info", message=f"Discarded the interrupted {batch.operation} batch")
+        return 0
+    runner = engine.resume_runner()
+    if runner is not None:
+        if batch.operation == "streams":
+            on_result = functools.partial(engine.record_streams_update, **batch.options)
+            error_message = "FFmpeg failed during stream update"
+        else:
+            on_result = engine.record_conversion
+            error_message = (
+                "Encode farm job failed"
+                if batch.options.get("farm")
+                else "FFmpeg failed during conversion"
+            )
+        engine.run(runner, on_result, error_message, on_progress=ProgressPrinter(engine))
+    return _finish(engine, args.commit)
+
+
+def cmd_reorganize(engine, args):
+    if args.apply and not engine.finish_reorganize(args.folder):
+        return 1
+    plan = engine.plan_reorganize(args.folder, args.seasons)
+    if plan is None:
+        # Dry run of a folder with an interrupted reorganisation, reported above.
+        return 0
+    if not args.apply:
+        for step in plan.steps:
+            emit(
+                "rename",
+                source=step.source,
+                destination=step.destination,
+                season=step.season,
+                episode=step.episode,
+            )
+        engine.log_status(
+            "info",
+            message=f"Dry run: {len(plan.steps)} rename(s), {plan.in_place} already in place; "
+            "add --apply to carry them out",
+        )
+        return 0
+    return 0 if engine.apply_reorganize(plan) else 1
+
+
+def cmd_history(args):
+    """Emit every record of the chosen run log, oldest first; needs no engine."""
+    for record in read_history(LOG_DIR / f"{args.log}.jsonl"):
+        emit("history", log=args.log, record=record)
+    return 0
+
+
+def cmd_watch(engine, args):
+    if not os.path.isdir(args.folder):
+        engine.log_status("error", message=f"{args.folder} is not a folder")
+        return 1
+    daemon = WatchDaemon(
+        engine,
+        args.folder,
+        convert=args.convert,
+        streams=args.streams,
+        commit=args.commit,
+        convert_options={
+            "bitrate": args.bitrate,
+            "encoder": args.encoder,
+            "workers": max(1, args.workers),
+            "segmented": args.segmented,
+        },
+        settle=args.settle,
+        poll=args.poll,
+        on_progress=ProgressPrinter(engine),
+    )
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: daemon.stop())
+    daemon.run()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless theatre batch runner")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    scan = sub.add_parser("scan", help="probe every video in FOLDER")
+    scan.add_argument("folder")
+    scan.set_defaults(handler=cmd_scan)
+
+    convert = sub.add_parser("convert", help="convert every video in FOLDER to HEVC")
+    convert.add_argument("folder")
+    convert.add_argument(
+        "--bitrate", type=_bitrate, default="2000", help="video bitrate in kbps, or auto"
+    )
+    convert.add_argument("--encoder", default=DEFAULT_ENCODER, help="encoder name or auto")
+    convert.add_argument("--workers", type=int, default=1, help="encodes run at once")
+    convert.add_argument(
+        "--segmented", action="store_true", help="split long files across jobs"
+    )
+    convert.add_argument("--farm", action="store_true", help="serve jobs to farm workers")
+    convert.add_argument(
+        "--order",
+        choices=QUEUE_ORDERS,
+        default=QUEUE_ORDER,
+        help="longest encodes first, most savings per second first, or path order",
+    )
+    convert.add_argument(
+        "--min-savings",
+        type=float,
+        default=MIN_SAVINGS_PERCENT,
+        metavar="PERCENT",
+        help="skip files expected to shrink by less than this",
+    )
+    convert.add_argument(
+        "--audio", help="also keep only this audio stream (index or auto) in the same pass"
+    )
+    convert.add_argument(
+        "--subtitle", help="also keep only this subtitle stream (index, none or auto)"
+    )
+    convert.add_argument(
+        "--commit", action="store_true", help="move converted files over the originals"
+    )
+    convert.add_argument(
+        "--reorganize",
+        type=parse_seasons,
+        metavar="SEASONS",
+        help="with --commit, then renumber FOLDER into seasons of these lengths (e.g. 24,12,24)",
+    )
+    convert.set_defaults(handler=cmd_convert)
+
+    streams = sub.add_parser("streams", help="keep one audio/subtitle stream per video")
+    streams.add_argument("folder")
+    streams.add_argument("--audio", default="auto", help="stream index or auto")
+    streams.add_argument(
+        "--subtitle", default="auto", help="stream index, none (remove) or auto"
+    )
+    streams.add_argument(
+        "--commit", action="store_true", help="move updated files over the originals"
+    )
+    streams.add_argument(
+        "--reorganize",
+        type=parse_seasons,
+        metavar="SEASONS",
+        help="with --commit, then renumber FOLDER into seasons of these lengths (e.g. 24,12,24)",
+    )
+    streams.set_defaults(handler=cmd_streams)
+
+    commit = sub.add_parser(
+        "commit", help="verify and move every converted/ output below FOLDER into place"
+    )
+    commit.add_argument("folder")
+    commit.set_defaults(handler=cmd_commit)
+
+    recover = sub.add_parser("recover", help="finish a commit interrupted by a crash")
+    recover.add_argument(
+        "--rollback", action="store_true", help="restore the originals instead"
+    )
+    recover.set_defaults(handler=cmd_recover)
+
+    resume = sub.add_parser("resume", help="finish a batch cut short by a crash")
+    resume_mode = resume.add_mutually_exclusive_group()
+    resume_mode.add_argument(
+        "--commit", action="store_true", help="move the results over the originals"
+    )
+    resume_mode.add_argument(
+        "--discard", action="store_true", help="forget the batch instead"
+    )
+    resume.set_defaults(handler=cmd_resume)
+
+    history = sub.add_parser("history", help="print the run log of every past batch")
+    history.add_argument("log", nargs="?", choices=("convert", "streams"), default="convert")
+    history.set_defaults(handler=cmd_history)
+
+    watch = sub.add_parser(
+        "watch", help="keep watching FOLDER and process new videos once fully written"
+    )
+    watch.add_argument("folder", nargs="?", default=DEFAULT_VIDEO_DIR)
+    watch.add_argument(
+        "--streams", action="store_true", help="also keep only the default audio/subtitle"
+    )
+    watch.add_argument(
+        "--no-convert",
+        dest="convert",
+        action="store_false",
+        help="only update streams (with --streams)",
+    )
+    watch.add_argument(
+        "--bitrate", type=_bitrate, default="2000", help="video bitrate in kbps, or auto"
+    )
+    watch.add_argument("--encoder", default=DEFAULT_ENCODER, help="encoder name or auto")
+    watch.add_argument("--workers", type=int, default=1, help="encodes run at once")
+    watch.add_argument(
+        "--segmented", action="store_true", help="split long files across jobs"
+    )
+    watch.add_argument(
+        "--settle",
+        type=float,
+        default=SETTLE_SECONDS,
+        metavar="SECONDS",
+        help="how long a file must stay unchanged before it is processed",
+    )
+    watch.add_argument(
+        "--poll", action="store_true", help="poll the folder instead of using inotify"
+    )
+    watch.add_argument(
+        "--commit", action="store_true", help="move results over the originals after each batch"
+    )
+    watch.set_defaults(handler=cmd_watch)
+
+    reorganize = sub.add_parser(
+        "reorganize", help="merge season folders and renumber the episodes of a series"
+    )
+    reorganize.add_argument("folder", help="series folder; its name becomes the show name")
+    reorganize.add_argument(
+        "--seasons",
+        type=parse_seasons,
+        required=True,
+        help="true episode count of each season, e.g. 24,12,24",
+    )
+    reorganize.add_argument(
+        "--apply", action="store_true", help="rename the files instead of printing the plan"
+    )
+    reorganize.set_defaults(handler=cmd_reorganize)
+
+    args = parser.parse_args(argv)
+    if args.handler is cmd_watch and not (args.convert or args.streams):
+        parser.error("--no-convert needs --streams")
+    if getattr(args, "reorganize", None) and not args.commit:
+        parser.error("--reorganize needs --commit")
+    if args.handler is cmd_history:
+        return cmd_history(args)
+    engine = TheatreEngine(
+        log=lambda entry: emit("log", **entry), metrics=exporter_from_env()
+    )
+    try:
+        # Reorganising only renames files.
+        if args.handler is not cmd_reorganize and not ffmpeg_tools_available():
+            engine.log_status("error", message=missing_tool_message("ffmpeg/ffprobe"))
+            return 2
+        if engine.interrupted_commits() and args.handler is not cmd_recover:
+            engine.log_status(
+                "error",
+                message="A previous commit was interrupted; run 'recover' (or 'recover --rollback') first",
+            )
+            return 2
+        if engine.interrupted_batch() and args.handler is not cmd_resume:
+            engine.log_status(
+                "info",
+                message="An earlier batch has unfinished or uncommitted files; 'resume' picks it up, 'resume --discard' forgets it",
+            )
+        return args.handler(engine, args)
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1363 @@
+"""GUI-free batch engine behind the theatre app and its command line.
+
+A :class:`BatchRunner` owns a worker pool on its own thread and reports back
+through a queue of ``(kind, input_file, payload)`` events. Nothing in this
+module touches Tk, so a front end is free to drain the queue at whatever rate
+it can repaint without slowing the encodes down.
+
+The per-file jobs (:func:`convert_file` and :func:`update_file_streams`) and
+the :class:`TheatreEngine` that scans, records results and commits outputs
+live here so that the GUI, the CLI and the encode farm workers all run
+exactly the same code.
+"""
+
+import contextlib
+import functools
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import auto_bitrate
+import batch_journal
+import library_scan
+import resource_governor
+import series_reorganizer
+from batch_journal import BatchJournal
+from batch_progress import BatchProgress
+from commit_phase import CommitJournal, commit_all, finish_interrupted, rollback_interrupted
+from cost_model import MIN_SAVINGS_PERCENT, QUEUE_ORDER, plan, skip_message
+from encoders import EncoderUnavailable, select_backend
+from ffmpeg_runner import FFmpegError, run_ffmpeg
+from io_scheduler import (
+    ENCODE_JOBS_PER_DEVICE,
+    IO_JOBS_PER_DEVICE,
+    IOScheduler,
+    device_of,
+    estimate_output_size,
+    interleave_by_device,
+)
+from job_log import JobLog
+from library_scan import iter_videos
+from media_probe import ProbeCache, ProbeError
+from phase_timing import PhaseTimer, format_summary
+from processed_manifest import ProcessedManifest
+from segmented_encode import SEGMENT_MIN_DURATION, encode_segmented
+
+# Flag to prevent opening a console window for subprocesses on Windows.
+CREATE_NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+
+# Default directory used when no folder is selected. Users can override
+# this path with the STREAM_SELECTOR_DIR environment variable. The default
+# falls back to a "videos/unprocessed/new" directory in the user's home
+# folder to work across operating systems.
+DEFAULT_VIDEO_DIR = Path(
+    os.getenv("STREAM_SELECTOR_DIR", Path.home() / "videos" / "unprocessed" / "new")
+)
+
+# Run logs (convert.jsonl / streams.jsonl) are appended to here.
+LOG_DIR = Path.home() / "Documents"
+
+# Number of ffprobe calls run at once when probing a whole folder. Probing is
+# mostly waiting on disk, so this can exceed the core count.
+PROBE_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+# Numeric progress values exported as metrics.
+PROGRESS_FIELDS = ("fraction", "fps", "speed", "bitrate_kbps", "out_time")
+
+# Event kinds posted to BatchRunner.events.
+PROGRESS = "progress"
+RESULT = "result"
+ERROR = "error"
+DONE = "done"
+# Posted while a batch plans its queue: a file left out, then the queue.
+SKIPPED = "skipped"
+QUEUED = "queued"
+# Something worth a line in the status log, e.g. a farm lease that expired.
+NOTICE = "notice"
+
+
+class JobContext:
+    """Handle passed to a job function for reporting and process control."""
+
+    def __init__(self, runner, input_file):
+        self._runner = runner
+        self.input_file = input_file
+
+    @property
+    def cancelled(self):
+        return self._runner.cancelled
+
+    def report(self, **progress):
+        """Publish a progress update (``fraction``, ``fps``, ``time``...)."""
+        self._runner.events.put((PROGRESS, self.input_file, progress))
+
+    def phase(self, name):
+        """Time a phase of this job (``probe``, ``encode``...) if the batch is timed."""
+        timer = self._runner.timer
+        return timer.phase(self.input_file, name) if timer else contextlib.nullcontext()
+
+    def popen(self, cmd, **kwargs):
+        """Start a subprocess that is terminated if the batch is cancelled.
+
+        It runs under the batch's resource policy and is suspended straight
+        away while the batch is paused.
+        """
+        policy = self._runner.policy
+        flags = policy.creationflags() if policy else 0
+        kwargs.setdefault("creationflags", CREATE_NO_WINDOW | flags)
+        process = subprocess.Popen(cmd, **kwargs)
+        if policy is not None:
+            policy.apply(process.pid)
+        self._runner._track(process)
+        return process
+
+
+class BatchRunner:
+    """Run ``job(input_file, ctx)`` for every file on a background pool.
+
+    The return value of each job is posted as a ``RESULT`` event and any
+    exception as an ``ERROR`` event. A single ``DONE`` event follows once
+    every job has finished or been cancelled. An optional
+    :class:`phase_timing.PhaseTimer` records queue wait and job phases.
+    Processes are started under ``policy`` (a
+    :class:`resource_governor.ResourcePolicy`), and ``governor`` runs
+    alongside the batch to adapt its slots and pause it on schedule.
+
+    ``prepare(runner)``, if given, runs on the batch thread before any job
+    and returns the files to run in place of ``files``. It can post
+    ``SKIPPED`` events for files it leaves out (without a file for a
+    summary line); a ``QUEUED`` event with the final list follows.
+    """
+
+    def __init__(
+        self, job, files, workers=1, timer=None, policy=None, governor=None, prepare=None
+    ):
+        self.job = job
+        self.files = list(files)
+        self.workers = max(1, workers)
+        self.timer = timer
+        self.policy = policy
+        self.governor = governor
+        self.prepare = prepare
+        self.events = queue.Queue()
+        self._cancel = threading.Event()
+        # Cleared while the batch is paused.
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._processes = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def paused(self):
+        return not self._resumed.is_set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Skip queued jobs and terminate running ffmpeg processes."""
+        self._cancel.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        # Suspended processes only act on the termination once continued.
+        self.resume()
+
+    def pause(self):
+        """Suspend running ffmpeg processes and hold back queued jobs."""
+        self._resumed.clear()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            resource_governor.suspend(process)
+
+    def resume(self):
+        if not self.paused:
+            return
+        with self._lock:
+            processes = list(self._processes)
+            self._resumed.set()
+        for process in processes:
+            resource_governor.resume(process)
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _track(self, process):
+        with self._lock:
+            self._processes.add(process)
+            if self.paused:
+                resource_governor.suspend(process)
+        if self._cancel.is_set() and process.poll() is None:
+            process.terminate()
+
+    def _run(self):
+        if self.prepare is not None:
+            self.files = run_prepare(self)
+        if self.governor is not None:
+            self.governor.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(self._run_job, f, time.monotonic()) for f in self.files]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            if self.governor is not None:
+                self.governor.stop()
+        self.events.put((DONE, None, None))
+
+    def _run_job(self, input_file, queued):
+        while not self._resumed.wait(1.0):
+            if self._cancel.is_set():
+                return
+        if self._cancel.is_set():
+            return
+        if self.timer is not None:
+            self.timer.add(input_file, "queue", time.monotonic() - queued, queued)
+        try:
+            with self.timer.profiled() if self.timer else contextlib.nullcontext():
+                result = self.job(input_file, JobContext(self, input_file))
+        except Exception as e:
+            self.events.put((ERROR, input_file, e))
+        else:
+            self.events.put((RESULT, input_file, result))
+
+
+def run_prepare(runner):
+    """Call ``runner.prepare`` and post the resulting ``QUEUED`` event.
+
+    A failure is posted as an ``ERROR`` without a file and leaves the queue
+    empty, as does cancelling the batch while it is being planned.
+    """
+    try:
+        files = list(runner.prepare(runner))
+    except Exception as e:
+        runner.events.put((ERROR, None, e))
+        files = []
+    if runner.cancelled:
+        files = []
+    runner.events.put((QUEUED, None, files))
+    return files
+
+
+def probe_or_none(probe_cache, filepath):
+    """Probe from a worker thread.
+
+    A missing ffprobe is raised so the caller can report it; an unreadable
+    file yields ``None``.
+    """
+    try:
+        return probe_cache.probe(filepath)
+    except ProbeError as e:
+        print(f"ffprobe error for {filepath}:", e, file=sys.stderr)
+        return None
+
+
+def converted_path(input_file, output_name=None):
+    """Output location for ``input_file`` in its sibling ``converted/`` folder.
+
+    The output keeps the input's name unless ``output_name`` is given.
+    """
+    converted_dir = os.path.join(os.path.dirname(input_file), "converted")
+    os.makedirs(converted_dir, exist_ok=True)
+    name = output_name or os.path.basename(input_file)
+    return converted_dir, os.path.join(converted_dir, name)
+
+
+def run_job_ffmpeg(cmd, duration, ctx):
+    """Run ffmpeg, reporting progress through ``ctx`` until it exits."""
+    ctx.report(fraction=0.0)
+    try:
+        run_ffmpeg(
+            cmd,
+            duration,
+            on_progress=lambda event: ctx.report(**event._asdict()),
+            popen=ctx.popen,
+        )
+    except FFmpegError:
+        # Never leave a truncated output behind for the commit step.
+        output_path = cmd[-1]
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+
+def output_details(probe_cache, output_path):
+    """Codec and size of a finished output, probed once and cached."""
+    info = probe_or_none(probe_cache, output_path)
+    return {
+        "after_codec": info.video_codec if info else None,
+        "after_size": info.size if info else os.path.getsize(output_path),
+    }
+
+
+def selected_stream_args(audio_index, subtitle_index, input_index=0):
+    """``-map`` options keeping one audio and at most one subtitle stream.
+
+    ``subtitle_index`` of ``None`` drops all subtitles. The kept subtitle is
+    always output stream ``s:0``; see :data:`FORCED_SUBTITLE_ARGS`.
+    """
+    args = ["-map", f"{input_index}:{audio_index}"]
+    if subtitle_index is None:
+        return args + ["-sn"]
+    return args + ["-map", f"{input_index}:{subtitle_index}"]
+
+
+FORCED_SUBTITLE_ARGS = ["-disposition:s:0", "forced"]
+
+
+def _kept_streams(info, audio_index, subtitle_index):
+    if info is None or info.video is None:
+        return None
+    keep = {info.video.index, int(audio_index)}
+    if subtitle_index is not None:
+        keep.add(int(subtitle_index))
+    return keep
+
+
+def convert_file(
+    input_file,
+    ctx,
+    probe_cache,
+    bitrate,
+    encoder="auto",
+    threads=None,
+    segmented=False,
+    workers=1,
+    slots=None,
+    scheduler=None,
+    select_streams=False,
+    audio_index=None,
+    subtitle_index=None,
+    output_name=None,
+):
+    """Convert a single file to HEVC in ``converted/``.
+
+    Files that are already HEVC or AV1 are skipped. Returns a result dict
+    describing the outcome; no logging is done here. A ``bitrate`` of
+    ``"auto"`` is chosen per file (or series) by
+    :func:`auto_bitrate.choose_bitrate`. With a ``scheduler``
+    the job first waits for its device to have an I/O slot and room for the
+    estimated output.
+
+    With ``select_streams`` the stream update is applied in the same pass:
+    only ``audio_index`` and ``subtitle_index`` (``None`` for no subtitles)
+    are kept, as :func:`update_file_streams` would. Files that are already
+    HEVC then get just the stream update.
+
+    ``output_name`` replaces the input's name in ``converted/`` (see
+    :func:`converted_path`).
+    """
+    with ctx.phase("probe"):
+        info = probe_or_none(probe_cache, input_file)
+    duration = info.duration if info else None
+    before_size = info.size if info else os.path.getsize(input_file)
+    codec = info.video_codec if info else None
+    result = {
+        "input_file": input_file,
+        "duration": duration,
+        "before_codec": codec,
+        "before_size": before_size,
+        # -map 0 keeps every stream, so the commit check expects all of them.
+        "expected_streams": len(info.streams) if info else None,
+    }
+    if codec in ("hevc", "av1"):
+        if select_streams:
+            # Nothing to encode; apply just the stream selection.
+            streams = update_file_streams(
+                input_file, ctx, probe_cache, audio_index, subtitle_index, scheduler, output_name
+            )
+            if streams["status"] == "updated":
+                result.update(streams, status="converted", encoder="stream copy")
+                return result
+        result["status"] = "skipped"
+        return result
+
+    converted_dir, output_path = converted_path(input_file, output_name)
+    backend = select_backend(encoder)
+    threads = resource_governor.POLICY.encoder_threads(backend.name, threads)
+    if bitrate == auto_bitrate.AUTO:
+
+        @contextlib.contextmanager
+        def sampling_slot():
+            # Taken only once the series is known to need sampling.
+            with _encoder_slot(slots, ctx), ctx.phase("sample"):
+                yield
+
+        bitrate, samples = auto_bitrate.choose_bitrate(
+            input_file, info, backend, threads, popen=ctx.popen, slot=sampling_slot
+        )
+        result.update(
+            auto_bitrate=True,
+            sample_cached=samples.get("cached", False),
+            bitrate_reason=samples.get("reason"),
+        )
+    result["bitrate"] = int(bitrate)
+    keep = None
+    stream_args = ["-map", "0"]
+    segment_stream_args = None
+    if select_streams:
+        keep = _kept_streams(info, audio_index, subtitle_index)
+        result["expected_streams"] = 2 if subtitle_index is None else 3
+        forced = FORCED_SUBTITLE_ARGS if subtitle_index is not None else []
+        stream_args = [
+            "-map",
+            "0:v:0",
+            *selected_stream_args(audio_index, subtitle_index),
+            *forced,
+        ]
+        segment_stream_args = [*selected_stream_args(audio_index, subtitle_index, 1), *forced]
+    cmd = [
+        "ffmpeg",
+        "-y",
+        *backend.input_args(),
+        "-i",
+        input_file,
+        *stream_args,
+        *backend.video_args(bitrate, threads),
+        "-c:a",
+        "copy",
+        "-c:s",
+        "copy",
+        "-map_chapters",
+        "0",
+        output_path,
+    ]
+    split = segmented and info and info.video and (duration or 0) >= SEGMENT_MIN_DURATION
+    estimate = estimate_output_size(info, video_kbps=bitrate, keep=keep)
+    if split:
+        estimate += before_size  # stream-copied source segments
+    with _admitted(scheduler, output_path, estimate, ENCODE_JOBS_PER_DEVICE, ctx):
+        if split:
+            ctx.report(fraction=0.0)
+            try:
+                with ctx.phase("encode"):
+                    encode_segmented(
+                        input_file,
+                        output_path,
+                        info,
+                        backend,
+                        bitrate,
+                        threads=threads,
+                        workers=workers,
+                        slots=slots,
+                        popen=ctx.popen,
+                        on_progress=lambda progress: ctx.report(**progress),
+                        stream_args=segment_stream_args,
+                    )
+            except Exception:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                raise
+        else:
+            with _encoder_slot(slots, ctx), ctx.phase("encode"):
+                run_job_ffmpeg(cmd, duration, ctx)
+
+    with ctx.phase("verify"):
+        details = output_details(probe_cache, output_path)
+    result.update(
+        status="converted",
+        encoder=backend.label,
+        output_file=output_path,
+        converted_dir=converted_dir,
+        **details,
+    )
+    return result
+
+
+@contextlib.contextmanager
+def _admitted(scheduler, output_path, estimate, per_device, ctx):
+    """Hold an admission from ``scheduler``, if any; waiting is timed as "wait"."""
+    with contextlib.ExitStack() as stack:
+        if scheduler is not None:
+            with ctx.phase("wait"):
+                stack.enter_context(
+                    scheduler.admit(
+                        output_path, estimate, per_device, cancelled=lambda: ctx.cancelled
+                    )
+                )
+        yield
+
+
+@contextlib.contextmanager
+def _encoder_slot(slots, ctx):
+    """Hold one of the batch's encoder ``slots``, if any; waiting is timed as "wait"."""
+    if slots is None:
+        yield
+        return
+    with ctx.phase("wait"):
+        slots.acquire()
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def streams_already_selected(info, audio_index, subtitle_index):
+    """True if ``info`` holds exactly the streams an update would keep."""
+    if info is None or info.video is None:
+        return False
+    wanted = {info.video.index, int(audio_index)}
+    if subtitle_index is not None:
+        wanted.add(int(subtitle_index))
+    by_index = {s.index: s for s in info.streams}
+    if set(by_index) != wanted:
+        return False
+    return subtitle_index is None or by_index[int(subtitle_index)].forced
+
+
+def update_file_streams(
+    input_file, ctx, probe_cache, audio_index, subtitle_index, scheduler=None, output_name=None
+):
+    """Remux a file into ``converted/`` keeping only the chosen streams.
+
+    ``subtitle_index`` of ``None`` drops all subtitles; otherwise the chosen
+    subtitle is kept and marked forced. Files that already contain just
+    those streams are skipped without being rewritten. ``output_name``
+    works as for :func:`convert_file`.
+    """
+    with ctx.phase("probe"):
+        info = probe_or_none(probe_cache, input_file)
+    duration = info.duration if info else None
+    before_codec = info.video_codec if info else None
+    before_size = info.size if info else os.path.getsize(input_file)
+    if streams_already_selected(info, audio_index, subtitle_index):
+        return {
+            "status": "skipped",
+            "input_file": input_file,
+            "duration": duration,
+            "before_codec": before_codec,
+            "before_size": before_size,
+        }
+    converted_dir, output_path = converted_path(input_file, output_name)
+
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        input_file,
+        "-map",
+        "0:v:0",
+        *selected_stream_args(audio_index, subtitle_index),
+        "-c:v",
+        "copy",
+        "-c:a",
+        "copy",
+        "-c:s",
+        "copy",
+        "-map_chapters",
+        "0",
+    ]
+    if subtitle_index is not None:
+        cmd.extend(FORCED_SUBTITLE_ARGS)
+    cmd.append(output_path)
+
+    keep = _kept_streams(info, audio_index, subtitle_index)
+    estimate = estimate_output_size(info, keep=keep) if info else before_size
+    with _admitted(scheduler, output_path, estimate, IO_JOBS_PER_DEVICE, ctx):
+        with ctx.phase("encode"):
+            run_job_ffmpeg(cmd, duration, ctx)
+    with ctx.phase("verify"):
+        details = output_details(probe_cache, output_path)
+    return {
+        "status": "updated",
+        "input_file": input_file,
+        "output_file": output_path,
+        "converted_dir": converted_dir,
+        "duration": duration,
+        "before_codec": before_codec,
+        "before_size": before_size,
+        "expected_streams": 2 if subtitle_index is None else 3,
+        **details,
+    }
+
+
+def ffmpeg_tools_available():
+    return bool(shutil.which("ffmpeg") and shutil.which("ffprobe"))
+
+
+def missing_tool_message(tool_name):
+    return f"Missing required tool: {tool_name}. Install ffmpeg to provide ffmpeg/ffprobe."
+
+
+def scan_folder(folder, cache=None):
+    """Return every MKV/MP4 below ``folder``, sorted.
+
+    Empty unless the folder itself holds a video (see
+    :func:`library_scan.iter_videos`). ``cache`` defaults to the shared
+    :class:`library_scan.ScanCache`.
+    """
+    return sorted(iter_videos(folder, cache or library_scan.default_cache()))
+
+
+def stream_label(stream):
+    """Dropdown label for a stream, e.g. ``Stream 2 - eng [FORCED] (Signs)``."""
+    label = f"Stream {stream.index} - {stream.language}"
+    if "forced" in stream.title.lower():
+        label += " [FORCED]"
+    if stream.title:
+        label += f" ({stream.title})"
+    return label
+
+
+def stream_index(label):
+    """Stream index from a label built by :func:`stream_label`."""
+    return label.split(" ")[1]
+
+
+def stream_choices(info):
+    """Audio/subtitle labels for ``info`` and the ones selected by default.
+
+    Returns ``(audio_options, default_audio, subtitle_options,
+    default_subtitle)``. English audio is preferred; for subtitles an English
+    signs/forced track, then the first track. The empty subtitle option means
+    "remove subtitles".
+    """
+    audio_options = []
+    subtitle_options = [""]
+    default_audio = None
+    default_subtitle = None
+
+    for stream in info.audio_streams if info else []:
+        label = stream_label(stream)
+        audio_options.append(label)
+        if default_audio is None and stream.language.lower() == "eng":
+            default_audio = label
+
+    for stream in info.subtitle_streams if info else []:
+        label = stream_label(stream)
+        subtitle_options.append(label)
+        title_lower = stream.title.lower()
+        if (
+            default_subtitle is None
+            and stream.language.lower() == "eng"
+            and ("signs" in title_lower or "forced" in title_lower)
+        ):
+            default_subtitle = label
+
+    if default_audio is None and audio_options:
+        default_audio = audio_options[0]
+    if default_subtitle is None:
+        default_subtitle = subtitle_options[1] if len(subtitle_options) > 1 else ""
+    return audio_options, default_audio, subtitle_options, default_subtitle
+
+
+def _error_detail(error):
+    """One-line description of a failed job, preferring ffmpeg's last words."""
+    return error.last_line() if isinstance(error, FFmpegError) else str(error)
+
+
+class TheatreEngine:
+    """GUI-free state and operations shared by the Tk app and the CLI.
+
+    Holds the run logs and the set of ``converted/`` folders awaiting commit,
+    builds the runners for each operation and records their results.
+    ``log`` receives every status entry (it prints by default); ``metrics``
+    is an optional :class:`metrics_exporter.MetricsExporter`.
+    """
+
+    def __init__(self, probe_cache=None, manifest=None, log=None, metrics=None):
+        self.probe_cache = probe_cache or ProbeCache()
+        self.manifest = manifest or ProcessedManifest()
+        self.metrics = metrics
+        # PhaseTimer of the current batch, including its commit
+        self.timings = None
+        # BatchProgress of the current convert or streams batch
+        self.progress = None
+        self._operation = None
+        self._log = log or self._print_entry
+        self.processed_dirs = set()
+        # output path -> number of streams the commit check expects
+        self.expected_streams = {}
+        self.commit_journal = CommitJournal()
+        # Per-file state of the current batch, left behind by a crash.
+        self.batch_journal = BatchJournal()
+        self.batch_journal.load()
+        # Shared by every job so conversions and stream updates on the same
+        # volume are admitted against each other.
+        self.io_scheduler = IOScheduler()
+        self.status_log = []
+        # One line per finished file, kept across runs.
+        self.convert_log = JobLog(LOG_DIR / "convert.jsonl")
+        self.streams_log = JobLog(LOG_DIR / "streams.jsonl")
+
+    def close(self):
+        self.probe_cache.close()
+        self.manifest.close()
+        self.convert_log.close()
+        self.streams_log.close()
+        if self.metrics is not None:
+            self.metrics.close()
+
+    @staticmethod
+    def _print_entry(entry):
+        print(f"{entry['status'].upper()}: {entry['message'] or entry['output'] or entry['input']}")
+
+    def log_status(
+        self,
+        status,
+        input_file=None,
+        output_file=None,
+        message="",
+        before_codec=None,
+        after_codec=None,
+        before_size=None,
+        after_size=None,
+    ):
+        entry = {
+            "status": status,
+            "input": input_file,
+            "output": output_file,
+            "message": message,
+        }
+        if before_codec is not None:
+            entry["before_codec"] = before_codec
+        if after_codec is not None:
+            entry["after_codec"] = after_codec
+        if before_size is not None:
+            entry["before_size"] = before_size
+        if after_size is not None:
+            entry["after_size"] = after_size
+        self.status_log.append(entry)
+        self._log(entry)
+        return entry
+
+    def probe_runner(self, files, workers=PROBE_WORKERS):
+        """Runner that probes ``files`` into the cache; results are MediaInfo."""
+        return BatchRunner(
+            lambda input_file, ctx: probe_or_none(self.probe_cache, input_file),
+            files,
+            workers=workers,
+        )
+
+    def convert_runner(
+        self,
+        files,
+        bitrate,
+        encoder="auto",
+        workers=1,
+        segmented=False,
+        farm=False,
+        audio=None,
+        subtitle=None,
+        order=QUEUE_ORDER,
+        min_savings=MIN_SAVINGS_PERCENT,
+    ):
+        """Runner converting ``files`` to HEVC, or ``None`` if there are none.
+
+        Files the manifest knows are finished are dropped before any process
+        is started. With ``farm`` the jobs are served to remote workers.
+        Passing the ``audio``/``subtitle`` labels also applies that stream
+        selection in the same pass (an empty ``subtitle`` removes subtitles).
+
+        The queue is ordered by :func:`cost_model.plan` (see ``order``), and
+        files expected to shrink by less than ``min_savings`` percent are
+        skipped, unless a stream selection still has to be applied to them.
+        The manifest check, planning and the batch progress all stat or probe
+        every file, and planning may wait for encoder detection, so they run
+        on the batch's own thread once the runner is started.
+        """
+        if not files:
+            return None
+        self._operation = "convert"
+        self.timings = PhaseTimer()
+        selection = {}
+        if audio:
+            selection = {
+                "select_streams": True,
+                "audio_index": stream_index(audio),
+                "subtitle_index": stream_index(subtitle) if subtitle.strip() else None,
+            }
+        options = {
+            "bitrate": bitrate,
+            "encoder": encoder,
+            "workers": workers,
+            "segmented": segmented,
+            "farm": farm,
+            "audio": audio,
+            "subtitle": subtitle,
+            "order": order,
+            "min_savings": min_savings,
+        }
+
+        def prepare(runner):
+            if selection:
+                # The manifest only knows about codecs, so finished files may
+                # still need their streams cleaned up.
+                pending = runner.files
+            else:
+                pending, finished = self.manifest.filter_pending(runner.files)
+                if finished:
+                    message = f"{len(finished)} file(s) already processed according to the manifest"
+                    runner.events.put((SKIPPED, None, {"message": message}))
+            planned = self._plan_queue(
+                pending, bitrate, encoder, order, None if selection else min_savings, runner
+            )
+            self.batch_journal.start("convert", options, planned)
+            queue = interleave_by_device(planned)
+            self.progress = self._batch_progress(queue)
+            return queue
+
+        if farm:
+            # Imported here because the farm itself imports this module.
+            from encode_farm import FarmCoordinator
+
+            # Remote workers pick their own encoder threads and concurrency.
+            return self._track(
+                FarmCoordinator(
+                    files,
+                    {"bitrate": bitrate, "encoder": encoder, "segmented": segmented, **selection},
+                    prepare=prepare,
+                )
+            )
+
+        # Shared by whole-file and segment encodes so the batch never runs
+        # more than ``workers`` encoders at once, and fewer under pressure.
+        slots = resource_governor.AdaptiveSlots(workers)
+        job = self._journalled(
+            convert_file,
+            probe_cache=self.probe_cache,
+            bitrate=bitrate,
+            encoder=encoder,
+            threads=resource_governor.POLICY.cpu_threads(workers),
+            segmented=segmented,
+            workers=workers,
+            slots=slots,
+            scheduler=self.io_scheduler,
+            **selection,
+        )
+        runner = BatchRunner(
+            job,
+            files,
+            workers=workers,
+            timer=self.timings,
+            policy=resource_governor.POLICY,
+            prepare=prepare,
+        )
+        runner.governor = resource_governor.Governor(runner, slots)
+        return self._track(runner)
+
+    def _probe_many(self, files):
+        """``{path: MediaInfo or None}``, probing uncached files in parallel."""
+        infos = {path: self.probe_cache.get(path) for path in files}
+        missing = [path for path, info in infos.items() if info is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+                infos.update(
+                    zip(missing, pool.map(lambda p: probe_or_none(self.probe_cache, p), missing))
+                )
+        return infos
+
+    def _plan_queue(self, files, bitrate, encoder, order, min_savings, runner):
+        """Order ``files`` by estimated cost.
+
+        Files not worth converting are posted to ``runner`` as ``SKIPPED`` events.
+        """
+        try:
+            hardware = select_backend(encoder).hardware
+        except (OSError, EncoderUnavailable):
+            hardware = False
+        queue, skipped = plan(
+            files,
+            self._probe_many(files),
+            bitrate,
+            hardware,
+            order=order,
+            min_savings=float("-inf") if min_savings is None else min_savings,
+        )
+        for cost in skipped:
+            runner.events.put(
+                (
+                    SKIPPED,
+                    cost.path,
+                    {
+                        "message": skip_message(cost),
+                        "before_codec": cost.codec,
+                        "after_codec": cost.codec,
+                        "before_size": cost.before_size,
+                        "after_size": cost.before_size,
+                    },
+                )
+            )
+        return queue
+
+    def streams_runner(self, files, audio, subtitle):
+        """Runner keeping the ``audio``/``subtitle`` labels in every file.
+
+        An empty ``subtitle`` removes all subtitle streams.
+        """
+        self._operation = "streams"
+        self.timings = PhaseTimer()
+        self.batch_journal.start("streams", {"audio": audio, "subtitle": subtitle}, files)
+        job = self._journalled(
+            update_file_streams,
+            probe_cache=self.probe_cache,
+            audio_index=stream_index(audio),
+            subtitle_index=stream_index(subtitle) if subtitle.strip() else None,
+            scheduler=self.io_scheduler,
+        )
+        # Stream updates are plain remuxes bound by disk I/O: run as many as
+        # the per-device limit allows on each volume, and no more.
+        devices = set()
+        for path in files:
+            try:
+                devices.add(device_of(os.path.dirname(path)))
+            except OSError:
+                pass
+        workers = max(1, len(devices)) * max(1, IO_JOBS_PER_DEVICE)
+        runner = BatchRunner(
+            job,
+            interleave_by_device(files),
+            workers=workers,
+            timer=self.timings,
+            policy=resource_governor.POLICY,
+        )
+        runner.governor = resource_governor.Governor(runner)
+        return self._track(runner)
+
+    def _track(self, runner):
+        """Start a duration-weighted :class:`BatchProgress` for ``runner``.
+
+        A runner with a ``prepare`` step starts with a placeholder that
+        probes nothing; ``prepare`` replaces it once the queue is known.
+        """
+        if runner.prepare is None:
+            self.progress = self._batch_progress(runner.files)
+        else:
+            self.progress = BatchProgress(runner.files, {})
+        return runner
+
+    def _batch_progress(self, files):
+        durations = {}
+        for path in files:
+            info = self.probe_cache.get(path)
+            if info is not None:
+                durations[path] = info.duration
+        return BatchProgress(files, durations)
+
+    def _journalled(self, job, **kwargs):
+        """``functools.partial(job, **kwargs)`` that journals when each job starts."""
+        job = functools.partial(job, **kwargs)
+
+        def run(input_file, ctx):
+            self.batch_journal.mark(input_file, batch_journal.ENCODING)
+            return job(input_file, ctx)
+
+        return run
+
+    def _journal_event(self, kind, input_file, payload):
+        if kind == RESULT:
+            if payload.get("status") == "skipped":
+                self.batch_journal.mark(input_file, batch_journal.SKIPPED)
+            else:
+                self.batch_journal.mark(
+                    input_file,
+                    batch_journal.DONE,
+                    output_file=payload["output_file"],
+                    converted_dir=payload["converted_dir"],
+                    expected_streams=payload.get("expected_streams"),
+                )
+        elif kind == ERROR and input_file is not None:
+            self.batch_journal.mark(input_file, batch_journal.FAILED, error=_error_detail(payload))
+        elif kind == DONE:
+            self._settle_batch()
+
+    def _settle_batch(self):
+        """Drop the batch journal once no file needs anything more."""
+        if self.batch_journal.operation is not None and not self.batch_journal.unsettled():
+            self.batch_journal.clear()
+
+    def observe(self, kind, input_file, payload):
+        """Journal and export metrics for one batch event; cheap enough for every event."""
+        if self._operation is None:
+            return  # probe batches: results are MediaInfo, nothing to record
+        if kind in (SKIPPED, NOTICE):
+            self.log_status(
+                "skipped" if kind == SKIPPED else "info", input_file=input_file, **payload
+            )
+            return
+        if kind == QUEUED:
+            # prepare() already built the progress of the planned queue; a
+            # failed or cancelled plan leaves nothing to run.
+            if not payload:
+                self.progress = BatchProgress([], {})
+            return
+        if self.progress is not None:
+            if kind == PROGRESS:
+                self.progress.update(input_file, payload)
+            elif kind == RESULT:
+                self.progress.finish(input_file, payload)
+            elif kind == ERROR and input_file is not None:
+                self.progress.finish(input_file)
+        if kind != PROGRESS:
+            self._journal_event(kind, input_file, payload)
+        if kind == RESULT and self.timings is not None:
+            self.timings.note(
+                input_file,
+                duration=payload.get("duration"),
+                before_size=payload.get("before_size"),
+                after_size=payload.get("after_size"),
+            )
+        if self.metrics is None:
+            return
+        name = os.path.basename(input_file) if input_file else None
+        if kind == PROGRESS:
+            self.metrics.record(
+                "theatre_progress",
+                {"operation": self._operation, "worker": payload.get("worker")},
+                {
+                    "file": name,
+                    **{k: float(payload[k]) for k in PROGRESS_FIELDS if payload.get(k) is not None},
+                },
+            )
+        elif kind == RESULT:
+            before = payload.get("before_size")
+            after = payload.get("after_size", before)
+            saved = before - after if before is not None and after is not None else None
+            self.metrics.record(
+                "theatre_job",
+                {
+                    "operation": self._operation,
+                    "status": payload.get("status"),
+                    "encoder": payload.get("encoder"),
+                    "before_codec": payload.get("before_codec"),
+                    "after_codec": payload.get("after_codec", payload.get("before_codec")),
+                },
+                {
+                    "file": name,
+                    "before_size": before,
+                    "after_size": after,
+                    "bytes_saved": saved,
+                    "failed": 0,
+                },
+            )
+        elif kind == ERROR:
+            self.metrics.record(
+                "theatre_job",
+                {"operation": self._operation, "status": "error"},
+                {"file": name, "error": _error_detail(payload), "failed": 1},
+            )
+
+    def record_conversion(self, result):
+        """Log the outcome of :func:`convert_file`."""
+        input_file = result["input_file"]
+        codec = result["before_codec"]
+        before_size = result["before_size"]
+        if result["status"] == "skipped":
+            after_codec = codec
+            after_size = before_size
+            self.manifest.record(input_file, "skipped", codec=codec, output_size=before_size)
+            self.log_status(
+                "skipped",
+                input_file=input_file,
+                message=f"Already {codec.upper()}",
+                before_codec=codec,
+                after_codec=codec,
+                before_size=before_size,
+                after_size=before_size,
+            )
+        else:
+            after_codec = result["after_codec"]
+            after_size = result["after_size"]
+            self.processed_dirs.add(result["converted_dir"])
+            self._expect(result)
+            self.manifest.record(
+                input_file, "converted", codec=after_codec, output_size=after_size
+            )
+            message = f"Encoded with {result['encoder']}"
+            if result.get("bitrate_reason"):
+                message += f" at {result['bitrate']} kbps ({result['bitrate_reason']})"
+            elif result.get("auto_bitrate"):
+                source = "series samples" if result["sample_cached"] else "samples"
+                message += f" at {result['bitrate']} kbps (from {source})"
+            self.log_status(
+                "converted",
+                input_file=input_file,
+                output_file=result["output_file"],
+                message=message,
+                before_codec=codec,
+                after_codec=after_codec,
+                before_size=before_size,
+                after_size=after_size,
+            )
+        self.convert_log.append(
+            {
+                "time": datetime.now().isoformat(),
+                "filename": os.path.basename(input_file),
+                "path": input_file,
+                "bitrate": result.get("bitrate"),
+                "before_size": before_size,
+                "after_size": after_size,
+                "before_codec": codec,
+                "after_codec": after_codec,
+            }
+        )
+
+    def record_streams_update(self, result, audio, subtitle):
+        """Log the outcome of :func:`update_file_streams`."""
+        if result["status"] == "skipped":
+            self.log_status(
+                "skipped",
+                input_file=result["input_file"],
+                message="Streams already selected",
+                before_codec=result["before_codec"],
+                after_codec=result["before_codec"],
+                before_size=result["before_size"],
+                after_size=result["before_size"],
+            )
+            return
+        self.processed_dirs.add(result["converted_dir"])
+        self._expect(result)
+        self.log_status(
+            "streams_updated",
+            input_file=result["input_file"],
+            output_file=result["output_file"],
+            before_codec=result["before_codec"],
+            after_codec=result["after_codec"],
+            before_size=result["before_size"],
+            after_size=result["after_size"],
+        )
+        self.streams_log.append(
+            {
+                "time": datetime.now().isoformat(),
+                "filename": os.path.basename(result["input_file"]),
+                "path": result["input_file"],
+                "audio_stream": audio,
+                "subtitle_stream": subtitle,
+            }
+        )
+
+    def record_error(self, input_file, error, error_message):
+        """Log a failed job, including the last ffmpeg stderr line if any."""
+        print("FFmpeg error:", error, file=sys.stderr)
+        detail = _error_detail(error)
+        message = f"{error_message}: {detail}" if detail else error_message
+        self.log_status("error", input_file=input_file, message=message)
+
+    def run(self, runner, on_result, error_message, on_progress=None):
+        """Drive ``runner`` to completion on the calling thread.
+
+        Used by headless front ends; the GUI polls the same events with
+        ``after()`` instead. A missing ffmpeg cancels the rest of the batch.
+        ``on_progress(input_file, progress)`` gets every progress update,
+        then a ``progress`` of ``None`` once the file is finished.
+        """
+        runner.start()
+        while True:
+            kind, input_file, payload = runner.events.get()
+            self.observe(kind, input_file, payload)
+            if on_progress is not None and input_file is not None:
+                if kind == PROGRESS:
+                    on_progress(input_file, payload)
+                elif kind in (RESULT, ERROR, SKIPPED):
+                    on_progress(input_file, None)
+            if kind == RESULT:
+                on_result(payload)
+            elif kind == ERROR:
+                if isinstance(payload, FileNotFoundError):
+                    self.log_status("error", message=missing_tool_message("ffmpeg"))
+                    runner.cancel()
+                else:
+                    self.record_error(input_file, payload, error_message)
+            elif kind == DONE:
+                return
+
+    def _expect(self, result):
+        if result.get("expected_streams") is not None:
+            self.expected_streams[result["output_file"]] = result["expected_streams"]
+
+    def _record_committed(self, committed):
+        self.batch_journal.mark_committed([entry.source for entry in committed])
+        self._settle_batch()
+        for entry in committed:
+            info = self.probe_cache.get(entry.path)
+            if info is not None:
+                self.manifest.record(
+                    entry.path, "committed", codec=info.video_codec, output_size=info.size
+                )
+
+    def commit_converted_files(self):
+        """Verify processed files and swap them in over the originals.
+
+        Outputs that fail verification are logged and left in ``converted/``.
+        Returns the :class:`commit_phase.CommitReport`.
+        """
+        report = commit_all(
+            sorted(self.processed_dirs),
+            self.probe_cache,
+            self.commit_journal,
+            expected_streams=self.expected_streams,
+            timer=self.timings,
+        )
+        self._record_committed(report.committed)
+        for failure in report.failed:
+            self.log_status(
+                "error", input_file=failure.source, message=f"Not committed: {failure.reason}"
+            )
+        self.processed_dirs.clear()
+        self.expected_streams.clear()
+        return report
+
+    def forget_uncommitted(self):
+        """Stop tracking the outputs left in ``converted/`` for a later commit.
+
+        For long-running callers that never commit themselves: a ``commit``
+        run finds the folders again by walking the library, so nothing is
+        lost, and the tracked state no longer grows with every batch.
+        """
+        self.processed_dirs.clear()
+        self.expected_streams.clear()
+        self.batch_journal.clear()
+
+    def interrupted_commits(self):
+        """``converted/`` folders whose commit was cut short by a crash."""
+        return sorted(self.commit_journal.unfinished())
+
+    def interrupted_batch(self):
+        """The :class:`batch_journal.InterruptedBatch` a crash left, or ``None``."""
+        return self.batch_journal.interrupted()
+
+    def resume_runner(self):
+        """Pick an interrupted batch back up.
+
+        Outputs that finished before the crash are queued for commit again
+        and only the jobs that never finished are rerun, with the batch's
+        original options. Returns the runner, or ``None`` if only the commit
+        is left.
+        """
+        batch = self.interrupted_batch()
+        if batch is None:
+            return None
+        for record in batch.finished:
+            self.processed_dirs.add(record["converted_dir"])
+            if record.get("expected_streams") is not None:
+                self.expected_streams[record["output_file"]] = record["expected_streams"]
+        self.log_status(
+            "info",
+            message=(
+                f"Resuming {batch.operation}: {len(batch.finished)} finished output(s) kept, "
+                f"{len(batch.restart)} file(s) to redo"
+            ),
+        )
+        if not batch.restart:
+            self._operation = batch.operation
+            return None
+        if batch.operation == "streams":
+            return self.streams_runner(batch.restart, **batch.options)
+        return self.convert_runner(batch.restart, **batch.options)
+
+    def discard_batch(self):
+        """Forget an interrupted batch; its outputs stay in ``converted/``."""
+        self.batch_journal.clear()
+
+    def recover_commits(self, rollback=False):
+        """Finish (or with ``rollback`` undo) interrupted commits."""
+        if rollback:
+            restored = rollback_interrupted(self.commit_journal)
+            self.log_status("info", message=f"Rolled back {len(restored)} interrupted commit(s)")
+            return restored
+        committed = finish_interrupted(self.commit_journal, self.probe_cache)
+        self._record_committed(committed)
+        self.log_status("info", message=f"Finished {len(committed)} interrupted commit(s)")
+        return committed
+
+    def finish_reorganize(self, root):
+        """Finish a reorganisation of ``root`` cut short by a crash, if any.
+
+        Returns ``False`` if one was pending and could not be finished.
+        """
+        if not series_reorganizer.interrupted(root):
+            return True
+        try:
+            series_reorganizer.finish_interrupted(root, on_moved=self._moved)
+        except (OSError, ValueError) as e:
+            self.log_status(
+                "error", message=f"Could not finish the last reorganisation of {root}: {e}"
+            )
+            return False
+        self.log_status("info", message=f"Finished an interrupted reorganisation of {root}")
+        return True
+
+    def plan_reorganize(self, root, seasons, files=None):
+        """:class:`series_reorganizer.RenamePlan` giving ``root`` the ``seasons`` layout.
+
+        Pass the ``files`` of a batch that has just been committed to plan
+        without walking the library again. Nothing is renamed, so this is
+        safe for dry runs. While a reorganisation of ``root`` cut short by a
+        crash is pending, it is reported and ``None`` is returned; call
+        :meth:`finish_reorganize` first.
+        """
+        if series_reorganizer.interrupted(root):
+            self.log_status(
+                "info",
+                message=f"A reorganisation of {root} was interrupted; "
+                "it is finished before a new one is planned",
+            )
+            return None
+        plan = series_reorganizer.plan_renames(root, seasons, files)
+        if plan.unassigned:
+            self.log_status(
+                "info",
+                message=f"{len(plan.unassigned)} file(s) past the last season are left in place",
+            )
+        return plan
+
+    def apply_reorganize(self, plan):
+        """Carry out ``plan``; returns ``True`` if every file was moved."""
+        try:
+            series_reorganizer.apply_plan(plan, on_moved=self._moved)
+        except OSError as e:
+            self.log_status("error", message=f"Reorganisation of {plan.root} stopped: {e}")
+            return False
+        for step in plan.steps:
+            self.log_status(
+                "renamed",
+                input_file=step.source,
+                output_file=step.destination,
+                message=series_reorganizer.format_step(step),
+            )
+        return True
+
+    def _moved(self, src, dst):
+        # A rename keeps size and mtime, so cached records stay valid.
+        self.probe_cache.move(src, dst)
+        self.manifest.move(src, dst)
+
+    def finish_timings(self):
+        """Write ``timings.json`` for the last batch and log its summary.
+
+        Returns the one-line summary, or ``None`` if no batch has run.
+        """
+        if self.timings is None:
+            return None
+        self.timings.finish()
+        try:
+            self.timings.write(LOG_DIR)
+        except OSError as e:
+            print("Could not write timings:", e, file=sys.stderr)
+        summary = format_summary(self.timings.summary())
+        self.log_status("info", message=f"Timing: {summary}")
+        self.timings = None
+        return summary
@@ -1,15 +1,32 @@
 import os
 import json
-import subprocess
-import sys
-import shutil
+import contextlib
+import functools
+import queue
+import threading
 from pathlib import Path
-from datetime import datetime
 
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, simpledialog, ttk
 from PIL import Image, ImageTk
 
+from encoders import DEFAULT_ENCODER, detect_backends
+from library_scan import FolderScan
+from media_probe import ProbeError
+from metrics_exporter import exporter_from_env
+from series_reorganizer import format_step, interrupted, parse_seasons
+from theatre_engine import (
+    DEFAULT_VIDEO_DIR,
+    DONE,
+    ERROR,
+    PROGRESS,
+    RESULT,
+    TheatreEngine,
+    ffmpeg_tools_available,
+    missing_tool_message,
+    stream_choices,
+)
+
 VERSION_FILE = Path(__file__).parent / "VERSION"
 try:
     __version__ = VERSION_FILE.read_text(encoding="utf-8").strip()
@@ -17,29 +34,47 @@ except OSError:
     __version__ = "0.0.0"
 
 
-# Default directory used when no folder is selected. Users can override
-# this path with the STREAM_SELECTOR_DIR environment variable. The default
-# falls back to a "videos/unprocessed/new" directory in the user's home
-# folder to work across operating systems.
-DEFAULT_VIDEO_DIR = Path(
-    os.getenv("STREAM_SELECTOR_DIR", Path.home() / "videos" / "unprocessed" / "new")
-)
-
 # Store GUI settings (currently just the last selected folder)
 SETTINGS_FILE = Path.home() / ".theatre_gui_settings.json"
 
-# InfluxDB configuration defaults. These can be overridden with environment
-# variables at runtime.
-INFLUXDB_URL = os.getenv("INFLUXDB_URL", "http://192.168.1.28:8086/")
-INFLUXDB_TOKEN = os.getenv(
-    "INFLUXDB_TOKEN",
-    "vYAzRtDOejTeACp1SJne6TIPHzamWcpvi_Ekd3R2VA1Zvr4zFSa-bmiWzsy1DQuIBwfQ8psG-CUP7HOqSRgCWg==",
-)
-INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "Waterfall")
-INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET", "Video_Update")
+# Number of ffmpeg encodes "Convert to HEVC" runs at once. Override the
+# default with the THEATRE_WORKERS environment variable; the GUI spinbox can
+# still change it per batch.
+MAX_WORKERS = os.cpu_count() or 1
+DEFAULT_WORKERS = int(os.getenv("THEATRE_WORKERS", "0")) or max(1, MAX_WORKERS // 8)
+
+# Maximum number of per-job progress rows shown under the progress bar.
+MAX_JOB_ROWS = 6
+
+# Renames listed in the reorganise confirmation; the rest are counted.
+MAX_PLAN_LINES = 15
+
+# Resolution of the batch progress bar.
+PROGRESS_STEPS = 1000
+
+# Interval between GUI refreshes while a batch runs (about 15 frames/second).
+# Progress events queued in between are coalesced into a single repaint.
+UI_REFRESH_MS = 66
+
+def format_size(num_bytes):
+    """Human readable file size, e.g. ``1.4 GB``."""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_duration(seconds):
+    """Format seconds as ``1h 02m`` (or ``3m 05s`` below an hour)."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    return f"{minutes}m {secs:02d}s"
 
-# Flag to prevent opening a console window for subprocesses on Windows.
-CREATE_NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
 
 class TheatreApp(tk.Tk):
     """Simple window displaying a movie theatre background with an exit button."""
@@ -94,9 +129,41 @@ class TheatreApp(tk.Tk):
         bitrate_label = tk.Label(self, text="Bitrate (kbps):")
         self.canvas.create_window(300, y_pos, window=bitrate_label, anchor="e")
         self.bitrate_dropdown = ttk.Combobox(self, state="readonly")
-        self.bitrate_dropdown['values'] = [str(b) for b in range(1000, 4500, 500)]
+        self.bitrate_dropdown['values'] = ["auto"] + [str(b) for b in range(1000, 4500, 500)]
         self.bitrate_dropdown.set("2000")
         self.canvas.create_window(310, y_pos, window=self.bitrate_dropdown, anchor="w")
+        self.select_streams_var = tk.BooleanVar(value=False)
+        self.select_streams_check = tk.Checkbutton(
+            self, text="Apply stream selection", variable=self.select_streams_var
+        )
+        self.canvas.create_window(470, y_pos, window=self.select_streams_check, anchor="w")
+        y_pos += 30
+
+        workers_label = tk.Label(self, text="Parallel jobs:")
+        self.canvas.create_window(300, y_pos, window=workers_label, anchor="e")
+        self.workers_var = tk.IntVar(value=min(DEFAULT_WORKERS, MAX_WORKERS))
+        self.workers_spinbox = tk.Spinbox(
+            self, from_=1, to=MAX_WORKERS, textvariable=self.workers_var, width=5
+        )
+        self.canvas.create_window(310, y_pos, window=self.workers_spinbox, anchor="w")
+        self.segmented_var = tk.BooleanVar(value=False)
+        self.segmented_check = tk.Checkbutton(
+            self, text="Split long files across jobs", variable=self.segmented_var
+        )
+        self.canvas.create_window(370, y_pos, window=self.segmented_check, anchor="w")
+        y_pos += 30
+
+        encoder_label = tk.Label(self, text="Encoder:")
+        self.canvas.create_window(300, y_pos, window=encoder_label, anchor="e")
+        self.encoder_dropdown = ttk.Combobox(self, state="readonly")
+        self.encoder_dropdown['values'] = ["auto"]
+        self.encoder_dropdown.set(DEFAULT_ENCODER)
+        self.canvas.create_window(310, y_pos, window=self.encoder_dropdown, anchor="w")
+        self.farm_var = tk.BooleanVar(value=False)
+        self.farm_check = tk.Checkbutton(
+            self, text="Use encode farm", variable=self.farm_var
+        )
+        self.canvas.create_window(470, y_pos, window=self.farm_check, anchor="w")
         y_pos += 40
 
         self.update_streams_btn = tk.Button(
@@ -112,6 +179,10 @@ class TheatreApp(tk.Tk):
         )
         self.update_streams_btn.config(state="disabled")
         self.convert_video_btn.config(state="disabled")
+        self.reorganize_btn = tk.Button(
+            self, text="Reorganise Seasons", command=self.reorganize_series, state="disabled"
+        )
+        self.canvas.create_window(110, y_pos, window=self.reorganize_btn, anchor="n")
 
         # Codec label positioned to the right of the buttons
         self.codec_label = self.canvas.create_text(
@@ -124,6 +195,11 @@ class TheatreApp(tk.Tk):
             self.canvas.coords(self.codec_label, btn_bbox[2] + 10, btn_y)
         y_pos += 40
 
+        # Library-wide stats, filled in as the background probes finish
+        self.library_label = self.canvas.create_text(
+            400, y_pos, text="", anchor="n", fill="black", justify="center"
+        )
+
         self.progress_var = tk.DoubleVar(value=0)
         self.progress_bar = ttk.Progressbar(
             self, variable=self.progress_var, maximum=100, mode="determinate", length=300
@@ -131,6 +207,12 @@ class TheatreApp(tk.Tk):
         y_pos += 50
         self.progress_bar_window = self.canvas.create_window(400, y_pos, window=self.progress_bar, anchor="n")
         self.canvas.itemconfigure(self.progress_bar_window, state="hidden")
+        # Suspends the running ffmpeg processes, e.g. during evening playback
+        self.pause_btn = tk.Button(self, text="Pause", command=self.toggle_pause, width=7)
+        self.pause_btn_window = self.canvas.create_window(
+            560, y_pos, window=self.pause_btn, anchor="nw"
+        )
+        self.canvas.itemconfigure(self.pause_btn_window, state="hidden")
         y_pos += 30
 
         self.status_label = tk.Label(self, text="", anchor="center", justify="center")
@@ -140,20 +222,42 @@ class TheatreApp(tk.Tk):
         self.exit_btn = tk.Button(self, text="Exit", command=self.quit_app, width=6)
         self.exit_btn.place(relx=1.0, rely=1.0, anchor="se", x=-10, y=-10)
 
-        # track processed directories for cleanup after exiting
-        self.processed_dirs = set()
-        self.status_log = []
-        self.convert_log = []
-        self.streams_log = []
+        # Scanning, logging and committing live in the GUI-free engine so the
+        # command line shares them.
+        self.engine = TheatreEngine(metrics=exporter_from_env())
         self._missing_tool_alert_shown = False
+        self._batch = None
+        self._scan = None
+        self._prefetch = None
+        # path -> MediaInfo for every file in the selected folder
+        self.media_table = {}
 
         self.protocol("WM_DELETE_WINDOW", self.quit_app)
 
+        # Find out which HEVC encoders work without blocking the window.
+        self._encoder_backends = None
+        threading.Thread(target=self._detect_encoders, daemon=True).start()
+        self.after(UI_REFRESH_MS, self._poll_encoders)
+        self.after_idle(self.offer_commit_recovery)
+        self.after_idle(self.offer_batch_resume)
+
+    def _detect_encoders(self):
+        try:
+            self._encoder_backends = detect_backends()
+        except OSError:
+            self._encoder_backends = []
+
+    def _poll_encoders(self):
+        if self._encoder_backends is None:
+            self.after(UI_REFRESH_MS, self._poll_encoders)
+            return
+        names = [backend.name for backend in self._encoder_backends]
+        self.encoder_dropdown['values'] = ["auto"] + names
+        if self.encoder_dropdown.get() not in names:
+            self.encoder_dropdown.set("auto")
+
     def _handle_missing_tool(self, tool_name: str):
-        self.log_status(
-            "error",
-            message=f"Missing required tool: {tool_name}. Install ffmpeg to provide ffmpeg/ffprobe.",
-        )
+        self.log_status("error", message=missing_tool_message(tool_name))
         if self._missing_tool_alert_shown:
             return
         self._missing_tool_alert_shown = True
@@ -165,9 +269,6 @@ class TheatreApp(tk.Tk):
                 "Ubuntu/Debian: sudo apt install -y ffmpeg python3-tk"
             ),
         )
-
-    def _ffmpeg_tools_available(self):
-        return shutil.which("ffmpeg") and shutil.which("ffprobe")
 
     def _load_last_folder(self):
         if SETTINGS_FILE.exists():
@@ -182,87 +283,116 @@ class TheatreApp(tk.Tk):
         SETTINGS_FILE.write_text(json.dumps({"last_folder": folder}))
 
     def update_codec_label(self, filepath):
-        codec = self.get_video_codec(filepath)
+        info = self.probe_file(filepath)
+        codec = info.video_codec if info else None
+        self._show_codec(codec)
+        return codec
+
+    def _show_codec(self, codec):
         if codec:
             self.canvas.itemconfig(self.codec_label, text=f"Codec: {codec.upper()}")
         else:
             self.canvas.itemconfig(self.codec_label, text="Codec: Unknown")
-        return codec
 
-    def log_status(
-        self,
-        status,
-        input_file=None,
-        output_file=None,
-        message="",
-        before_codec=None,
-        after_codec=None,
-        before_size=None,
-        after_size=None,
-    ):
-        entry = {
-            "status": status,
-            "input": input_file,
-            "output": output_file,
-            "message": message,
-        }
-        if before_codec is not None:
-            entry["before_codec"] = before_codec
-        if after_codec is not None:
-            entry["after_codec"] = after_codec
-        if before_size is not None:
-            entry["before_size"] = before_size
-        if after_size is not None:
-            entry["after_size"] = after_size
-        self.status_log.append(entry)
-        print(f"{status.upper()}: {message or output_file or input_file}")
-
-    def commit_converted_files(self):
-        """Move processed files back to their original location and clean up."""
-        import shutil
-
-        for conv_dir in list(self.processed_dirs):
-            if not os.path.isdir(conv_dir):
-                continue
-            for file in os.listdir(conv_dir):
-                src_path = os.path.join(conv_dir, file)
-                dst_path = os.path.join(os.path.dirname(conv_dir), file)
-                shutil.move(src_path, dst_path)
-            try:
-                os.rmdir(conv_dir)
-            except OSError:
-                print(f"Could not remove {conv_dir} — it may not be empty.")
-        self.processed_dirs.clear()
-
-    def write_convert_log(self):
-        documents_dir = Path.home() / "Documents"
-        documents_dir.mkdir(parents=True, exist_ok=True)
-        with open(documents_dir / "convert.json", "w", encoding="utf-8") as f:
-            json.dump(self.convert_log, f, indent=2)
-
-    def write_streams_log(self):
-        documents_dir = Path.home() / "Documents"
-        documents_dir.mkdir(parents=True, exist_ok=True)
-        with open(documents_dir / "streams.json", "w", encoding="utf-8") as f:
-            json.dump(self.streams_log, f, indent=2)
+    def _get_worker_count(self):
+        try:
+            workers = int(self.workers_var.get())
+        except (tk.TclError, ValueError):
+            workers = DEFAULT_WORKERS
+        return max(1, min(workers, MAX_WORKERS))
+
+    def log_status(self, status, **details):
+        self.engine.log_status(status, **details)
 
     def ask_commit_updates(self):
-        if not self.processed_dirs:
+        if not self.engine.processed_dirs:
             return
         if messagebox.askyesno(
             "Processing Complete",
             "All work completed. Commit updates to original files?",
         ):
-            self.commit_converted_files()
-            messagebox.showinfo(
-                "Commit Complete",
-                "Converted files have been moved back.",
-            )
+            report = self.engine.commit_converted_files()
+            if report.failed:
+                messagebox.showwarning(
+                    "Commit Incomplete",
+                    f"{len(report.committed)} file(s) moved back. "
+                    f"{len(report.failed)} failed verification and were left in "
+                    "their converted folder:\n\n"
+                    + "\n".join(
+                        f"{os.path.basename(f.source)}: {f.reason}" for f in report.failed[:10]
+                    ),
+                )
+            else:
+                messagebox.showinfo(
+                    "Commit Complete",
+                    "Converted files have been moved back.",
+                )
+
+    def offer_commit_recovery(self):
+        """Offer to finish or roll back a commit cut short by a crash."""
+        interrupted = self.engine.interrupted_commits()
+        if not interrupted:
+            return
+        finish = messagebox.askyesno(
+            "Interrupted Commit",
+            f"A previous commit of {len(interrupted)} folder(s) did not finish.\n\n"
+            "Yes: finish moving the converted files into place.\n"
+            "No: roll back and restore the original files.",
+        )
+        self.engine.recover_commits(rollback=not finish)
+
+    def offer_batch_resume(self):
+        """Offer to pick up a batch that was cut short by a crash or exit."""
+        batch = self.engine.interrupted_batch()
+        if batch is None:
+            return
+        if not messagebox.askyesno(
+            "Interrupted Batch",
+            f"The last {batch.operation} batch did not finish.\n\n"
+            f"{len(batch.finished)} file(s) are done and waiting to be committed; "
+            f"{len(batch.restart)} file(s) still need processing.\n\n"
+            "Resume it? (No keeps finished files in their converted folder.)",
+        ):
+            self.engine.discard_batch()
+            return
+        if batch.restart and not ffmpeg_tools_available():
+            self._handle_missing_tool("ffmpeg/ffprobe")
+            return
+        runner = self.engine.resume_runner()
+        if runner is None:
+            self.ask_commit_updates()
+            return
+        if batch.operation == "streams":
+            self._start_batch(
+                runner,
+                status="Updating streams... please wait",
+                on_result=functools.partial(self.engine.record_streams_update, **batch.options),
+                error_message="FFmpeg failed during stream update",
+            )
+            return
+        farm = batch.options.get("farm")
+        self._start_batch(
+            runner,
+            status=(
+                f"Waiting for encode farm workers on {runner.url}"
+                if farm
+                else "Converting... please wait"
+            ),
+            on_result=self.engine.record_conversion,
+            error_message="Encode farm job failed" if farm else "FFmpeg failed during conversion",
+        )
 
     def quit_app(self):
+        if self._scan is not None:
+            self._scan.cancel()
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+        if self._batch is not None:
+            # Let cancelled jobs clean up partial outputs before committing.
+            self._batch.cancel()
+            self._batch.join(timeout=10)
         self.ask_commit_updates()
-        self.write_convert_log()
-        self.write_streams_log()
+        self.engine.close()
         self.destroy()
 
     def select_path(self):
@@ -276,187 +406,135 @@ class TheatreApp(tk.Tk):
         self._save_last_folder(folder)
         self.selected_folder = folder
         self.select_file_btn.config(text=f"Select Folder\n{folder}")
+        # A series folder may hold only season subfolders, so this does not
+        # wait for the scan.
+        self.reorganize_btn.config(state="normal")
 
-        root_files = [
-            str(f) for f in Path(folder).glob("*.mkv")
-        ] + [
-            str(f) for f in Path(folder).glob("*.mp4")
-        ]
-        if not root_files:
+        # Files are listed as the scan finds them; the buttons wait for the
+        # whole list.
+        self.convert_video_btn.config(state="disabled")
+        self.update_streams_btn.config(state="disabled")
+        if self._scan is not None:
+            self._scan.cancel()
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+            self._prefetch = None
+        self.video_files = []
+        self._scan = FolderScan(folder).start()
+        self.after(UI_REFRESH_MS, self._poll_scan, self._scan)
+
+    def _poll_scan(self, scan):
+        if scan is not self._scan:
+            return  # superseded by a newer folder selection
+        done = False
+        while True:
+            try:
+                batch = scan.batches.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                done = True
+                break
+            if not self.video_files:
+                self.populate_stream_dropdowns(batch[0])
+                self.update_codec_label(batch[0])
+            self.video_files.extend(batch)
+        if not done:
+            self.canvas.itemconfig(
+                self.library_label, text=f"Scanning... {len(self.video_files)} files found"
+            )
+            self.after(UI_REFRESH_MS, self._poll_scan, scan)
+            return
+
+        self._scan = None
+        if not self.video_files:
             self.log_status("error", message="No MKV or MP4 files found in selected folder.")
-            self.convert_video_btn.config(state="disabled")
-            self.update_streams_btn.config(state="disabled")
             self.canvas.itemconfig(self.codec_label, text="Codec: N/A")
+            self.canvas.itemconfig(self.library_label, text="")
             return
-        self.video_files = sorted(
-            [str(f) for f in Path(folder).rglob("*.mkv")] +
-            [str(f) for f in Path(folder).rglob("*.mp4")]
-        )
 
-        first_file = self.video_files[0]
-        self.populate_stream_dropdowns(first_file)
+        self.video_files.sort()
         self.convert_video_btn.config(state="normal")
         self.update_streams_btn.config(state="normal")
-        self.update_codec_label(first_file)
-
-    def run_ffprobe(self, filepath, stream_type):
-        try:
-            result = subprocess.run(
-                [
-                    "ffprobe",
-                    "-v",
-                    "error",
-                    "-select_streams",
-                    stream_type,
-                    "-show_entries",
-                    "stream=index,codec_type:stream_tags=language,title",
-                    "-of",
-                    "json",
-                    filepath,
-                ],
-                capture_output=True,
-                text=True,
-                check=True,
-                creationflags=CREATE_NO_WINDOW,
-            )
-            return json.loads(result.stdout).get("streams", [])
-        except FileNotFoundError:
-            self._handle_missing_tool("ffprobe")
-            return []
-        except subprocess.CalledProcessError as e:
-            print(f"ffprobe failed for stream type '{stream_type}':", e)
-            return []
-
-    def parse_ffmpeg_progress(self, line):
-        fps = None
-        time_pos = None
-        if "fps=" in line or "time=" in line:
-            parts = line.strip().split()
-            for part in parts:
-                if part.startswith("fps="):
-                    fps = part.split("=", 1)[1]
-                elif part.startswith("time="):
-                    time_pos = part.split("=", 1)[1]
-        return fps, time_pos
-
-    def get_video_codec(self, filepath):
-        try:
-            result = subprocess.run(
-                [
-                    "ffprobe",
-                    "-v",
-                    "error",
-                    "-select_streams",
-                    "v:0",
-                    "-show_entries",
-                    "stream=codec_name",
-                    "-of",
-                    "default=noprint_wrappers=1:nokey=1",
-                    filepath,
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                creationflags=CREATE_NO_WINDOW,
+        self._start_prefetch()
+
+    def _start_prefetch(self):
+        """Probe every selected file in the background to fill ``media_table``."""
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+        self.media_table = {}
+        self._prefetch = self.engine.probe_runner(self.video_files).start()
+        self._show_library_stats()
+        self.after(UI_REFRESH_MS, self._poll_prefetch, self._prefetch)
+
+    def _poll_prefetch(self, runner):
+        if runner is not self._prefetch:
+            return  # superseded by a newer folder selection
+        done = False
+        while True:
+            try:
+                kind, input_file, payload = runner.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == RESULT and payload is not None:
+                self.media_table[input_file] = payload
+            elif kind == ERROR:
+                if isinstance(payload, FileNotFoundError):
+                    self._handle_missing_tool("ffprobe")
+                    runner.cancel()
+                else:
+                    print(f"ffprobe error for {input_file}:", payload)
+            elif kind == DONE:
+                done = True
+        self._show_library_stats(probing=not done)
+        if done:
+            self._prefetch = None
+        else:
+            self.after(UI_REFRESH_MS, self._poll_prefetch, runner)
+
+    def _show_library_stats(self, probing=True):
+        table = self.media_table
+        total = len(self.video_files)
+        codecs = {}
+        for info in table.values():
+            codec = (info.video_codec or "unknown").upper()
+            codecs[codec] = codecs.get(codec, 0) + 1
+        lines = [
+            f"{total} files  |  {format_duration(sum(i.duration or 0 for i in table.values()))}"
+            f"  |  {format_size(sum(i.size for i in table.values()))}"
+        ]
+        if codecs:
+            lines.append(
+                "  ".join(f"{c}: {n}" for c, n in sorted(codecs.items(), key=lambda c: -c[1]))
             )
-            return result.stdout.strip().lower()
-        except FileNotFoundError:
-            self._handle_missing_tool("ffprobe")
-            return None
-        except Exception:
-            return None
+        if probing:
+            lines.append(f"Probing {len(table)}/{total}...")
+        self.canvas.itemconfig(self.library_label, text="\n".join(lines))
 
-    def get_duration(self, filepath):
+    def probe_file(self, filepath):
+        """Return the probe record for ``filepath``, reporting errors in the GUI."""
         try:
-            result = subprocess.run(
-                [
-                    "ffprobe",
-                    "-v",
-                    "error",
-                    "-show_entries",
-                    "format=duration",
-                    "-of",
-                    "default=noprint_wrappers=1:nokey=1",
-                    filepath,
-                ],
-                capture_output=True,
-                text=True,
-                check=True,
-                creationflags=CREATE_NO_WINDOW,
-            )
-            return float(result.stdout.strip())
+            return self.engine.probe_cache.probe(filepath)
         except FileNotFoundError:
             self._handle_missing_tool("ffprobe")
-            return None
-        except Exception as e:
-            print(f"ffprobe duration error for {filepath}:", e)
-            return None
-
-    def time_to_seconds(self, time_str):
-        try:
-            h, m, s = time_str.split(":")
-            return int(h) * 3600 + int(m) * 60 + float(s)
-        except Exception:
-            return None
+        except (OSError, ProbeError) as e:
+            print(f"ffprobe error for {filepath}:", e)
+        return None
 
     def populate_stream_dropdowns(self, filepath):
-        audio_streams = self.run_ffprobe(filepath, "a")
-        subtitle_streams = self.run_ffprobe(filepath, "s")
-
-        audio_options = []
-        subtitle_options = [""]
-        default_audio = None
-        default_subtitle = None
-
-        for stream in audio_streams:
-            index = stream.get("index")
-            lang = stream.get("tags", {}).get("language", "und")
-            title = stream.get("tags", {}).get("title", "")
-            label = f"Stream {index} - {lang}"
-            if "forced" in title.lower():
-                label += " [FORCED]"
-            if title:
-                label += f" ({title})"
-            audio_options.append(label)
-
-            if default_audio is None and lang.lower() == "eng":
-                default_audio = label
-
-        for stream in subtitle_streams:
-            index = stream.get("index")
-            lang = stream.get("tags", {}).get("language", "und")
-            title = stream.get("tags", {}).get("title", "")
-            label = f"Stream {index} - {lang}"
-            if "forced" in title.lower():
-                label += " [FORCED]"
-            if title:
-                label += f" ({title})"
-            subtitle_options.append(label)
-
-            title_lower = title.lower()
-            if (
-                default_subtitle is None
-                and lang.lower() == "eng"
-                and ("signs" in title_lower or "forced" in title_lower)
-            ):
-                default_subtitle = label
+        info = self.probe_file(filepath)
+        audio_options, default_audio, subtitle_options, default_subtitle = (
+            stream_choices(info)
+        )
 
         self.audio_dropdown['values'] = audio_options
-        if default_audio and default_audio in audio_options:
+        if default_audio:
             self.audio_dropdown.set(default_audio)
-        elif audio_options:
-            self.audio_dropdown.set(audio_options[0])
-
         self.subtitle_dropdown['values'] = subtitle_options
-        if default_subtitle and default_subtitle in subtitle_options:
-            self.subtitle_dropdown.set(default_subtitle)
-        elif len(subtitle_options) > 1:
-            self.subtitle_dropdown.set(subtitle_options[1])
-        elif subtitle_options:
-            self.subtitle_dropdown.set(subtitle_options[0])
+        self.subtitle_dropdown.set(default_subtitle)
 
     def convert_to_hevc(self):
-        if not self._ffmpeg_tools_available():
+        if not ffmpeg_tools_available():
             self._handle_missing_tool("ffmpeg/ffprobe")
             return
 
@@ -465,131 +543,218 @@ class TheatreApp(tk.Tk):
             messagebox.showwarning("No Folder Selected", "Please select a folder first.")
             return
 
-        self.status_label.config(text="Converting... please wait")
-        self.progress_bar['maximum'] = len(self.video_files) * 100
-        self.progress_var.set(0)
-        self.canvas.itemconfigure(self.progress_bar_window, state="normal")
-        self.convert_video_btn.config(state="disabled")
-        self.update_streams_btn.config(state="disabled")
-        self.update()
-
-        self.convert_log = []
-
-        for idx, input_file in enumerate(self.video_files, start=1):
-            duration = self.get_duration(input_file)
-            before_size = os.path.getsize(input_file)
-            codec = self.update_codec_label(input_file)
-            if codec in ("hevc", "av1"):
-                self.log_status(
-                    "skipped",
-                    input_file=input_file,
-                    message=f"Already {codec.upper()}",
-                    before_codec=codec,
-                    after_codec=codec,
-                    before_size=before_size,
-                    after_size=before_size,
-                )
-                self.convert_log.append(
-                    {
-                        "time": datetime.now().isoformat(),
-                        "filename": os.path.basename(input_file),
-                        "before_size": before_size,
-                        "after_size": before_size,
-                        "before_codec": codec,
-                        "after_codec": codec,
-                    }
-                )
-                continue
-
-            converted_dir = os.path.join(os.path.dirname(input_file), "converted")
-            os.makedirs(converted_dir, exist_ok=True)
-            output_path = os.path.join(converted_dir, os.path.basename(input_file))
-
-            cmd = [
-                "ffmpeg",
-                "-y",
-                "-i",
-                input_file,
-                "-map",
-                "0",
-                "-c:v",
-                "hevc_amf",
-                "-c:a",
-                "copy",
-                "-c:s",
-                "copy",
-                "-map_chapters",
-                "0",
-                "-usage",
-                "transcoding",
-                "-b:v",
-                self.bitrate_dropdown.get() + "k",
-                output_path,
-            ]
-
-            try:
-                process = subprocess.Popen(
-                    cmd,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    creationflags=CREATE_NO_WINDOW,
-                )
-                for line in process.stderr:
-                    fps, time_pos = self.parse_ffmpeg_progress(line)
-                    if fps or time_pos:
-                        self.status_label.config(
-                            text=f"{os.path.basename(input_file)}\nfps: {fps}\ntime: {time_pos}"
-                        )
-                        if duration and time_pos:
-                            secs = self.time_to_seconds(time_pos)
-                            if secs is not None:
-                                progress = min(secs / duration, 1.0)
-                                self.progress_var.set(int((idx - 1 + progress) * 100))
-                        self.update()
-                ret = process.wait()
-                if ret == 0:
-                    self.processed_dirs.add(converted_dir)
-                    after_codec = self.update_codec_label(output_path)
-                    self.log_status(
-                        "converted",
-                        input_file=input_file,
-                        output_file=output_path,
-                        before_codec=codec,
-                        after_codec=after_codec,
-                        before_size=before_size,
-                        after_size=os.path.getsize(output_path),
-                    )
-                    self.convert_log.append(
-                        {
-                            "time": datetime.now().isoformat(),
-                            "filename": os.path.basename(input_file),
-                            "before_size": before_size,
-                            "after_size": os.path.getsize(output_path),
-                            "before_codec": codec,
-                            "after_codec": after_codec,
-                        }
-                    )
-                else:
-                    raise subprocess.CalledProcessError(ret, cmd)
-            except FileNotFoundError:
-                self._handle_missing_tool("ffmpeg")
+        audio = subtitle = None
+        if self.select_streams_var.get():
+            # Clean up the streams in the same ffmpeg pass as the encode.
+            audio = self.audio_dropdown.get()
+            subtitle = self.subtitle_dropdown.get()
+            if not audio:
+                self.log_status("error", message="Please select an audio stream.")
+                return
+
+        farm = self.farm_var.get()
+        runner = self.engine.convert_runner(
+            self.video_files,
+            bitrate=self.bitrate_dropdown.get(),
+            encoder=self.encoder_dropdown.get() or "auto",
+            workers=self._get_worker_count(),
+            segmented=self.segmented_var.get(),
+            farm=farm,
+            audio=audio,
+            subtitle=subtitle,
+        )
+        if runner is None:
+            self.status_label.config(text="Nothing to convert")
+            return
+        self._start_batch(
+            runner,
+            status=(
+                f"Waiting for encode farm workers on {runner.url}"
+                if farm
+                else "Converting... please wait"
+            ),
+            on_result=self.engine.record_conversion,
+            error_message="Encode farm job failed" if farm else "FFmpeg failed during conversion",
+        )
+
+    def _start_batch(self, runner, status, on_result, error_message):
+        """Start ``runner`` in the background and poll it with ``after()``."""
+        try:
+            runner.start()
+        except OSError as e:
+            self.log_status("error", message=f"Could not start batch: {e}")
+            messagebox.showerror("Batch not started", str(e))
+            return
+        self.status_label.config(text=status)
+        self.progress_bar['maximum'] = PROGRESS_STEPS
+        self.progress_var.set(0)
+        self.canvas.itemconfigure(self.progress_bar_window, state="normal")
+        # Farm batches run on other machines and cannot be paused from here.
+        if hasattr(runner, "pause"):
+            self.pause_btn.config(text="Pause")
+            self.canvas.itemconfigure(self.pause_btn_window, state="normal")
+        self.convert_video_btn.config(state="disabled")
+        self.update_streams_btn.config(state="disabled")
+
+        self._batch = runner
+        self._batch_handlers = (on_result, error_message)
+        self.after(UI_REFRESH_MS, self._poll_batch)
+
+    def _poll_batch(self):
+        """Drain queued batch events and repaint once per UI frame."""
+        runner = self._batch
+        on_result, error_message = self._batch_handlers
+        batch_done = False
+        while True:
+            try:
+                kind, input_file, payload = runner.events.get_nowait()
+            except queue.Empty:
                 break
-            except subprocess.CalledProcessError as e:
-                print("FFmpeg error:", e)
-                self.log_status("error", input_file=input_file, message="FFmpeg failed during conversion")
-
-            self.progress_var.set(idx * 100)
-            self.update()
-
-        self.ask_commit_updates()
-        self.write_convert_log()
-        self.status_label.config(text="Done")
-        self.canvas.itemconfigure(self.progress_bar_window, state="hidden")
-        self.convert_video_btn.config(state="normal")
-        self.update_streams_btn.config(state="normal")
+            # The engine keeps the batch progress; only the latest state is
+            # painted on the next frame.
+            self.engine.observe(kind, input_file, payload)
+            if kind == RESULT:
+                on_result(payload)
+                self._show_codec(payload.get("after_codec") or payload["before_codec"])
+            elif kind == ERROR:
+                if isinstance(payload, FileNotFoundError):
+                    self._handle_missing_tool("ffmpeg")
+                    runner.cancel()
+                else:
+                    self.engine.record_error(input_file, payload, error_message)
+            elif kind == DONE:
+                batch_done = True
+
+        if not batch_done:
+            timings = self.engine.timings
+            with timings.phase(None, "ui") if timings else contextlib.nullcontext():
+                self._show_batch_progress()
+            self.after(UI_REFRESH_MS, self._poll_batch)
+            return
+
+        self._batch = None
+        self.ask_commit_updates()
+        summary = self.engine.finish_timings()
+        self.status_label.config(text=f"Done\n{summary}" if summary else "Done")
+        self.canvas.itemconfigure(self.progress_bar_window, state="hidden")
+        self.canvas.itemconfigure(self.pause_btn_window, state="hidden")
+        self.convert_video_btn.config(state="normal")
+        self.update_streams_btn.config(state="normal")
+
+    def toggle_pause(self):
+        runner = self._batch
+        if runner is None:
+            return
+        if runner.paused:
+            runner.resume()
+        else:
+            runner.pause()
+
+    def reorganize_series(self):
+        """Merge the selected series' season folders and renumber its episodes."""
+        folder = getattr(self, "selected_folder", None)
+        if not folder or self._batch is not None or self._scan is not None:
+            return
+        text = simpledialog.askstring(
+            "Reorganise Seasons",
+            f"True episode count of each season of {os.path.basename(folder)}, "
+            "separated by commas (e.g. 24,12,24):",
+            parent=self,
+        )
+        if not text:
+            return
+        try:
+            seasons = parse_seasons(text)
+        except ValueError as e:
+            messagebox.showerror("Reorganise Seasons", str(e))
+            return
+        # The scanned list is reused; a folder of season subfolders is walked.
+        files = self.video_files or None
+        if interrupted(folder):
+            if not messagebox.askyesno(
+                "Reorganise Seasons",
+                "The last reorganisation of this folder was interrupted. Finish it first?",
+            ):
+                return
+            if not self.engine.finish_reorganize(folder):
+                messagebox.showerror(
+                    "Reorganise Seasons", "The interrupted reorganisation could not be finished."
+                )
+                return
+            # Finishing moved files, so the scanned list is out of date.
+            files = None
+        plan = self.engine.plan_reorganize(folder, seasons, files)
+        if plan is None:
+            return
+        if not plan.steps:
+            messagebox.showinfo("Reorganise Seasons", "Every episode already has its name.")
+            return
+        lines = [format_step(step) for step in plan.steps[:MAX_PLAN_LINES]]
+        if len(plan.steps) > MAX_PLAN_LINES:
+            lines.append(f"...and {len(plan.steps) - MAX_PLAN_LINES} more")
+        if plan.unassigned:
+            lines.append(
+                f"{len(plan.unassigned)} file(s) past the last season stay where they are."
+            )
+        if not messagebox.askyesno(
+            "Reorganise Seasons",
+            f"Rename {len(plan.steps)} episode(s)?\n\n" + "\n".join(lines),
+        ):
+            return
+        if not self.engine.apply_reorganize(plan):
+            messagebox.showerror(
+                "Reorganise Seasons",
+                "The reorganisation stopped partway; it is finished the next time it is run.",
+            )
+            # The files are split between old and new names; select the folder again.
+            self.video_files = []
+            self.convert_video_btn.config(state="disabled")
+            self.update_streams_btn.config(state="disabled")
+            return
+        moved = {step.source: step.destination for step in plan.steps}
+        self.video_files = sorted(moved.get(path, path) for path in self.video_files)
+        self.media_table = {moved.get(p, p): i for p, i in self.media_table.items()}
+        messagebox.showinfo("Reorganise Seasons", "Episodes renamed and reorganised.")
+
+    def _show_batch_progress(self):
+        """Update the duration-weighted progress bar, batch figures and job rows."""
+        snapshot = self.engine.progress.snapshot()
+        running = snapshot["running"]
+        self.progress_var.set(int(snapshot["fraction"] * PROGRESS_STEPS))
+        header = (
+            f"{snapshot['files_done']}/{snapshot['files_total']} files done"
+            f"  {snapshot['fraction'] * 100:.0f}%"
+        )
+        if snapshot["realtime_factor"]:
+            header += f"  {snapshot['realtime_factor']:.1f}x realtime"
+        if snapshot["eta"] is not None:
+            header += f"  ETA {format_duration(snapshot['eta'])}"
+        if snapshot["bytes_saved"]:
+            header += f"  saved {format_size(snapshot['bytes_saved'])}"
+        # The schedule can pause the batch too, so follow the runner.
+        paused = getattr(self._batch, "paused", False)
+        self.pause_btn.config(text="Resume" if paused else "Pause")
+        if paused:
+            header += "  (paused)"
+        rows = [header]
+        for progress in running[:MAX_JOB_ROWS]:
+            percent = int(progress.get("fraction", 0.0) * 100)
+            row = f"{os.path.basename(progress['file'])}  {percent}%"
+            if progress.get("worker"):
+                row = f"[{progress['worker']}] {row}"
+            if progress.get("fps") is not None:
+                row += f"  {progress['fps']:.0f} fps"
+            if progress.get("speed") is not None:
+                row += f"  {progress['speed']:.2f}x"
+            if progress.get("eta") is not None:
+                row += f"  ETA {format_duration(progress['eta'])}"
+            rows.append(row)
+        if len(running) > MAX_JOB_ROWS:
+            rows.append(f"... and {len(running) - MAX_JOB_ROWS} more running")
+        self.status_label.config(text="\n".join(rows))
 
     def update_streams(self):
-        if not self._ffmpeg_tools_available():
+        if not ffmpeg_tools_available():
             self._handle_missing_tool("ffmpeg/ffprobe")
             return
 
@@ -598,16 +763,6 @@ class TheatreApp(tk.Tk):
             messagebox.showwarning("No Folder Selected", "Please select a folder first.")
             return
 
-        self.status_label.config(text="Updating streams... please wait")
-        self.progress_bar['maximum'] = len(self.video_files) * 100
-        self.progress_var.set(0)
-        self.canvas.itemconfigure(self.progress_bar_window, state="normal")
-        self.convert_video_btn.config(state="disabled")
-        self.update_streams_btn.config(state="disabled")
-        self.update()
-
-        self.streams_log = []
-
         audio = self.audio_dropdown.get()
         subtitle = self.subtitle_dropdown.get()
         if not audio:
@@ -619,109 +774,14 @@ class TheatreApp(tk.Tk):
             self.log_status("error", message="Please select both audio and subtitle streams.")
             return
 
-        if not remove_subtitles:
-            subtitle_index = subtitle.split(" ")[1]
-        audio_index = audio.split(" ")[1]
-
-        for idx, input_file in enumerate(self.video_files, start=1):
-            duration = self.get_duration(input_file)
-            before_codec = self.update_codec_label(input_file)
-            before_size = os.path.getsize(input_file)
-            converted_dir = os.path.join(os.path.dirname(input_file), "converted")
-            os.makedirs(converted_dir, exist_ok=True)
-            output_path = os.path.join(converted_dir, os.path.basename(input_file))
-
-            cmd = [
-                "ffmpeg",
-                "-y",
-                "-i",
-                input_file,
-                "-map",
-                "0:v:0",
-                "-map",
-                f"0:{audio_index}",
-            ]
-
-            if not remove_subtitles:
-                cmd.extend([
-                    "-map",
-                    f"0:{subtitle_index}",
-                    "-c:s",
-                    "copy",
-                ])
-            else:
-                cmd.append("-sn")
-
-            cmd.extend([
-                "-c:v",
-                "copy",
-                "-c:a",
-                "copy",
-                "-map_chapters",
-                "0",
-            ])
-            if not remove_subtitles:
-                cmd.extend(["-disposition:s:0", "forced"])
-            cmd.append(output_path)
-
-            try:
-                process = subprocess.Popen(
-                    cmd,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    creationflags=CREATE_NO_WINDOW,
-                )
-                for line in process.stderr:
-                    fps, time_pos = self.parse_ffmpeg_progress(line)
-                    if fps or time_pos:
-                        self.status_label.config(
-                            text=f"{os.path.basename(input_file)}\nfps: {fps}\ntime: {time_pos}"
-                        )
-                        if duration and time_pos:
-                            secs = self.time_to_seconds(time_pos)
-                            if secs is not None:
-                                progress = min(secs / duration, 1.0)
-                                self.progress_var.set(int((idx - 1 + progress) * 100))
-                        self.update()
-                ret = process.wait()
-                if ret == 0:
-                    self.processed_dirs.add(converted_dir)
-                    after_codec = self.update_codec_label(output_path)
-                    self.log_status(
-                        "streams_updated",
-                        input_file=input_file,
-                        output_file=output_path,
-                        before_codec=before_codec,
-                        after_codec=after_codec,
-                        before_size=before_size,
-                        after_size=os.path.getsize(output_path),
-                    )
-                    self.streams_log.append(
-                        {
-                            "time": datetime.now().isoformat(),
-                            "filename": os.path.basename(input_file),
-                            "audio_stream": audio,
-                            "subtitle_stream": subtitle,
-                        }
-                    )
-                else:
-                    raise subprocess.CalledProcessError(ret, cmd)
-            except FileNotFoundError:
-                self._handle_missing_tool("ffmpeg")
-                break
-            except subprocess.CalledProcessError as e:
-                print("FFmpeg error:", e)
-                self.log_status("error", input_file=input_file, message="FFmpeg failed during stream update")
-
-            self.progress_var.set(idx * 100)
-            self.update()
-
-        self.ask_commit_updates()
-        self.write_streams_log()
-        self.status_label.config(text="Done")
-        self.canvas.itemconfigure(self.progress_bar_window, state="hidden")
-        self.convert_video_btn.config(state="normal")
-        self.update_streams_btn.config(state="normal")
+        self._start_batch(
+            self.engine.streams_runner(self.video_files, audio, subtitle),
+            status="Updating streams... please wait",
+            on_result=functools.partial(
+                self.engine.record_streams_update, audio=audio, subtitle=subtitle
+            ),
+            error_message="FFmpeg failed during stream update",
+        )
 
 if __name__ == "__main__":
     img_path = Path(__file__).parent / "images" / "movie_theatre.png"
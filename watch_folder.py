@@ -0,0 +1,388 @@
+"""Watch a drop folder and process new videos once they are complete.
+
+New or changed MKV/MP4 files are noticed through inotify on Linux (loaded
+with :mod:`ctypes`, so there is no extra dependency). The folder is also
+rescanned now and then in case events were missed. Where inotify is not
+available, for example on Windows or on network shares that do not deliver
+events, the folder is only polled. A file is processed once its size and
+modification time have not changed for :data:`SETTLE_SECONDS`, so
+downloads and copies still in progress are left alone. Only the new files
+are probed and queued, for a stream update and/or an HEVC conversion.
+
+The daemon is meant to run unattended for weeks. Files waiting to settle and
+files already handled are kept in bounded tables, and the engine's
+per-batch state is cleared after every batch. Without ``commit`` the engine
+also forgets the outputs each batch left in ``converted/``; a later
+``theatre_cli.py commit`` run finds them by walking the folder.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import functools
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from library_scan import SKIPPED_DIRS, is_video
+from media_probe import ProbeError
+from theatre_engine import stream_choices
+
+# Seconds a file's size must stay unchanged before it is processed.
+SETTLE_SECONDS = float(os.getenv("THEATRE_WATCH_SETTLE", "30"))
+
+# Interval between scans when polling, and between safety-net rescans when
+# inotify is in use.
+POLL_SECONDS = float(os.getenv("THEATRE_WATCH_POLL", "30"))
+RESCAN_SECONDS = float(os.getenv("THEATRE_WATCH_RESCAN", "900"))
+
+# Most files processed in one batch; the rest wait for the next one.
+MAX_BATCH = 200
+
+# Bounds on the files waiting to settle and the files remembered as handled.
+MAX_PENDING = 10000
+MAX_HANDLED = 50000
+
+# inotify constants from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _skipped_dir(name):
+    return name in SKIPPED_DIRS or name.startswith(".")
+
+
+def is_candidate(path):
+    """True for videos outside ``converted/`` folders and hidden files."""
+    name = os.path.basename(path)
+    return (
+        not name.startswith(".")
+        and is_video(name)
+        and os.path.basename(os.path.dirname(path)) not in SKIPPED_DIRS
+    )
+
+
+def walk_videos(root):
+    """Yield ``(path, stat)`` for every candidate video below ``root``."""
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not _skipped_dir(entry.name):
+                                stack.append(entry.path)
+                        elif is_candidate(entry.path):
+                            yield entry.path, entry.stat()
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+class FolderSnapshot:
+    """Size and mtime of every video, to find changes between scans."""
+
+    def __init__(self, root):
+        self.root = str(root)
+        self._stats = {}
+
+    def scan(self):
+        """Paths that are new or changed since the previous scan."""
+        current = {
+            path: (stat.st_size, stat.st_mtime_ns) for path, stat in walk_videos(self.root)
+        }
+        changed = [path for path, key in current.items() if self._stats.get(path) != key]
+        self._stats = current
+        return changed
+
+
+class InotifyWatcher:
+    """Recursive inotify watch of ``root``; raises ``OSError`` if unavailable."""
+
+    def __init__(self, root):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        try:
+            self._add_tree(str(root))
+        except OSError:
+            self.close()
+            raise
+
+    def _add(self, folder):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            # ENOSPC here means fs.inotify.max_user_watches is too low.
+            raise OSError(ctypes.get_errno(), f"Cannot watch {folder}")
+        self._dirs[wd] = folder
+
+    def _add_tree(self, root):
+        self._add(root)
+        for folder, dirs, _ in os.walk(root):
+            dirs[:] = [d for d in dirs if not _skipped_dir(d)]
+            for name in dirs:
+                self._add(os.path.join(folder, name))
+
+    def read(self, timeout):
+        """Wait up to ``timeout`` seconds for events.
+
+        Returns ``(paths, overflowed)``; after an overflow the caller should
+        rescan, as events were lost.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        paths = []
+        overflowed = False
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            folder = self._dirs.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if not _skipped_dir(name):
+                    try:
+                        self._add_tree(path)
+                    except OSError:
+                        overflowed = True  # let a rescan find what is inside
+                    # Files moved in with the folder raise no events of their own.
+                    paths.extend(p for p, _ in walk_videos(path))
+            elif is_candidate(path):
+                paths.append(path)
+        return paths, overflowed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class StabilityTracker:
+    """Files waiting for their size and mtime to stop changing."""
+
+    def __init__(self, settle=SETTLE_SECONDS, limit=MAX_PENDING):
+        self.settle = settle
+        self.limit = limit
+        # path -> ((size, mtime_ns), unchanged since)
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, path, now):
+        """Start tracking ``path``; returns ``False`` if the table is full."""
+        if path in self._pending:
+            return True
+        if len(self._pending) >= self.limit:
+            return False
+        self._pending[path] = (None, now)
+        return True
+
+    def ready(self, now):
+        """Return ``[(path, (size, mtime_ns))]`` for files that have settled."""
+        settled = []
+        for path, (key, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != key:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self._pending[path]
+                settled.append((path, current))
+        return settled
+
+
+class WatchDaemon:
+    """Feed settled files from ``folder`` to ``engine`` until :meth:`stop`.
+
+    ``convert`` queues an HEVC conversion and ``streams`` the automatic
+    stream selection (both together run in one pass); ``convert_options``
+    are passed to :meth:`TheatreEngine.convert_runner`. With ``commit``
+    each batch is committed as soon as it finishes.
+    """
+
+    def __init__(
+        self,
+        engine,
+        folder,
+        convert=True,
+        streams=False,
+        commit=False,
+        convert_options=None,
+        settle=SETTLE_SECONDS,
+        poll=False,
+        on_progress=None,
+    ):
+        self.engine = engine
+        self.folder = str(folder)
+        self.convert = convert
+        self.streams = streams
+        self.commit = commit
+        self.convert_options = convert_options or {}
+        self.poll = poll
+        self.on_progress = on_progress
+        self.tracker = StabilityTracker(settle)
+        # path -> (size, mtime_ns) after it was handled, oldest first
+        self._handled = collections.OrderedDict()
+        self._stop = threading.Event()
+        self._runner = None
+
+    def stop(self):
+        """Stop watching; a running batch is cancelled and can be resumed."""
+        self._stop.set()
+        runner = self._runner
+        if runner is not None:
+            runner.cancel()
+
+    def _log(self, message, status="info"):
+        self.engine.log_status(status, message=message)
+
+    def _enqueue(self, paths, now):
+        for path in paths:
+            if not self.tracker.add(path, now):
+                # A later rescan picks these up once the backlog drains.
+                self._log(f"Watch: over {MAX_PENDING} files waiting; some are deferred")
+                return
+
+    def run(self):
+        watcher = None
+        if not self.poll:
+            try:
+                watcher = InotifyWatcher(self.folder)
+            except (OSError, AttributeError) as e:
+                self._log(f"Watch: inotify unavailable ({e}); polling every {POLL_SECONDS:.0f}s")
+        snapshot = FolderSnapshot(self.folder)
+        interval = RESCAN_SECONDS if watcher else POLL_SECONDS
+        self._log(f"Watching {self.folder}")
+        next_scan = 0.0
+        ready = []
+        try:
+            while not self._stop.is_set():
+                if watcher is not None:
+                    paths, overflowed = watcher.read(timeout=1.0)
+                    self._enqueue(paths, time.monotonic())
+                    if overflowed:
+                        next_scan = 0.0
+                else:
+                    self._stop.wait(1.0)
+                now = time.monotonic()
+                if now >= next_scan:
+                    self._enqueue(snapshot.scan(), now)
+                    next_scan = now + interval
+                ready.extend(
+                    path
+                    for path, key in self.tracker.ready(now)
+                    if self._handled.get(path) != key
+                )
+                if ready and not self._stop.is_set():
+                    batch, ready = ready[:MAX_BATCH], ready[MAX_BATCH:]
+                    self._process(batch)
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+    def _groups(self, files):
+        """Split ``files`` by their default audio/subtitle choice."""
+        groups = {}
+        for path in files:
+            try:
+                info = self.engine.probe_cache.probe(path)
+            except (OSError, ProbeError) as e:
+                self.engine.log_status("error", input_file=path, message=f"ffprobe failed: {e}")
+                continue
+            _, audio, _, subtitle = stream_choices(info)
+            if not audio:
+                self.engine.log_status("error", input_file=path, message="No audio stream")
+                continue
+            groups.setdefault((audio, subtitle or ""), []).append(path)
+        return groups
+
+    def _runners(self, files):
+        if not self.streams:
+            runner = self.engine.convert_runner(files, **self.convert_options)
+            yield runner, self.engine.record_conversion, "FFmpeg failed during conversion"
+            return
+        for (audio, subtitle), group in self._groups(files).items():
+            if self.convert:
+                runner = self.engine.convert_runner(
+                    group, audio=audio, subtitle=subtitle, **self.convert_options
+                )
+                yield runner, self.engine.record_conversion, "FFmpeg failed during conversion"
+            else:
+                yield (
+                    self.engine.streams_runner(group, audio, subtitle),
+                    functools.partial(
+                        self.engine.record_streams_update, audio=audio, subtitle=subtitle
+                    ),
+                    "FFmpeg failed during stream update",
+                )
+
+    def _process(self, files):
+        self._log(f"Watch: {len(files)} new file(s) ready")
+        for runner, on_result, error_message in self._runners(files):
+            if self._stop.is_set():
+                return
+            if runner is None:
+                continue
+            self._runner = runner
+            try:
+                self.engine.run(runner, on_result, error_message, on_progress=self.on_progress)
+            finally:
+                self._runner = None
+        if self.commit and not self._stop.is_set():
+            self.engine.commit_converted_files()
+        elif not self._stop.is_set():
+            # Outputs wait in converted/ for a commit run. A stopped batch
+            # keeps its journal so it can be resumed.
+            self.engine.forget_uncommitted()
+        self.engine.finish_timings()
+        for path in files:
+            # Remember the state we left the file in, so our own commit is
+            # not taken for a new download.
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self._handled[path] = (stat.st_size, stat.st_mtime_ns)
+            self._handled.move_to_end(path)
+        while len(self._handled) > MAX_HANDLED:
+            self._handled.popitem(last=False)
+        # Entries were already passed to the log callback.
+        self.engine.status_log.clear()